@@ -0,0 +1,131 @@
+"""Large deterministic population of simulated borrowers.
+
+The brownie dev accounts cap the simulation at a few dozen borrowers, and all of them are
+funded upfront. AccountPool derives ACCOUNT_POOL_SIZE addresses from a seed instead, and sends
+their transactions through the dev node's impersonation (anvil/hardhat) so nothing is signed
+locally. An account gets its gas ETH and is impersonated the first time it is indexed, which
+only takes node RPCs, no transaction. Collateral is sent by fund(), once per account and
+collateral, when the account first opens a trove of that collateral. The open phases get a
+funding(token) view of the pool, which funds the accounts it indexes; the agent engine funds
+the opens of an action list before sending it. Reading or iterating the pool sends no collateral.
+
+Index 0 is the deployer, as with the brownie accounts, so the pool can be passed to the
+simulation phases wherever `accounts` was.
+"""
+
+import os
+import threading
+
+from brownie import web3
+from brownie.network.account import Account
+from eth_utils import keccak, to_checksum_address
+
+POOL_SEED = 'liquity-simulation'
+POOL_ETH_BALANCE = 10**21
+
+
+def poolSize():
+    return int(os.environ.get('ACCOUNT_POOL_SIZE', '0'))
+
+
+def poolAddress(seed, i):
+    return to_checksum_address(keccak(text=f'{seed}:{i}')[12:])
+
+
+def _request(methods, params):
+    for method in methods:
+        response = web3.provider.make_request(method, params)
+        if 'error' not in response:
+            return True
+    return False
+
+
+class AccountPool:
+    def __init__(self, deployer, size, coll_amount=0, seed=POOL_SEED):
+        self.deployer = deployer
+        self.size = size
+        self.coll_amount = coll_amount
+        self.seed = seed
+        self._accounts = {}
+        # (account index, token address) already sent `coll_amount`
+        self._funded = set()
+        # collaterals running on several workers may use the same account for the first time together
+        self._lock = threading.Lock()
+        # anvil impersonates every sender in one call; other nodes impersonate per account
+        self.auto_impersonate = _request(['anvil_autoImpersonateAccount'], [True])
+
+    def __len__(self):
+        return self.size + 1
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    # View of the pool for an open phase: the accounts it indexes are funded with `token`
+    def funding(self, token):
+        return FundingAccounts(self, token)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i == 0:
+            return self.deployer
+        if not 0 < i < len(self):
+            raise IndexError(f'account {i} is not in the pool')
+
+        with self._lock:
+            account = self._accounts.get(i)
+            if account is None:
+                account = self._accounts[i] = self._activate(poolAddress(self.seed, i))
+        return account
+
+    def address(self, i):
+        return self.deployer.address if i == 0 else poolAddress(self.seed, i)
+
+    # Sends `coll_amount` of `token` to account i, the first time it opens a trove of that collateral
+    def fund(self, i, token):
+        account = self[i]
+        if i == 0:
+            return account
+        key = (i, str(token.address))
+        with self._lock:
+            if key in self._funded:
+                return account
+            self._funded.add(key)
+        token.transfer(account.address, self.coll_amount, { 'from': self.deployer })
+        return account
+
+    def fundedAccounts(self):
+        return sorted(self._funded)
+
+    # Accounts funded before a checkpoint are not funded twice
+    def markFunded(self, funded):
+        self._funded.update((i, token) for i, token in funded)
+
+    def _activate(self, address):
+        if not self.auto_impersonate:
+            _request(['anvil_impersonateAccount', 'hardhat_impersonateAccount'], [address])
+        _request(['anvil_setBalance', 'hardhat_setBalance', 'evm_setAccountBalance'], [address, hex(POOL_ETH_BALANCE)])
+        return Account(address)
+
+
+class FundingAccounts:
+    """AccountPool.funding(): indexing an account funds it with the collateral of the phase."""
+
+    def __init__(self, pool, token):
+        self.pool = pool
+        self.token = token
+
+    def __len__(self):
+        return len(self.pool)
+
+    def __iter__(self):
+        return iter(self.pool)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.pool.fund(i, self.token)
@@ -0,0 +1,257 @@
+"""Vectorized agent decisions for the close/adjust/open/stability phases.
+
+AgentEngine draws the decisions of the whole population for one step in a single NumPy pass
+from its own seeded generator, with the distributions of the simulation helpers: new troves
+get a gamma collateral, a target CR of a + b * chi-square and a gamma rational-inattention
+tau; an active trove whose ICR drifts more than tau away from its target readjusts its debt
+back to the target; a share of the troves close every step; new troves put a share of their
+LUSD in the stability pool and closing troves take their deposit back. Target CRs, taus and
+deposits are kept in an agent_store.AgentStore.
+
+Like stability_update, the stability pool decisions follow the pool's return of the step
+(calculate_stability_return), weighed against selling the LUSD at its market price: the
+share deposited grows by AGENT_SP_SENSITIVITY times the return in excess of the LUSD premium
+(price_LUSD - 1), and when that excess is negative the remaining depositors withdraw that
+multiple of it from their deposits. The rates are env knobs: AGENT_OPEN_RATE (troves opened per
+step, Poisson mean), AGENT_CLOSE_RATE (share of the troves closing per step), AGENT_SP_SHARE and
+AGENT_SP_SENSITIVITY.
+
+The decisions of a step come as a dict of arrays (see decide()), which ShadowSimulation
+applies directly, with apply() writing their targets and deposits to the store. actionList()
+turns them into the ordered list of Actions that executeActions() sends on chain, one
+transaction at a time, or sendActions() pipelined (TX_PIPELINE=1) and applyReceipts() once
+they are mined. On chain the store only changes for the actions that went through.
+
+AGENT_ENGINE=vectorized makes test_run_simulation use the engine instead of close_troves,
+adjust_troves, open_troves and stability_update.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+from brownie.exceptions import VirtualMachineError
+
+from agent_store import AgentStore
+from helpers import ZERO_ADDRESS, floatToWei
+from hints import withHints, recordHints, openTroveCall
+
+OPEN = 'open'
+ADJUST = 'adjust'
+CLOSE = 'close'
+SP = 'sp'
+
+# `coll`/`debt` are the amounts of an open, the changes of an adjust, and `debt` the LUSD
+# deposited (negative: withdrawn) of an sp action; `target_cr`/`tau` those drawn for an open
+Action = namedtuple('Action', ['kind', 'agent', 'coll', 'debt', 'target_cr', 'tau'], defaults=[0.0, 0.0])
+
+
+def agentEngineEnabled():
+    return os.environ.get('AGENT_ENGINE', 'helpers') == 'vectorized'
+
+
+def agentOpenRate():
+    return float(os.environ.get('AGENT_OPEN_RATE', '2'))
+
+
+def agentCloseRate():
+    return float(os.environ.get('AGENT_CLOSE_RATE', '0.01'))
+
+
+def agentSPShare():
+    return float(os.environ.get('AGENT_SP_SHARE', '0.1'))
+
+
+def agentSPSensitivity():
+    return float(os.environ.get('AGENT_SP_SENSITIVITY', '5'))
+
+
+class AgentEngine:
+    def __init__(self, n_agents, target_cr_a, target_cr_b, target_cr_df, tau_k, tau_theta, coll_k, coll_theta,
+            open_rate, close_rate, sp_share=0.0, coll_scale=1.0, seed=0, agents=None, sp_sensitivity=0.0):
+        self.target_cr_a = target_cr_a
+        self.target_cr_b = target_cr_b
+        self.target_cr_df = target_cr_df
+        self.tau_k = tau_k
+        self.tau_theta = tau_theta
+        self.coll_k = coll_k
+        self.coll_theta = coll_theta
+        self.open_rate = open_rate
+        self.close_rate = close_rate
+        self.sp_share = sp_share
+        self.sp_sensitivity = sp_sensitivity
+        self.coll_scale = coll_scale
+        self.rng = np.random.default_rng(seed)
+        self.agents = AgentStore(n_agents) if agents is None else agents
+
+    def decide(self, coll, debt, active, price, lusd_gas_compensation, return_stability=0.0, price_LUSD=1.0, rng=None):
+        """
+        Decisions of one step given the coll, debt and status arrays of all agents, the stability
+        pool return of the step and the LUSD price. Returns a dict with 'close' (agents), 'adjust'
+        (agents, coll changes, debt changes), 'open' (agents, colls, LUSD drawn), 'targets'
+        (opening agents, target CRs, taus) and 'sp' (agents, LUSD deposited, negative to withdraw).
+        The store is not changed, see apply(). Agents without a target CR (the whales) are left
+        alone.
+        """
+        rng = self.rng if rng is None else rng
+        target, tau, sp_deposit = self.agents.target_cr, self.agents.tau, self.agents.sp_deposit
+        actions = {}
+
+        managed = np.flatnonzero(active & (target > 0))
+        close = managed[rng.random(len(managed)) < self.close_rate]
+        actions['close'] = close
+
+        remaining = np.setdiff1d(managed, close)
+        icr = coll[remaining] * price / debt[remaining]
+        drifted = remaining[np.abs(icr / target[remaining] - 1) > tau[remaining]]
+        new_debt = coll[drifted] * price / target[drifted]
+        actions['adjust'] = (drifted, np.zeros(len(drifted)), new_debt - debt[drifted])
+
+        inactive = np.flatnonzero(~active)
+        n_open = min(rng.poisson(self.open_rate), len(inactive))
+        opening = rng.choice(inactive, n_open, replace=False)
+        open_target = self.target_cr_a + self.target_cr_b * rng.chisquare(self.target_cr_df, n_open)
+        open_tau = rng.gamma(self.tau_k, self.tau_theta, n_open)
+        open_coll = rng.gamma(self.coll_k, self.coll_theta, n_open) * self.coll_scale
+        open_debt = np.maximum(open_coll * price / open_target - lusd_gas_compensation, 0)
+        actions['open'] = (opening, open_coll, open_debt)
+        actions['targets'] = (opening, open_target, open_tau)
+
+        # the pool's return over selling the LUSD at its premium
+        excess_return = return_stability - (price_LUSD - 1)
+        withdrawing = close[sp_deposit[close] > 0]
+        staying = np.setdiff1d(np.flatnonzero(sp_deposit > 0), withdrawing)
+        withdrawn_share = min(max(-self.sp_sensitivity * excess_return, 0.0), 1.0)
+        if withdrawn_share == 0:
+            staying = staying[:0]
+        deposit = open_debt * min(self.sp_share * max(1 + self.sp_sensitivity * excess_return, 0.0), 1.0)
+        actions['sp'] = (np.concatenate([withdrawing, staying, opening]),
+            np.concatenate([-sp_deposit[withdrawing], -withdrawn_share * sp_deposit[staying], deposit]))
+
+        return actions
+
+    # Writes the targets, taus and deposits of a step whose decisions are all carried out
+    def apply(self, actions):
+        opening, open_target, open_tau = actions['targets']
+        self.agents.target_cr[opening] = open_target
+        self.agents.tau[opening] = open_tau
+        sp_agents, sp_amounts = actions['sp']
+        np.add.at(self.agents.sp_deposit, sp_agents, sp_amounts)
+
+
+# Orders the decisions of a step as they are sent: SP withdrawals (to repay with), closes, adjusts, opens, SP deposits
+def actionList(actions):
+    sp_agents, sp_amounts = actions.get('sp', ([], []))
+    action_list = [Action(SP, int(i), 0.0, float(amount)) for i, amount in zip(sp_agents, sp_amounts) if amount < 0]
+    action_list += [Action(CLOSE, int(i), 0.0, 0.0) for i in actions.get('close', [])]
+    action_list += [Action(ADJUST, int(i), float(c), float(d)) for i, c, d in zip(*actions.get('adjust', ([], [], [])))]
+    opening, open_coll, open_debt = actions.get('open', ([], [], []))
+    _, open_target, open_tau = actions.get('targets', (opening, np.zeros(len(opening)), np.zeros(len(opening))))
+    action_list += [Action(OPEN, int(i), float(c), float(d), float(target_cr), float(tau))
+        for i, c, d, target_cr, tau in zip(opening, open_coll, open_debt, open_target, open_tau)]
+    action_list += [Action(SP, int(i), 0.0, float(amount)) for i, amount in zip(sp_agents, sp_amounts) if amount > 0]
+    return action_list
+
+
+# An action on its way: the transaction that decides it, and the gas estimated without hints (None without report)
+SentAction = namedtuple('SentAction', ['action', 'fn', 'tx', 'gas_without_hints'])
+
+
+def executeActions(action_list, contracts, accounts, coll, debt, trove_index, max_fee, coll_decimals=1e18, report=None, agents=None):
+    """
+    Sends the actions on chain. `coll`/`debt` are the entire coll and debt of every agent before
+    the step, used for the insertion hints. Reverted actions are reported and skipped, the others
+    move the agent between active and inactive in `agents`. Returns the coll added and the LUSD
+    issued, like the helper phases.
+    """
+    coll_added = 0
+    issuance_LUSD = 0
+    for action in action_list:
+        try:
+            sent = _sendAction(action, contracts, accounts, coll, debt, trove_index, max_fee, coll_decimals, report,
+                lambda agent, fn, *args: fn(*args))
+        except VirtualMachineError as e:
+            print(f'{action.kind} of agent {action.agent} reverted: {e}')
+            continue
+        added, issued = _applyAction(sent, trove_index, report, agents)
+        coll_added += added
+        issuance_LUSD += issued
+
+    return [coll_added, issuance_LUSD]
+
+
+def sendActions(action_list, pipeline, contracts, accounts, coll, debt, trove_index, max_fee, coll_decimals=1e18):
+    """
+    executeActions through a pipeline.TxPipeline: every transaction is sent without waiting,
+    attributed to its agent, and the hints all come from the index as it was before the step
+    (SortedTroves searches from them when other transactions of the block moved the neighbours).
+    Once the pipeline is mined, applyReceipts() applies the actions that went through and
+    records their gas in its report. The gas without hints is not estimated: the estimate would run
+    against a state without the transactions sent before, e.g. the approve of an open.
+    """
+    send = pipeline.send
+    return [_sendAction(action, contracts, accounts, coll, debt, trove_index, max_fee, coll_decimals, None, send)
+        for action in action_list]
+
+
+def applyReceipts(sent_actions, trove_index, report=None, agents=None):
+    coll_added = 0
+    issuance_LUSD = 0
+    for sent in sent_actions:
+        if sent.tx.status == 0:
+            print(f'{sent.action.kind} of agent {sent.action.agent} reverted: {sent.tx.revert_msg}')
+            continue
+        added, issued = _applyAction(sent, trove_index, report, agents)
+        coll_added += added
+        issuance_LUSD += issued
+
+    return [coll_added, issuance_LUSD]
+
+
+def _sendAction(action, contracts, accounts, coll, debt, trove_index, max_fee, coll_decimals, report, send):
+    account = accounts[action.agent]
+    tx_params = { 'from': account }
+    gas_without_hints = None
+    if action.kind == CLOSE:
+        fn, args = contracts.borrowerOperations.closeTrove, []
+    elif action.kind == ADJUST and action.debt > 0:
+        fn = contracts.borrowerOperations.withdrawLUSD
+        lusd_amount = floatToWei(action.debt)
+        new_debt = floatToWei(debt[action.agent]) + lusd_amount + contracts.troveManager.getBorrowingFee(lusd_amount)
+        args, gas_without_hints = withHints(trove_index, fn, [max_fee, lusd_amount],
+            floatToWei(coll[action.agent], coll_decimals), new_debt, tx_params, report)
+    elif action.kind == ADJUST and action.debt < 0:
+        fn = contracts.borrowerOperations.repayLUSD
+        args, gas_without_hints = withHints(trove_index, fn, [floatToWei(-action.debt)],
+            floatToWei(coll[action.agent], coll_decimals), floatToWei(debt[action.agent] + action.debt), tx_params, report)
+    elif action.kind == OPEN:
+        coll_amount = floatToWei(action.coll, coll_decimals)
+        send(action.agent, contracts.coll.approve, contracts.borrowerOperations.address, coll_amount, tx_params)
+        fn, args, new_coll, new_debt = openTroveCall(contracts, max_fee, floatToWei(action.debt), coll_amount)
+        args, gas_without_hints = withHints(trove_index, fn, args, new_coll, new_debt, tx_params, report)
+    elif action.kind == SP and action.debt > 0:
+        fn, args = contracts.stabilityPool.provideToSP, [floatToWei(action.debt), ZERO_ADDRESS]
+    else:
+        fn, args = contracts.stabilityPool.withdrawFromSP, [floatToWei(-action.debt)]
+    return SentAction(action, fn, send(action.agent, fn, *args, tx_params), gas_without_hints)
+
+
+# Index and agent updates of an action whose transaction went through; returns the coll added and the LUSD issued
+def _applyAction(sent, trove_index, report, agents):
+    action = sent.action
+    owner = sent.tx.sender
+    if action.kind == CLOSE:
+        trove_index.remove(owner)
+        if agents is not None:
+            agents.deactivate(action.agent)
+    elif action.kind == ADJUST:
+        recordHints(trove_index, sent.fn, sent.tx, sent.gas_without_hints, owner, report)
+        return [0, max(action.debt, 0)]
+    elif action.kind == OPEN:
+        recordHints(trove_index, sent.fn, sent.tx, sent.gas_without_hints, owner, report)
+        if agents is not None:
+            agents.activate(action.agent, action.coll, action.debt, action.target_cr, action.tau)
+        return [action.coll, action.debt]
+    elif agents is not None:
+        agents.sp_deposit[action.agent] = max(agents.sp_deposit[action.agent] + action.debt, 0)
+    return [0, 0]
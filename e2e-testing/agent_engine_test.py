@@ -0,0 +1,49 @@
+import numpy as np
+
+from agent_engine import *
+
+N_AGENTS = 100
+
+
+def newEngine(seed):
+    return AgentEngine(N_AGENTS, 2, 5, 1.5, 2, 10, 2, 5, 3, 0.05, 0.1, seed=seed, sp_sensitivity=5)
+
+
+def population():
+    coll = np.zeros(N_AGENTS)
+    debt = np.zeros(N_AGENTS)
+    active = np.zeros(N_AGENTS, dtype=bool)
+    coll[:20] = 10
+    debt[:20] = np.linspace(2000, 12000, 20)
+    active[:20] = True
+    return coll, debt, active
+
+
+def decisions(engine, steps):
+    coll, debt, active = population()
+    return [engine.decide(coll, debt, active, 2000, 200, 0.01, 1.02) for _ in range(steps)]
+
+
+def assertSameActions(a, b):
+    assert a.keys() == b.keys()
+    for kind in a:
+        for x, y in zip(a[kind], b[kind]):
+            assert np.array_equal(x, y)
+
+
+def test_decide_is_reproducible():
+    for a, b in zip(decisions(newEngine([7, 1]), 5), decisions(newEngine([7, 1]), 5)):
+        assertSameActions(a, b)
+
+
+def test_decide_depends_on_seed():
+    a = decisions(newEngine([7, 1]), 1)[0]
+    b = decisions(newEngine([7, 2]), 1)[0]
+    assert not all(np.array_equal(x, y) for kind in a for x, y in zip(a[kind], b[kind]))
+
+
+def test_decide_does_not_change_the_store():
+    engine = newEngine([7, 1])
+    decisions(engine, 3)
+    assert len(engine.agents.active) == 0
+    assert not engine.agents.sp_deposit.any()
@@ -0,0 +1,193 @@
+"""Array-backed state of the simulated agents of one collateral.
+
+AgentStore keeps the per-agent fields in contiguous NumPy arrays indexed by account index,
+and the active and inactive agents in two IndexSets. An IndexSet is a dense array of members
+plus the position of every agent in it; removing a member moves the last member into its
+slot (the swap-and-pop of AnyTokenVaultManager._removeVaultOwner), so moving an agent between
+active and inactive is O(1) whatever the number of agents.
+
+The helper phases of simulation_helpers work on `active_accounts` (dicts with 'index',
+'CR_initial' and 'Rational_inattention') and `inactive_accounts` (account indices).
+activeAccounts() and `inactive` implement the list operations they use on top of the store,
+so they can be passed where the lists were.
+"""
+
+import numpy as np
+
+INACTIVE = 0
+ACTIVE = 1
+
+
+class IndexSet:
+    def __init__(self, capacity, members=()):
+        self._items = np.zeros(capacity, dtype=np.int64)
+        self._position = np.full(capacity, -1, dtype=np.int64)
+        self._size = 0
+        for i in members:
+            self.add(i)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, i):
+        return self._position[i] >= 0
+
+    def __iter__(self):
+        return iter(self._items[:self._size].tolist())
+
+    def __getitem__(self, k):
+        return int(self._items[:self._size][k])
+
+    def add(self, i):
+        if self._position[i] >= 0:
+            return
+        self._items[self._size] = i
+        self._position[i] = self._size
+        self._size += 1
+
+    def discard(self, i):
+        position = self._position[i]
+        if position < 0:
+            return
+        last = self._items[self._size - 1]
+        self._items[position] = last
+        self._position[last] = position
+        self._position[i] = -1
+        self._size -= 1
+
+    def array(self):
+        return self._items[:self._size].copy()
+
+    # list operations used by the helper phases
+    def append(self, i):
+        self.add(i)
+
+    def remove(self, i):
+        if i not in self:
+            raise ValueError(f'{i} is not in the set')
+        self.discard(i)
+
+    def pop(self, k=-1):
+        i = self[k]
+        self.discard(i)
+        return i
+
+
+class AgentStore:
+    def __init__(self, n_agents, first_agent=0):
+        self.coll = np.zeros(n_agents)
+        self.debt = np.zeros(n_agents)
+        self.target_cr = np.zeros(n_agents)
+        self.tau = np.zeros(n_agents)
+        self.sp_deposit = np.zeros(n_agents)
+        self.status = np.zeros(n_agents, dtype=np.int8)
+        self.active = IndexSet(n_agents)
+        self.inactive = IndexSet(n_agents, range(first_agent, n_agents))
+
+    def __len__(self):
+        return len(self.status)
+
+    def activate(self, i, coll=0.0, debt=0.0, target_cr=None, tau=None):
+        self.inactive.discard(i)
+        self.active.add(i)
+        self.status[i] = ACTIVE
+        self.coll[i] = coll
+        self.debt[i] = debt
+        if target_cr is not None:
+            self.target_cr[i] = target_cr
+        if tau is not None:
+            self.tau[i] = tau
+
+    def deactivate(self, i):
+        self.active.discard(i)
+        self.inactive.add(i)
+        self.status[i] = INACTIVE
+        self.coll[i] = 0
+        self.debt[i] = 0
+
+    def activeMask(self):
+        return self.status == ACTIVE
+
+    def activeAccounts(self):
+        return ActiveAccounts(self)
+
+
+class AgentRecord:
+    """One active agent, read and written as the dicts of the helper phases."""
+
+    __slots__ = ('store', 'index')
+
+    FIELDS = {'CR_initial': 'target_cr', 'Rational_inattention': 'tau'}
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'index':
+            return self.index
+        return float(getattr(self.store, self.FIELDS[key])[self.index])
+
+    def __setitem__(self, key, value):
+        getattr(self.store, self.FIELDS[key])[self.index] = value
+
+    def get(self, key, default=None):
+        if key != 'index' and key not in self.FIELDS:
+            return default
+        return self[key]
+
+    def __eq__(self, other):
+        index = other['index'] if isinstance(other, (dict, AgentRecord)) else other
+        return self.index == index
+
+    def __hash__(self):
+        return hash(self.index)
+
+
+class ActiveAccounts:
+    """
+    The active agents of a store with the list operations of `active_accounts`. Like the list,
+    append/remove only change the active agents; the helpers update `inactive` themselves.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store.active)
+
+    def __iter__(self):
+        return (AgentRecord(self.store, i) for i in self.store.active)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [AgentRecord(self.store, i) for i in self.store.active.array()[k]]
+        return AgentRecord(self.store, self.store.active[k])
+
+    def __delitem__(self, k):
+        self._remove(self.store.active[k])
+
+    def __contains__(self, account):
+        return account['index'] in self.store.active
+
+    def append(self, account):
+        i = account['index']
+        self.store.active.add(i)
+        self.store.status[i] = ACTIVE
+        self.store.target_cr[i] = account.get('CR_initial', 0)
+        self.store.tau[i] = account.get('Rational_inattention', 0)
+
+    def remove(self, account):
+        i = account['index']
+        if i not in self.store.active:
+            raise ValueError(f'agent {i} is not active')
+        self._remove(i)
+
+    def pop(self, k=-1):
+        record = self[k]
+        self._remove(record.index)
+        return record
+
+    def _remove(self, i):
+        self.store.active.discard(i)
+        self.store.status[i] = INACTIVE
@@ -0,0 +1,70 @@
+import pytest
+
+from agent_store import *
+
+
+def test_index_set_swap_and_pop():
+    members = IndexSet(10, [3, 5, 7, 9])
+
+    # the last member moves into the slot of the removed one
+    members.discard(5)
+    assert list(members) == [3, 9, 7]
+    assert 5 not in members
+    assert members[1] == 9
+
+    members.discard(9)
+    assert list(members) == [3, 7]
+    members.add(5)
+    assert list(members) == [3, 7, 5]
+
+    # removing a member that is not in the set
+    members.discard(9)
+    assert len(members) == 3
+    with pytest.raises(ValueError):
+        members.remove(9)
+
+    assert members.pop() == 5
+    assert members.pop(0) == 3
+    assert list(members) == [7]
+
+
+def test_index_set_add_is_idempotent():
+    members = IndexSet(4, [1, 1, 2])
+    assert list(members) == [1, 2]
+    assert members.array().tolist() == [1, 2]
+
+
+def test_store_moves_agents_between_sets():
+    store = AgentStore(6, first_agent=1)
+    assert list(store.inactive) == [1, 2, 3, 4, 5]
+
+    store.activate(2, coll=10.0, debt=2000.0, target_cr=1.8, tau=0.1)
+    store.activate(4, coll=5.0, debt=1000.0)
+    assert list(store.active) == [2, 4]
+    assert list(store.inactive) == [1, 5, 3]
+    assert store.activeMask().tolist() == [False, False, True, False, True, False]
+
+    store.deactivate(2)
+    assert list(store.active) == [4]
+    assert 2 in store.inactive
+    assert store.coll[2] == 0 and store.debt[2] == 0
+    # the target CR is kept for the next trove of the agent
+    assert store.target_cr[2] == 1.8
+
+
+def test_active_accounts_as_helper_list():
+    store = AgentStore(4)
+    active_accounts = store.activeAccounts()
+    active_accounts.append({'index': 1, 'CR_initial': 2.0, 'Rational_inattention': 0.2})
+    active_accounts.append({'index': 3, 'CR_initial': 1.5, 'Rational_inattention': 0.1})
+
+    assert len(active_accounts) == 2
+    assert active_accounts[0]['CR_initial'] == 2.0
+    assert {'index': 3} in active_accounts
+
+    active_accounts[1]['CR_initial'] = 1.6
+    assert store.target_cr[3] == 1.6
+
+    active_accounts.remove({'index': 1})
+    assert [account['index'] for account in active_accounts] == [3]
+    assert store.status[1] == INACTIVE
@@ -0,0 +1,573 @@
+"""Two-chain simulation of the anyToken path of cross-chain-liquidity.
+
+Two local dev nodes stand for the source and the destination chain. Users send LUSD to the
+bridge on the source chain, and a stand-in relayer picks up those deposits with one eth_getLogs
+per poll and pays them out on the destination chain. While its LUSD liquidity lasts it sends
+native LUSD. Once the liquidity runs out it mints anyToken instead, and the user deposits it
+through AnyTokenVaultOperations (openVault, or withdrawLUSD on an open vault) to mint native LUSD.
+
+    python tests/bridge_simulator.py --transfers 1000 --rate 20 --liquidity 200000 --destination-block-time 2
+
+Brownie connects to one network at a time, so the simulator talks to both nodes with web3 and
+deploys the contracts from the brownie build artifacts (run `brownie compile` first, with the
+cross-chain-liquidity contracts in the project). The nodes are started with --node-cmd (anvil
+flags) on --port and --port + 1. Account 0 is the relayer on both chains and the dev accounts
+after it are the users.
+
+The relayer liquidity is minted through its own vault at setup. Its debt is added to
+debtCeilingPlus, so the users have ANYTOKEN_DEBT_CEILING + --debt-ceiling-plus to themselves,
+and utilization is reported against that part of getDebtCeiling. The report gives, per path
+(liquidity or vault), the end-to-end latency from the source transfer to the native LUSD on the
+destination, the delivered throughput, the peak relayer backlog and the vault utilization.
+Transfers the vault rejects (debt ceiling, MIN_SWAP_NET_DEBT) stay in anyToken and are counted
+as stuck. Every transfer is written to --output.
+
+With --verify-every K the vault deposits the destination chain accepts are mirrored in a
+vault_model.VaultModel, which must accept them too. Every K deposits the vault of the depositing
+user is compared with the chain, and at the end every vault and the pool totals are. Rejected
+deposits are not compared: concurrent users can land on chain in another order than in the model.
+Any divergence is reported and fails the run.
+
+An unexpected exception in the watcher, user or relayer threads stops the run and is raised
+again, and so is a run whose transfers are still pending DRAIN_TIMEOUT seconds after the last
+one was sent.
+"""
+
+import argparse
+import csv
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from eth_utils import keccak
+from web3 import Web3
+from web3.exceptions import ContractLogicError, TimeExhausted
+
+from vault_model import VaultModel, ModelRevert
+
+DECIMAL_PRECISION = 10**18
+MAX_UINT = 2**256 - 1
+TOKEN_SUPPLY = 10**40
+# Ether per dev account of the nodes
+NODE_BALANCE = 10**6
+NODE_START_TIMEOUT = 30
+RECEIPT_TIMEOUT = 300
+RECEIPT_POLL = 0.05
+# seconds the transfers in flight get to finish once the last one is sent
+DRAIN_TIMEOUT = 600
+LATENCY_QUANTILES = [0.5, 0.9, 0.99]
+
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+
+# Transfer.status
+PENDING = 'pending'
+DELIVERED = 'delivered'
+CEILING = 'ceiling'
+MINIMUM = 'minimum'
+FAILED = 'failed'
+
+# Errors of a transfer that fails on either chain; the run goes on without it
+TRANSFER_ERRORS = (ContractLogicError, ValueError, RuntimeError, TimeExhausted)
+
+# Transfer.path
+LIQUIDITY = 'liquidity'
+VAULT = 'vault'
+
+
+class Contracts: pass
+
+
+# Brownie-style getters of a web3 contract, `getters.name(*args)` for `contract.functions.name(*args).call()`
+class Getters:
+    def __init__(self, contract):
+        self.contract = contract
+
+    def __getattr__(self, name):
+        return lambda *args: getattr(self.contract.functions, name)(*args).call()
+
+
+def startNode(node_cmd, port, n_accounts, block_time):
+    cmd = shlex.split(node_cmd) + ['--port', str(port), '--accounts', str(n_accounts), '--balance', str(NODE_BALANCE)]
+    if block_time > 0:
+        # anvil takes whole seconds
+        cmd += ['--block-time', str(int(block_time))]
+    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    w3 = Web3(Web3.HTTPProvider(f'http://127.0.0.1:{port}'))
+
+    deadline = time.time() + NODE_START_TIMEOUT
+    while True:
+        try:
+            w3.eth.block_number
+            return process, w3
+        except requests.exceptions.ConnectionError:
+            if process.poll() is not None or time.time() > deadline:
+                process.terminate()
+                raise RuntimeError(f'{node_cmd} did not start on port {port}')
+            time.sleep(0.2)
+
+
+def findArtifact(build_dir, name):
+    for root, _, files in os.walk(build_dir):
+        if f'{name}.json' in files:
+            with open(os.path.join(root, f'{name}.json')) as f:
+                return json.load(f)
+    raise ValueError(f'No build artifact for {name} in {build_dir}')
+
+
+class Chain:
+    def __init__(self, w3, build_dir):
+        self.w3 = w3
+        self.build_dir = build_dir
+        self.accounts = w3.eth.accounts
+
+    def deploy(self, name, *args, sender):
+        artifact = findArtifact(self.build_dir, name)
+        container = self.w3.eth.contract(abi=artifact['abi'], bytecode=artifact['bytecode'])
+        receipt = self.wait(container.constructor(*args).transact({ 'from': sender }))
+        return self.w3.eth.contract(address=receipt.contractAddress, abi=artifact['abi'])
+
+    def wait(self, tx_hash):
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=RECEIPT_TIMEOUT, poll_latency=RECEIPT_POLL)
+        if receipt.status != 1:
+            raise RuntimeError(f'Transaction {tx_hash.hex()} reverted')
+        return receipt
+
+    def send(self, fn, sender):
+        return self.wait(fn.transact({ 'from': sender }))
+
+
+def setupSourceContracts(chain, users):
+    contracts = Contracts()
+    contracts.lusdToken = chain.deploy('ERC20Mock', 'LUSD', 'LUSD', 18, chain.accounts[0], TOKEN_SUPPLY, sender=chain.accounts[0])
+    for user in users:
+        chain.send(contracts.lusdToken.functions.transfer(user, TOKEN_SUPPLY // (2 * len(users))), chain.accounts[0])
+    return contracts
+
+
+# The vault stack of vault_setup.setupVaultContracts, with the anyToken supply held by the relayer
+def setupDestinationContracts(chain, users):
+    relayer = chain.accounts[0]
+    contracts = Contracts()
+    contracts.lusdToken = chain.deploy('LUSDToken', sender=relayer)
+    contracts.anyToken = chain.deploy('ERC20Mock', 'AnyToken', 'ANY', 18, relayer, TOKEN_SUPPLY, sender=relayer)
+    contracts.vaultManager = chain.deploy('AnyTokenVaultManager', sender=relayer)
+    contracts.vaultOperations = chain.deploy('AnyTokenVaultOperations', sender=relayer)
+    contracts.activePool = chain.deploy('AnyTokenActivePool', sender=relayer)
+
+    addresses = [contracts.lusdToken.address, contracts.anyToken.address, 1] # _collDecimalDiff
+    chain.send(contracts.vaultManager.functions.setAddresses(contracts.vaultOperations.address, contracts.activePool.address, *addresses), relayer)
+    chain.send(contracts.vaultOperations.functions.setAddresses(contracts.vaultManager.address, contracts.activePool.address, *addresses), relayer)
+    chain.send(contracts.activePool.functions.setAddresses(contracts.vaultOperations.address, contracts.vaultManager.address, contracts.anyToken.address), relayer)
+    chain.send(contracts.vaultOperations.functions.setBorrowingFeeTreasury(relayer), relayer)
+    chain.send(contracts.lusdToken.functions.unlockFunction(0), relayer)
+    chain.send(contracts.lusdToken.functions.addAddressesForColl(contracts.vaultManager.address, contracts.activePool.address, contracts.vaultOperations.address), relayer)
+
+    for account in [relayer] + users:
+        chain.send(contracts.anyToken.functions.approve(contracts.vaultOperations.address, MAX_UINT), account)
+    return contracts
+
+
+# Mints the relayer liquidity through its own vault and sets debtCeilingPlus; returns the debt of that vault
+def seedLiquidity(chain, contracts, liquidity, debt_ceiling_plus):
+    relayer = chain.accounts[0]
+    manager = contracts.vaultManager.functions
+    seed_debt = liquidity + manager.getBorrowingFee(liquidity).call() if liquidity > 0 else 0
+    # debtCeilingPlus can only be set once
+    chain.send(manager.setDebtCeilingPlus(seed_debt + debt_ceiling_plus), relayer)
+    if liquidity > 0:
+        chain.send(contracts.vaultOperations.functions.openVault(liquidity), relayer)
+    return seed_debt
+
+
+class Transfer:
+    __slots__ = ('id', 'user', 'amount', 'received', 'sent', 'deposited', 'bridged', 'delivered', 'path', 'status', 'reason')
+
+    def __init__(self, id, user, amount):
+        self.id = id
+        self.user = user
+        self.amount = amount
+        self.received = 0
+        self.sent = None
+        self.deposited = None
+        self.bridged = None
+        self.delivered = None
+        self.path = None
+        self.status = PENDING
+        self.reason = ''
+
+    def latency(self):
+        return self.delivered - self.sent
+
+
+class BridgeSimulator:
+    def __init__(self, source, destination, source_contracts, destination_contracts, users, liquidity, relayer_workers, poll_interval, verify_every=0):
+        self.source = source
+        self.destination = destination
+        self.source_contracts = source_contracts
+        self.destination_contracts = destination_contracts
+        self.relayer = destination.accounts[0]
+        # deposit address of the bridge on the source chain
+        self.router = source.accounts[0]
+        self.liquidity = liquidity
+        self.relayer_workers = relayer_workers
+        self.poll_interval = poll_interval
+
+        manager = destination_contracts.vaultManager.functions
+        self.ratio = manager.ANYTOKEN_COLLATERAL_RARIO().call()
+        self.coll_decimal_diff = 1
+
+        self.lock = threading.Lock()
+        self.user_locks = {user: threading.Lock() for user in users}
+        self.open_vaults = set()
+        # source tx hash -> Transfer, until the relayer sees its log
+        self.deposits = {}
+        self.unmatched = []
+        self.backlog = 0
+        self.max_backlog = 0
+        self.finished = 0
+        self.n_transfers = 0
+        self.done = threading.Event()
+        # first unexpected exception of a simulator thread
+        self.error = None
+        self.start = None
+        # (seconds since start, vault LUSD debt)
+        self.utilization = []
+
+        # the destination vaults mirrored in a VaultModel, the relayer vault of seedLiquidity included
+        self.verify_every = verify_every
+        self.model = None
+        self.model_deposits = 0
+        self.model_checks = 0
+        self.divergences = []
+        if verify_every > 0:
+            self.model = VaultModel.fromContract(Getters(destination_contracts.vaultManager), self.coll_decimal_diff)
+            if liquidity > 0:
+                self.model.mintColl(self.relayer, self.model.getAnyTokenAmount(liquidity))
+                self.model.openVault(self.relayer, liquidity)
+
+    # LUSD minted for `coll_amount` anyToken, the inverse of getAnyTokenAmount rounded down to collDecimalDiff
+    def lusdForAnyToken(self, coll_amount):
+        lusd_amount = coll_amount * self.coll_decimal_diff * DECIMAL_PRECISION // self.ratio
+        return lusd_amount // self.coll_decimal_diff * self.coll_decimal_diff
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    def run(self, transfers, arrivals):
+        self.n_transfers = len(transfers)
+        if not transfers:
+            self.done.set()
+        self.start = time.perf_counter()
+        watcher = threading.Thread(target=self.guarded, args=(self.watch,), daemon=True)
+        with ThreadPoolExecutor(max_workers=len(self.user_locks)) as users, ThreadPoolExecutor(max_workers=self.relayer_workers) as relayer:
+            self.relayer_pool = relayer
+            watcher.start()
+            for transfer, arrival in zip(transfers, arrivals):
+                delay = arrival - self.now()
+                # woken early when a thread failed
+                if self.done.wait(max(delay, 0)):
+                    break
+                users.submit(self.guarded, self.deposit, transfer)
+            drained = self.done.wait(DRAIN_TIMEOUT)
+            if not drained or self.error is not None:
+                # stops the watcher and drops the transfers not started yet
+                self.done.set()
+                users.shutdown(wait=False, cancel_futures=True)
+                relayer.shutdown(wait=False, cancel_futures=True)
+        watcher.join()
+        if self.error is not None:
+            raise self.error
+        if not drained:
+            raise RuntimeError(f'{self.n_transfers - self.finished} transfers still pending {DRAIN_TIMEOUT}s after the last one was sent')
+        self.sampleUtilization()
+
+    # Runs fn(*args) on a simulator thread; an exception it does not handle stops the run, and run() raises it
+    def guarded(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as error:
+            with self.lock:
+                # once the run is over, e.g. a relayer submit after run() shut the pool down, errors are moot
+                if self.error is None and not self.done.is_set():
+                    self.error = error
+            raise
+        finally:
+            if self.error is not None:
+                self.done.set()
+
+    # User side on the source chain
+    def deposit(self, transfer):
+        lusd_token = self.source_contracts.lusdToken.functions
+        transfer.sent = self.now()
+        try:
+            tx_hash = lusd_token.transfer(self.router, transfer.amount).transact({ 'from': transfer.user })
+            with self.lock:
+                self.deposits[bytes(tx_hash)] = transfer
+            self.source.wait(tx_hash)
+        except TRANSFER_ERRORS as error:
+            with self.lock:
+                for key in [key for key, pending in self.deposits.items() if pending is transfer]:
+                    del self.deposits[key]
+            self.finish(transfer, FAILED, str(error))
+            return
+        transfer.deposited = self.now()
+
+    # Relayer loop: one eth_getLogs per poll for the deposits to the router
+    def watch(self):
+        router_topic = '0x' + '0' * 24 + self.router[2:].lower()
+        next_block = self.source.w3.eth.block_number + 1
+        while not self.done.is_set():
+            latest = self.source.w3.eth.block_number
+            if latest >= next_block:
+                self.unmatched += self.source.w3.eth.get_logs({
+                    'address': self.source_contracts.lusdToken.address,
+                    'fromBlock': next_block,
+                    'toBlock': latest,
+                    'topics': [TRANSFER_TOPIC, None, router_topic],
+                })
+                next_block = latest + 1
+
+            # a log can show up before the user thread registered its tx hash; it is matched on a later poll
+            unmatched = []
+            for log in self.unmatched:
+                with self.lock:
+                    transfer = self.deposits.pop(bytes(log['transactionHash']), None)
+                    if transfer is not None:
+                        self.backlog += 1
+                        self.max_backlog = max(self.max_backlog, self.backlog)
+                if transfer is None:
+                    unmatched.append(log)
+                else:
+                    self.relayer_pool.submit(self.guarded, self.deliver, transfer)
+            self.unmatched = unmatched
+            time.sleep(self.poll_interval)
+
+    def deliver(self, transfer):
+        contracts = self.destination_contracts
+        with self.lock:
+            self.backlog -= 1
+            transfer.path = LIQUIDITY if self.liquidity >= transfer.amount else VAULT
+            if transfer.path == LIQUIDITY:
+                self.liquidity -= transfer.amount
+        try:
+            if transfer.path == LIQUIDITY:
+                self.destination.send(contracts.lusdToken.functions.transfer(transfer.user, transfer.amount), self.relayer)
+                transfer.bridged = self.now()
+                transfer.received = transfer.amount
+                self.finish(transfer, DELIVERED)
+            else:
+                # the bridge mints anyToken 1:1
+                self.destination.send(contracts.anyToken.functions.transfer(transfer.user, transfer.amount), self.relayer)
+                transfer.bridged = self.now()
+                if self.model is not None:
+                    with self.lock:
+                        self.model.mintColl(transfer.user, transfer.amount)
+                self.depositAnyToken(transfer)
+        except TRANSFER_ERRORS as error:
+            self.finish(transfer, FAILED, str(error))
+
+    # User side on the destination chain: anyToken into the vault, native LUSD out
+    def depositAnyToken(self, transfer):
+        operations = self.destination_contracts.vaultOperations.functions
+        lusd_amount = self.lusdForAnyToken(transfer.amount)
+        with self.user_locks[transfer.user]:
+            operation = 'withdrawLUSD' if transfer.user in self.open_vaults else 'openVault'
+            try:
+                self.destination.send(getattr(operations, operation)(lusd_amount), transfer.user)
+            except TRANSFER_ERRORS as error:
+                reason = str(error)
+                status = CEILING if 'debt ceiling' in reason else MINIMUM if 'minimum' in reason else FAILED
+                self.finish(transfer, status, reason)
+                return
+            self.open_vaults.add(transfer.user)
+            if self.model is not None:
+                self.mirror(transfer.user, operation, lusd_amount)
+        transfer.received = lusd_amount
+        self.finish(transfer, DELIVERED)
+        self.sampleUtilization()
+
+    # Applies a deposit the chain accepted to the model; every verify_every deposits compares the user's vault.
+    # The caller holds the user lock, so no other transaction changes that vault meanwhile.
+    def mirror(self, user, operation, lusd_amount):
+        with self.lock:
+            try:
+                getattr(self.model, operation)(user, lusd_amount)
+            except ModelRevert as error:
+                self.divergences.append(f'{operation}({lusd_amount}) by {user}: chain succeeds, model reverts with {error}')
+                return
+            self.model_deposits += 1
+            if self.model_deposits % self.verify_every != 0:
+                return
+        self.checkVault(user)
+
+    def checkVault(self, user):
+        debt, coll, _, status, _ = self.destination_contracts.vaultManager.functions.Vaults(user).call()
+        with self.lock:
+            vault = self.model.vault(user)
+            self.model_checks += 1
+            if (debt, coll, status) != (vault.debt, vault.coll, vault.status):
+                self.divergences.append(f'vault of {user}: chain debt {debt} coll {coll} status {status}, '
+                    f'model debt {vault.debt} coll {vault.coll} status {vault.status}')
+
+    # Every vault and the pool totals, once the run is over
+    def checkModel(self):
+        for user in list(self.model.VaultOwners):
+            self.checkVault(user)
+        pool = self.destination_contracts.activePool.functions
+        totals = (pool.getAnyToken().call(), pool.getLUSDDebt().call(), self.destination_contracts.vaultManager.functions.getVaultOwnersCount().call())
+        expected = (self.model.AnyToken, self.model.LUSDDebt, self.model.getVaultOwnersCount())
+        self.model_checks += 1
+        if totals != expected:
+            self.divergences.append(f'pool coll, debt and vault owners: chain {totals}, model {expected}')
+
+    def printVerification(self):
+        print(f'\n Vault model: {self.model_deposits} deposits mirrored, {self.model_checks} checks, {len(self.divergences)} divergences')
+        for divergence in self.divergences:
+            print(f' !! {divergence}')
+
+    def sampleUtilization(self):
+        debt = self.destination_contracts.activePool.functions.getLUSDDebt().call()
+        with self.lock:
+            self.utilization.append((self.now(), debt))
+
+    def finish(self, transfer, status, reason=''):
+        transfer.status = status
+        transfer.reason = reason
+        if status == DELIVERED:
+            transfer.delivered = self.now()
+        with self.lock:
+            self.finished += 1
+            if self.finished == self.n_transfers:
+                self.done.set()
+
+
+# Log-uniform amounts between min_amount and max_amount LUSD, Poisson arrivals at `rate` per second
+def transferLoad(users, n_transfers, rate, min_amount, max_amount, rng):
+    amounts = np.exp(rng.uniform(np.log(min_amount), np.log(max_amount), n_transfers))
+    arrivals = np.cumsum(rng.exponential(1 / rate, n_transfers))
+    transfers = [Transfer(i, users[rng.integers(len(users))], int(amount) * DECIMAL_PRECISION) for i, amount in enumerate(amounts)]
+    return transfers, arrivals
+
+
+def summarize(transfers, utilization, seed_debt, ceiling):
+    delivered = [transfer for transfer in transfers if transfer.status == DELIVERED]
+    summary = {'transfers': len(transfers)}
+    for status in (DELIVERED, CEILING, MINIMUM, FAILED):
+        summary[status] = sum(transfer.status == status for transfer in transfers)
+
+    for path in (LIQUIDITY, VAULT):
+        latencies = [transfer.latency() for transfer in delivered if transfer.path == path]
+        summary[f'{path}_delivered'] = len(latencies)
+        if latencies:
+            for q, value in zip(LATENCY_QUANTILES, np.quantile(latencies, LATENCY_QUANTILES)):
+                summary[f'{path}_latency_p{int(q * 100)}'] = float(value)
+
+    if delivered:
+        span = max(transfer.delivered for transfer in delivered) - min(transfer.sent for transfer in transfers)
+        summary['throughput'] = len(delivered) / span if span > 0 else float('nan')
+    summary['delivered_lusd'] = sum(transfer.received for transfer in delivered) / DECIMAL_PRECISION
+
+    user_ceiling = ceiling - seed_debt
+    debts = np.array([debt for _, debt in utilization], dtype=float) - seed_debt
+    summary['debt_ceiling'] = user_ceiling / DECIMAL_PRECISION
+    summary['utilization_final'] = float(debts[-1] / user_ceiling) if len(debts) else 0.0
+    summary['utilization_max'] = float(debts.max() / user_ceiling) if len(debts) else 0.0
+    ceiling_hits = [transfer.bridged for transfer in transfers if transfer.status == CEILING]
+    summary['first_ceiling_hit'] = min(ceiling_hits) if ceiling_hits else None
+    return summary
+
+
+def printSummary(summary, max_backlog):
+    print('\n Bridge simulation')
+    print(f' transfers {summary["transfers"]}: {summary[DELIVERED]} delivered, {summary[CEILING]} stuck at the debt ceiling, '
+        f'{summary[MINIMUM]} below MIN_SWAP_NET_DEBT, {summary[FAILED]} failed')
+    for path in (LIQUIDITY, VAULT):
+        latencies = [f'p{int(q * 100)} {summary[f"{path}_latency_p{int(q * 100)}"]:.2f}s' for q in LATENCY_QUANTILES
+            if f'{path}_latency_p{int(q * 100)}' in summary]
+        print(f' {path:<10} {summary[f"{path}_delivered"]:>6} delivered  latency {", ".join(latencies) or "-"}')
+    if 'throughput' in summary:
+        print(f' throughput {summary["throughput"]:.2f} transfers/s, {summary["delivered_lusd"]:.0f} LUSD delivered')
+    print(f' relayer backlog peak {max_backlog}')
+    print(f' vault utilization final {summary["utilization_final"]:.1%}, max {summary["utilization_max"]:.1%} '
+        f'of {summary["debt_ceiling"]:.0f} LUSD')
+    if summary['first_ceiling_hit'] is not None:
+        print(f' debt ceiling first hit after {summary["first_ceiling_hit"]:.1f}s')
+
+
+def writeTransfers(path, transfers):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as csvfile:
+        datawriter = csv.writer(csvfile, delimiter=',')
+        datawriter.writerow(['id', 'user', 'amount', 'received', 'path', 'status', 'sent', 'deposited', 'bridged', 'delivered', 'reason'])
+        for transfer in transfers:
+            datawriter.writerow([transfer.id, transfer.user, transfer.amount / DECIMAL_PRECISION, transfer.received / DECIMAL_PRECISION,
+                transfer.path, transfer.status, transfer.sent, transfer.deposited, transfer.bridged, transfer.delivered, transfer.reason])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate bridge transfers into the anyToken vault of a local destination chain')
+    parser.add_argument('--transfers', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=10, help='transfers per second')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--min-amount', type=float, default=2000, help='LUSD')
+    parser.add_argument('--max-amount', type=float, default=50000, help='LUSD')
+    parser.add_argument('--liquidity', type=float, default=100000, help='LUSD liquidity of the relayer on the destination chain')
+    parser.add_argument('--debt-ceiling-plus', type=float, default=0, help='LUSD added to ANYTOKEN_DEBT_CEILING')
+    parser.add_argument('--relayer-workers', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--source-block-time', type=int, default=0, help='seconds, 0 mines on every transaction')
+    parser.add_argument('--destination-block-time', type=int, default=0, help='seconds')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--node-cmd', default='anvil')
+    parser.add_argument('--build-dir', default='build/contracts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='tests/bridge_simulation.csv')
+    parser.add_argument('--verify-every', type=int, default=0, help='compare the vaults with vault_model.VaultModel every K vault deposits, 0 off')
+    args = parser.parse_args()
+
+    nodes = []
+    try:
+        process, source_w3 = startNode(args.node_cmd, args.port, args.users + 1, args.source_block_time)
+        nodes.append(process)
+        process, destination_w3 = startNode(args.node_cmd, args.port + 1, args.users + 1, args.destination_block_time)
+        nodes.append(process)
+        source = Chain(source_w3, args.build_dir)
+        destination = Chain(destination_w3, args.build_dir)
+        # the dev accounts of both nodes come from the same mnemonic, so a user has the same address on both chains
+        users = source.accounts[1:args.users + 1]
+
+        source_contracts = setupSourceContracts(source, users)
+        destination_contracts = setupDestinationContracts(destination, users)
+        liquidity = int(args.liquidity) * DECIMAL_PRECISION
+        seed_debt = seedLiquidity(destination, destination_contracts, liquidity, int(args.debt_ceiling_plus) * DECIMAL_PRECISION)
+        ceiling = destination_contracts.vaultManager.functions.getDebtCeiling().call()
+
+        transfers, arrivals = transferLoad(users, args.transfers, args.rate, args.min_amount, args.max_amount, np.random.default_rng(args.seed))
+        simulator = BridgeSimulator(source, destination, source_contracts, destination_contracts, users, liquidity,
+            args.relayer_workers, args.poll_interval, args.verify_every)
+        simulator.run(transfers, arrivals)
+        if simulator.model is not None:
+            simulator.checkModel()
+    finally:
+        for process in nodes:
+            process.terminate()
+
+    summary = summarize(transfers, simulator.utilization, seed_debt, ceiling)
+    printSummary(summary, simulator.max_backlog)
+    writeTransfers(args.output, transfers)
+    print(f'Transfers written to {args.output}')
+    if simulator.model is not None:
+        simulator.printVerification()
+        if simulator.divergences:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
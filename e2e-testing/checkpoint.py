@@ -0,0 +1,111 @@
+"""Checkpoints of long simulation runs.
+
+With CHECKPOINT_EVERY=K (off by default), test_run_simulation saves every K simulation steps a
+dump of the dev node state, the addresses of the contracts, the Python-side simulation state
+(agents, trove indexer tables and their last indexed block, `data`, running totals, LUSD/LQTY
+prices, random generator states) and the number of rows in the result store. With
+RESUME=1 the run loads the latest checkpoint into its fresh node and carries on from the
+iteration after it, appending to the same result store run.
+
+Chain state dumps need a node implementing anvil_dumpState/anvil_loadState; on other nodes no
+checkpoint is written.
+"""
+
+import glob
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+
+from deployment_cache import dumpChainState, loadChainState
+
+KEEP_CHECKPOINTS = 2
+
+
+def checkpointEvery():
+    return int(os.environ.get('CHECKPOINT_EVERY', '0'))
+
+
+def checkpointDir():
+    return os.environ.get('CHECKPOINT_DIR', 'tests/checkpoints')
+
+
+def resumeEnabled():
+    return os.environ.get('RESUME', '0') == '1'
+
+
+class Checkpoint:
+    def __init__(self, iteration, contracts, state, result_rows):
+        self.iteration = iteration
+        self.contracts = contracts
+        self.state = state
+        self.result_rows = result_rows
+
+
+class CheckpointStore:
+    # `cache` is the DeploymentCache used to (de)serialize the contract addresses
+    def __init__(self, path, cache, every):
+        self.path = path
+        self.cache = cache
+        self.every = every
+        self.steps = 0
+
+    # True once every `every` calls, i.e. every K simulation steps
+    def due(self):
+        self.steps += 1
+        return self.every > 0 and self.steps % self.every == 0
+
+    def save(self, iteration, contracts, state, result_rows):
+        chain_state = dumpChainState()
+        if chain_state is None:
+            print('Node cannot dump its state, checkpoint skipped')
+            return False
+
+        os.makedirs(self.path, exist_ok=True)
+        checkpoint_path = os.path.join(self.path, f'checkpoint_{iteration:08d}.pkl')
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({
+                'iteration': iteration,
+                'chain_state': chain_state,
+                'contracts': self.cache.serialize(contracts),
+                'state': state,
+                'result_rows': result_rows,
+                'random_state': random.getstate(),
+                'numpy_random_state': np.random.get_state(),
+            }, f)
+        # Rename last so a crash mid-write never leaves a truncated checkpoint behind
+        os.replace(tmp_path, checkpoint_path)
+        print(f'Checkpoint saved at iteration {iteration}')
+
+        for old_path in self._checkpointPaths()[:-KEEP_CHECKPOINTS]:
+            # another process may be pruning the same directory
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    # Loads the latest checkpoint into the node and returns it, or None if there is none
+    def loadLatest(self):
+        paths = self._checkpointPaths()
+        if not paths:
+            return None
+
+        with open(paths[-1], 'rb') as f:
+            entry = pickle.load(f)
+
+        if not loadChainState(entry['chain_state']):
+            raise RuntimeError(f'Node cannot load the chain state of {paths[-1]}')
+
+        random.setstate(entry['random_state'])
+        np.random.set_state(entry['numpy_random_state'])
+        self.steps = 0
+
+        print(f"Resuming from iteration {entry['iteration']}")
+        return Checkpoint(entry['iteration'], self.cache.restore(entry['contracts']), entry['state'], entry['result_rows'])
+
+    def _checkpointPaths(self):
+        return sorted(glob.glob(os.path.join(self.path, 'checkpoint_*.pkl')))
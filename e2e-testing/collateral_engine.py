@@ -0,0 +1,103 @@
+"""Per-collateral state and phase runner of the N-collateral simulation loop.
+
+CollateralRun holds what test_run_simulation keeps for one simulated collateral: its stack, its
+price path, its trove index, indexer and liquidation planner, its agents and running totals. CollateralEngine runs a
+phase for every collateral:
+
+    engine = CollateralEngine(runs, simulationWorkers(), profiler)
+    liquidations = engine.each('liquidation', index, lambda run: liquidatePlanned(run, ...))
+
+With SIMULATION_WORKERS > 1 the collaterals of a phase run on a thread pool. Their stacks share
+no contract state, so the RPC round trips and mining waits of one collateral overlap with
+those of the others; the phase returns once every collateral is done. Steps threading shared
+state through the collaterals (LUSD price stabilizer, LQTY market) stay sequential in the test.
+
+The agent phases of simulation_helpers draw from the global NumPy generator, and an account's
+LUSD balance is shared by its troves of every collateral, so with several workers the order of
+those draws and transfers across collaterals is not fixed. Seeded runs are reproducible with
+SIMULATION_WORKERS=1 (the default), or with AGENT_ENGINE=vectorized which draws from one
+generator per collateral. The profiler counts the requests of each phase on its own thread, and
+leaves out the tx and gas counts of the phases that ran alongside another one.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from hints import TroveIndex
+from event_indexer import TroveIndexer
+from liquidation_planner import LiquidationPlanner
+
+
+def simulationWorkers():
+    return int(os.environ.get('SIMULATION_WORKERS', '1'))
+
+
+class CollateralRun:
+    def __init__(self, collateral, contracts, prices):
+        self.collateral = collateral
+        self.name = collateral.name
+        self.label = collateral.label
+        self.contracts = contracts
+        self.prices = prices
+        self.price = prices[0]
+        self.lusd_gas_compensation = contracts.troveManager.LUSD_GAS_COMPENSATION() / 1e18
+        self.trove_index = TroveIndex(contracts)
+        self.trove_indexer = TroveIndexer(contracts)
+        self.liquidation_planner = LiquidationPlanner(contracts, self.trove_indexer)
+        self.agents = None
+        self.engine = None
+        self.total_coll_added = 0
+        self.total_coll_liquidated = 0
+
+    def setAgents(self, agents):
+        self.agents = agents
+        self.active_accounts = agents.activeAccounts()
+        self.inactive_accounts = agents.inactive
+
+    # Python-side state of the collateral saved in checkpoints
+    def state(self):
+        return {
+            'agents': self.agents,
+            'engine': self.engine,
+            'trove_indexer': self.trove_indexer.state(),
+            'total_coll_added': self.total_coll_added,
+            'total_coll_liquidated': self.total_coll_liquidated,
+        }
+
+    def restore(self, state):
+        self.setAgents(state['agents'])
+        self.engine = state['engine']
+        self.trove_indexer.restore(state['trove_indexer'])
+        self.total_coll_added = state['total_coll_added']
+        self.total_coll_liquidated = state['total_coll_liquidated']
+
+
+class CollateralEngine:
+    def __init__(self, runs, workers=1, profiler=None):
+        self.runs = runs
+        self.profiler = profiler
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 and len(runs) > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self, phase, index, fn, run):
+        if self.profiler is None:
+            return fn(run)
+        with self.profiler.phase(phase, run.label, index):
+            return fn(run)
+
+    # fn(run) for every collateral, concurrently when there are workers; results keyed by collateral name
+    def each(self, phase, index, fn):
+        if self.executor is None:
+            return {run.name: self._run(phase, index, fn, run) for run in self.runs}
+        futures = [self.executor.submit(self._run, phase, index, fn, run) for run in self.runs]
+        return {run.name: future.result() for run, future in zip(self.runs, futures)}
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
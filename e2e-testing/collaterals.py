@@ -0,0 +1,105 @@
+"""Registry of the collaterals deployed and simulated by the e2e simulation.
+
+Each collateral gets its own ERC20 mock and its own stack of contracts on top of the shared
+base (LUSD, LQTY). By default the registry is the former hard-coded setup: coll_1 (ETH,
+18 decimals), coll_2 (BTC, 8 decimals) and coll_3 (6 decimals, deployed but not simulated).
+SIMULATION_COLLATERALS points to a JSON file with any other list:
+
+    [
+        {"name": "coll_1", "symbol": "ETH", "decimals": 18, "price": "ETH", "whale_coll": 30000, "stability_share": 1},
+        {"name": "coll_2", "symbol": "BTC", "decimals": 8, "price": "BTC", "whale_coll": 3000, "stability_share": 0.1},
+        {"name": "coll_3", "symbol": "LINK", "decimals": 18, "initial_price": 15, "sd": 0.03, "whale_coll": 4000000}
+    ]
+
+`price` names a series of the scenario (ETH and BTC by default, or any collateral name of the
+SIMULATION_PRICES path file); without it the path is a GBM drawn from `initial_price`, `drift`
+and `sd` (hourly) with the simulation seed. The whale (account 0) opens a trove with
+`whale_coll` collateral and `whale_debt` LUSD and deposits `stability_share` of the initial
+stability pool size.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from price_paths import PathModel, generatePaths
+
+
+class Collateral:
+    def __init__(self, name, symbol, decimals=18, price=None, initial_price=None, drift=0.0, sd=0.01,
+            whale_coll=0.0, whale_debt=10e6, stability_share=0.0, simulated=True):
+        if simulated and price is None and initial_price is None:
+            raise ValueError(f'{name} needs a price series or an initial price')
+        if simulated and whale_coll <= 0:
+            raise ValueError(f'{name} needs a whale trove')
+        self.name = name
+        self.symbol = symbol
+        self.decimals = decimals
+        self.price = price
+        self.initial_price = initial_price
+        self.drift = drift
+        self.sd = sd
+        self.whale_coll = whale_coll
+        self.whale_debt = whale_debt
+        self.stability_share = stability_share
+        self.simulated = simulated
+
+    # Suffix of the per-collateral data keys and profiler label (eth, btc)
+    @property
+    def label(self):
+        return self.symbol.lower()
+
+    # Token units per collateral unit
+    @property
+    def unit(self):
+        return 10.0 ** self.decimals
+
+    @property
+    def decimal_adjustment(self):
+        return 10 ** (18 - self.decimals)
+
+
+DEFAULT_COLLATERALS = [
+    {'name': 'coll_1', 'symbol': 'ETH', 'decimals': 18, 'price': 'ETH', 'whale_coll': 30000.0, 'stability_share': 1.0},
+    {'name': 'coll_2', 'symbol': 'BTC', 'decimals': 8, 'price': 'BTC', 'whale_coll': 3000.0, 'stability_share': 0.1},
+    {'name': 'coll_3', 'symbol': 'COLL3', 'decimals': 6, 'simulated': False},
+]
+
+
+def collateralConfigPath():
+    return os.environ.get('SIMULATION_COLLATERALS')
+
+
+def loadCollaterals(path=None):
+    path = path or collateralConfigPath()
+    if path is None:
+        entries = DEFAULT_COLLATERALS
+    else:
+        with open(path) as f:
+            entries = json.load(f)
+
+    collaterals = [Collateral(**entry) for entry in entries]
+    for field in ('name', 'symbol'):
+        values = [getattr(collateral, field).lower() for collateral in collaterals]
+        if len(set(values)) != len(values):
+            raise ValueError(f'collateral {field}s must be unique')
+    return collaterals
+
+
+def simulatedCollaterals(collaterals):
+    return [collateral for collateral in collaterals if collateral.simulated]
+
+
+# Price path of every collateral keyed by name; the i-th generated path is drawn with the generator seeded with [seed, i]
+def collateralPrices(collaterals, named_prices, n_steps, seed=0):
+    prices = {}
+    for i, collateral in enumerate(collaterals):
+        if collateral.price is not None:
+            if collateral.price not in named_prices:
+                raise ValueError(f'No price series {collateral.price} for {collateral.name}')
+            prices[collateral.name] = named_prices[collateral.price]
+        else:
+            model = PathModel([collateral.initial_price], drift=[collateral.drift], sd=[collateral.sd])
+            prices[collateral.name] = generatePaths(model, 1, n_steps, np.random.default_rng([seed, i]))[0, :, 0]
+    return prices
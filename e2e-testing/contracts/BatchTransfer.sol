@@ -0,0 +1,25 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity 0.6.11;
+
+interface ITokenTransferFrom {
+    function transferFrom(address _sender, address _recipient, uint _amount) external returns (bool);
+}
+
+/*
+ * Test helper that funds many accounts with several tokens in a single transaction.
+ *
+ * The caller must have approved this contract to spend the whole amount of each token beforehand.
+ * Like the other helpers it declares the interface it uses, so it compiles from any folder.
+ */
+contract BatchTransfer {
+    function batchTransfer(ITokenTransferFrom[] calldata _tokens, address[] calldata _recipients, uint _amount) external {
+        for (uint i = 0; i < _tokens.length; i++) {
+            ITokenTransferFrom token = _tokens[i];
+            for (uint j = 0; j < _recipients.length; j++) {
+                bool success = token.transferFrom(msg.sender, _recipients[j], _amount);
+                require(success, "BatchTransfer: transfer failed");
+            }
+        }
+    }
+}
@@ -0,0 +1,59 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity 0.6.11;
+pragma experimental ABIEncoderV2;
+
+/*
+ * Test helper that deploys the contracts of a collateral stack with CREATE2 and wires them.
+ *
+ * The contracts are created by this factory, so it is their owner and can send the owner-only
+ * setAddresses/setParams calls on behalf of the deployer through execute(). The address of each
+ * contract only depends on the factory, the salt, its index in the stack and its creation code.
+ */
+contract CollateralStackFactory {
+    address public owner;
+
+    event StackDeployed(bytes32 indexed _salt, address[] _contracts);
+
+    constructor() public {
+        owner = msg.sender;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "CollateralStackFactory: caller is not the owner");
+        _;
+    }
+
+    function deploy(bytes[] calldata _initCodes, bytes32 _salt, uint _firstIndex) external onlyOwner returns (address[] memory addresses) {
+        addresses = new address[](_initCodes.length);
+        for (uint i = 0; i < _initCodes.length; i++) {
+            bytes memory initCode = _initCodes[i];
+            bytes32 salt = keccak256(abi.encodePacked(_salt, _firstIndex + i));
+            address addr;
+            assembly {
+                addr := create2(0, add(initCode, 0x20), mload(initCode), salt)
+            }
+            require(addr != address(0), "CollateralStackFactory: deployment failed");
+            addresses[i] = addr;
+        }
+        emit StackDeployed(_salt, addresses);
+    }
+
+    function execute(address[] calldata _targets, bytes[] calldata _data) external onlyOwner {
+        require(_targets.length == _data.length, "CollateralStackFactory: length mismatch");
+        for (uint i = 0; i < _targets.length; i++) {
+            (bool success, bytes memory result) = _targets[i].call(_data[i]);
+            if (!success) {
+                // bubble up the revert reason of the wired contract
+                assembly {
+                    revert(add(result, 0x20), mload(result))
+                }
+            }
+        }
+    }
+
+    function computeAddress(bytes32 _salt, uint _index, bytes32 _initCodeHash) external view returns (address) {
+        bytes32 salt = keccak256(abi.encodePacked(_salt, _index));
+        return address(uint160(uint(keccak256(abi.encodePacked(bytes1(0xff), address(this), salt, _initCodeHash)))));
+    }
+}
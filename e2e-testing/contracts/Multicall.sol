@@ -0,0 +1,95 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity 0.6.11;
+pragma experimental ABIEncoderV2;
+
+interface IPriceFeedReader {
+    function getPrice() external view returns (uint);
+}
+
+interface ITroveManagerReader {
+    function getTroveOwnersCount() external view returns (uint);
+    function getEntireSystemColl() external view returns (uint);
+    function getEntireSystemDebt() external view returns (uint);
+    function getTCR(uint _price) external view returns (uint);
+    function checkRecoveryMode(uint _price) external view returns (bool);
+    function getCurrentICR(address _borrower, uint _price) external view returns (uint);
+}
+
+interface ISortedTrovesReader {
+    function getLast() external view returns (address);
+}
+
+interface IStabilityPoolReader {
+    function getTotalLUSDDeposits() external view returns (uint);
+    function getETH() external view returns (uint);
+}
+
+/*
+ * Test helper that batches simulation state reads into a single eth_call.
+ *
+ * aggregate() runs arbitrary view calls, getGlobalStates() reads the global state of several
+ * collateral stacks, including reads that depend on each other (TCR and last ICR at the current price).
+ */
+contract Multicall {
+    struct Call {
+        address target;
+        bytes callData;
+    }
+
+    struct CollateralStack {
+        address priceFeed;
+        address troveManager;
+        address sortedTroves;
+        address stabilityPool;
+    }
+
+    struct GlobalState {
+        uint price;
+        uint numTroves;
+        uint totalColl;
+        uint totalDebt;
+        uint TCR;
+        bool recoveryMode;
+        uint lastICR;
+        uint SPLUSD;
+        uint SPColl;
+    }
+
+    function aggregate(Call[] memory _calls) public view returns (uint blockNumber, bytes[] memory returnData) {
+        blockNumber = block.number;
+        returnData = new bytes[](_calls.length);
+        for (uint i = 0; i < _calls.length; i++) {
+            (bool success, bytes memory ret) = _calls[i].target.staticcall(_calls[i].callData);
+            require(success, "Multicall: call failed");
+            returnData[i] = ret;
+        }
+    }
+
+    function getGlobalStates(CollateralStack[] memory _stacks) public view returns (uint blockNumber, GlobalState[] memory states) {
+        blockNumber = block.number;
+        states = new GlobalState[](_stacks.length);
+        for (uint i = 0; i < _stacks.length; i++) {
+            states[i] = _getGlobalState(_stacks[i]);
+        }
+    }
+
+    function _getGlobalState(CollateralStack memory _stack) internal view returns (GlobalState memory state) {
+        ITroveManagerReader troveManager = ITroveManagerReader(_stack.troveManager);
+        IStabilityPoolReader stabilityPool = IStabilityPoolReader(_stack.stabilityPool);
+
+        state.price = IPriceFeedReader(_stack.priceFeed).getPrice();
+        state.numTroves = troveManager.getTroveOwnersCount();
+        state.totalColl = troveManager.getEntireSystemColl();
+        state.totalDebt = troveManager.getEntireSystemDebt();
+        state.TCR = troveManager.getTCR(state.price);
+        state.recoveryMode = troveManager.checkRecoveryMode(state.price);
+        state.SPLUSD = stabilityPool.getTotalLUSDDeposits();
+        state.SPColl = stabilityPool.getETH();
+
+        address lastTrove = ISortedTrovesReader(_stack.sortedTroves).getLast();
+        if (lastTrove != address(0)) {
+            state.lastICR = troveManager.getCurrentICR(lastTrove, state.price);
+        }
+    }
+}
@@ -0,0 +1,129 @@
+"""On-disk cache of deployed dev chain state.
+
+The state of the local node is dumped right after a deployment step together with the
+address of every contract that was deployed. A later pytest process loads the dump into
+its fresh node in one RPC call instead of redeploying everything.
+
+Entries are keyed by the hash of the compiled bytecode of the contracts involved plus the
+deployment parameters (decimal adjustments, funded accounts, parent entry), so changing a
+contract only invalidates the entries that depend on it.
+
+Dumping and loading relies on `anvil_dumpState`/`anvil_loadState`. On other nodes (ganache,
+hardhat) a warning is issued once and contracts are deployed as usual; within a session the
+deployment is still shared between tests by the evm_snapshot of the deployed_multi_coll_contracts
+fixture.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+from brownie import web3
+
+CACHE_DIR = os.environ.get('DEPLOYMENT_CACHE_DIR', '.deployment_cache')
+
+_warned_unsupported = False
+
+
+def _warnUnsupported():
+    global _warned_unsupported
+    # on anvil the error comes from the state itself
+    if _warned_unsupported or web3.clientVersion.lower().startswith('anvil'):
+        return
+    _warned_unsupported = True
+    warnings.warn(f'{web3.clientVersion} has no anvil_dumpState/anvil_loadState: deployments are not cached across runs '
+        'and checkpoints are skipped; run on anvil to use them', RuntimeWarning)
+
+
+# Whole state of the dev node, or None if the node cannot dump it
+def dumpChainState():
+    response = web3.provider.make_request('anvil_dumpState', [])
+    if 'error' in response:
+        _warnUnsupported()
+        return None
+    return response['result']
+
+
+def loadChainState(state):
+    response = web3.provider.make_request('anvil_loadState', [state])
+    if 'error' in response:
+        _warnUnsupported()
+        return False
+    return bool(response.get('result'))
+
+
+class DeploymentCache:
+    def __init__(self, contracts_class, containers, path=CACHE_DIR):
+        self.contracts_class = contracts_class
+        self.containers = {c._name: c for c in containers}
+        self.path = path
+
+    def key(self, containers, *params):
+        h = hashlib.sha256()
+        for container in sorted(containers, key=lambda c: c._name):
+            h.update(container._name.encode())
+            h.update(container.bytecode.encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def load(self, key):
+        entry_path = self._entryPath(key)
+        if not entry_path or not os.path.exists(entry_path):
+            return None
+
+        with open(entry_path) as f:
+            entry = json.load(f)
+
+        if not loadChainState(entry['state']):
+            return None
+
+        print(f"Loaded deployment {key[:10]} from {entry_path}")
+        return self.restore(entry['contracts'])
+
+    def save(self, key, contracts):
+        entry_path = self._entryPath(key)
+        if not entry_path:
+            return
+
+        state = dumpChainState()
+        if state is None:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        # Own temp file per writer: Monte Carlo workers on a cold cache save the same entry together
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'state': state, 'contracts': self.serialize(contracts)}, f)
+        # Rename last so a crash mid-write never leaves a truncated entry behind
+        os.replace(tmp_path, entry_path)
+
+    def _entryPath(self, key):
+        if not self.path:
+            return None
+        return os.path.join(self.path, key + '.json')
+
+    # JSON-able tree of contract addresses, Contracts attributes and plain values
+    def serialize(self, contracts):
+        if isinstance(contracts, dict):
+            return {'dict': {name: self.serialize(value) for name, value in contracts.items()}}
+        if hasattr(contracts, 'address') and hasattr(contracts, '_name'):
+            return {'contract': [contracts._name, contracts.address]}
+        if isinstance(contracts, (int, float, str)):
+            return {'value': contracts}
+        return {'attrs': {name: self.serialize(value) for name, value in vars(contracts).items()}}
+
+    def restore(self, tree):
+        if 'dict' in tree:
+            return {name: self.restore(value) for name, value in tree['dict'].items()}
+        if 'contract' in tree:
+            name, address = tree['contract']
+            return self.containers[name].at(address)
+        if 'value' in tree:
+            return tree['value']
+
+        contracts = self.contracts_class()
+        for name, value in tree['attrs'].items():
+            setattr(contracts, name, self.restore(value))
+        return contracts
@@ -1,14 +1,47 @@
 import pytest
 
 import csv
+import os
+import numpy as np
 
 from brownie import *
 from accounts import *
 from helpers import *
 from simulation_helpers import *
+from deployment_cache import DeploymentCache, dumpChainState
+from state_reader import StateReader, printGlobalState
+from hints import HintGasReport, openTroveWithHints
+from event_indexer import TroveIndexer, CLOSED_BY_OWNER, CLOSED_BY_LIQUIDATION
+from liquidation_planner import LiquidationPlanner
+from monte_carlo import seedSimulation, scenarioPrices, simulationOutput
+from collaterals import loadCollaterals, simulatedCollaterals, collateralPrices
+from collateral_engine import CollateralRun, CollateralEngine, simulationWorkers
+from pipeline import TxPipeline, pipelineEnabled
+from profiling import PhaseProfiler, profileTracePath
+from agent_store import AgentStore
+from agent_engine import AgentEngine, actionList, executeActions, sendActions, applyReceipts, agentEngineEnabled, OPEN
+from agent_engine import agentOpenRate, agentCloseRate, agentSPShare, agentSPSensitivity
+from account_pool import AccountPool, poolSize
+from stack_factory import stackFactoryEnabled, stackSalt, deployStack, executeThroughFactory
+from scheduler import simulationSteps, advanceTo
+from results import ResultStore, simulationColumns, collateralColumn, collateralRow, resultsDir, runId, exportCSV
+from checkpoint import CheckpointStore, checkpointDir, checkpointEvery, resumeEnabled
+from shadow_model import MODE_SHADOW, MODE_VERIFY, simulationMode, verifyEvery, contractShadow, ShadowVerifier, ShadowSimulation, targetCRDecisions
 
 class Contracts: pass
 
+COLLATERALS = loadCollaterals()
+
+# Monte Carlo workers run the simulation against their own price paths
+SCENARIO_PRICES = scenarioPrices({'ETH': price_ether, 'BTC': price_bitcoin})
+COLLATERAL_PRICES = collateralPrices(simulatedCollaterals(COLLATERALS), SCENARIO_PRICES,
+    max(len(prices) for prices in SCENARIO_PRICES.values()), int(os.environ.get('SIMULATION_SEED', '0')))
+
+BASE_CONTAINERS = [LUSDToken, Unipool, FeeForwarder, LockupContractFactory, LQTYToken, ERC20Mock, BatchTransfer, Multicall]
+COLL_CONTAINERS = [PriceFeedTestnet, SortedTroves, TroveManager, ActivePool, StabilityPool, GasPool, DefaultPool,
+    CollSurplusPool, BorrowerOperationsTester, HintHelpers, CommunityIssuance, CollateralStackFactory]
+COLL_DECIMAL_ADJUSTMENTS = {collateral.name: collateral.decimal_adjustment for collateral in COLLATERALS}
+
 
 def setAddresses(contracts):
     contracts.sortedTroves.setParams(
@@ -101,124 +134,122 @@ def setAddresses(contracts):
         { 'from': accounts[0] }
     )
 
-def oneCollSetAddresses(base_contracts, contracts, coll_address, decimal_adjustment):
-    base_contracts.lqtyToken.unlockFunction(0, { 'from': accounts[0] })
-    base_contracts.lqtyToken.addCommunityIssuanceAddress(contracts.communityIssuance, { 'from': accounts[0] })
-    base_contracts.lqtyToken.unlockFunction(2, { 'from': accounts[0] })
-    base_contracts.lqtyToken.transferToNewCommunityIssuanceContract(contracts.communityIssuance.address, Wei(100000e18), { 'from': accounts[0] })
-
-    contracts.communityIssuance.setAddresses(
-        base_contracts.lqtyToken.address,
-        contracts.stabilityPool.address,
-        { 'from': accounts[0] }
-    )
-    
-    contracts.sortedTroves.setParams(
-        MAX_BYTES_32,
-        contracts.troveManager.address,
-        contracts.borrowerOperations.address,
-        { 'from': accounts[0] }
-    )
-
-    contracts.troveManager.setAddresses(
-        contracts.borrowerOperations.address,
-        contracts.activePool.address,
-        contracts.defaultPool.address,
-        contracts.stabilityPool.address,
-        contracts.gasPool.address,
-        contracts.collSurplusPool.address,
-        contracts.priceFeedTestnet.address,
-        base_contracts.lusdToken.address,
-        contracts.sortedTroves.address,
-        base_contracts.lqtyToken.address,
-        coll_address,
-        accounts[0], # _poolAdminAddress
-        decimal_adjustment, # collDecimalAdjustment
-        { 'from': accounts[0] }
-    )
-
-    contracts.troveManager.setAdminParams(
-        Wei(1000000e24), # debt ceiling
-        base_contracts.feeForwarder.address,
-        { 'from': accounts[0] }
-    )
-
-    contracts.borrowerOperations.setAddresses(
-        contracts.troveManager.address,
-        contracts.activePool.address,
-        contracts.defaultPool.address,
-        contracts.stabilityPool.address,
-        contracts.gasPool.address,
-        contracts.collSurplusPool.address,
-        contracts.priceFeedTestnet.address,
-        contracts.sortedTroves.address,
-        base_contracts.lusdToken.address,
-        coll_address,
-        accounts[0], # _poolAdminAddress
-        decimal_adjustment, # collDecimalAdjustment
-        { 'from': accounts[0] }
-    )
-
-    contracts.borrowerOperations.setBorrowingFeePoolAddress(
-        accounts[0], # _poolAdminAddress
-        { 'from': accounts[0] }
-    )
-
-    contracts.stabilityPool.setAddresses(
-        contracts.borrowerOperations.address,
-        contracts.troveManager.address,
-        contracts.activePool.address,
-        base_contracts.lusdToken.address,
-        contracts.sortedTroves.address,
-        contracts.priceFeedTestnet.address,
-        contracts.communityIssuance.address,
-        coll_address,
-        decimal_adjustment,
-        { 'from': accounts[0] }
-    )
-
-    contracts.activePool.setAddresses(
-        contracts.borrowerOperations.address,
-        contracts.troveManager.address,
-        contracts.stabilityPool.address,
-        contracts.defaultPool.address,
-        contracts.collSurplusPool.address,
-        coll_address,
-        { 'from': accounts[0] }
-    )
-
-    contracts.defaultPool.setAddresses(
-        contracts.troveManager.address,
-        contracts.activePool.address,
-        coll_address,
-        { 'from': accounts[0] }
-    )
+# Wiring of one collateral stack as (sender, fn, args): BASE calls go to the base contracts owned by
+# accounts[0], OWNER calls to the owner of the new contracts, ADMIN calls to their pool admin (accounts[0])
+BASE, OWNER, ADMIN = 'base', 'owner', 'admin'
+
+def oneCollWiring(base_contracts, contracts, coll_address, decimal_adjustment):
+    return [
+        (BASE, base_contracts.lqtyToken.unlockFunction, [0]),
+        (BASE, base_contracts.lqtyToken.addCommunityIssuanceAddress, [contracts.communityIssuance]),
+        (BASE, base_contracts.lqtyToken.unlockFunction, [2]),
+        (BASE, base_contracts.lqtyToken.transferToNewCommunityIssuanceContract, [contracts.communityIssuance.address, Wei(100000e18)]),
+
+        (OWNER, contracts.communityIssuance.setAddresses, [
+            base_contracts.lqtyToken.address,
+            contracts.stabilityPool.address,
+        ]),
+
+        (OWNER, contracts.sortedTroves.setParams, [
+            MAX_BYTES_32,
+            contracts.troveManager.address,
+            contracts.borrowerOperations.address,
+        ]),
+
+        (OWNER, contracts.troveManager.setAddresses, [
+            contracts.borrowerOperations.address,
+            contracts.activePool.address,
+            contracts.defaultPool.address,
+            contracts.stabilityPool.address,
+            contracts.gasPool.address,
+            contracts.collSurplusPool.address,
+            contracts.priceFeedTestnet.address,
+            base_contracts.lusdToken.address,
+            contracts.sortedTroves.address,
+            base_contracts.lqtyToken.address,
+            coll_address,
+            accounts[0], # _poolAdminAddress
+            decimal_adjustment, # collDecimalAdjustment
+        ]),
+
+        (ADMIN, contracts.troveManager.setAdminParams, [
+            Wei(1000000e24), # debt ceiling
+            base_contracts.feeForwarder.address,
+        ]),
+
+        (OWNER, contracts.borrowerOperations.setAddresses, [
+            contracts.troveManager.address,
+            contracts.activePool.address,
+            contracts.defaultPool.address,
+            contracts.stabilityPool.address,
+            contracts.gasPool.address,
+            contracts.collSurplusPool.address,
+            contracts.priceFeedTestnet.address,
+            contracts.sortedTroves.address,
+            base_contracts.lusdToken.address,
+            coll_address,
+            accounts[0], # _poolAdminAddress
+            decimal_adjustment, # collDecimalAdjustment
+        ]),
+
+        (ADMIN, contracts.borrowerOperations.setBorrowingFeePoolAddress, [
+            accounts[0], # _poolAdminAddress
+        ]),
+
+        (OWNER, contracts.stabilityPool.setAddresses, [
+            contracts.borrowerOperations.address,
+            contracts.troveManager.address,
+            contracts.activePool.address,
+            base_contracts.lusdToken.address,
+            contracts.sortedTroves.address,
+            contracts.priceFeedTestnet.address,
+            contracts.communityIssuance.address,
+            coll_address,
+            decimal_adjustment,
+        ]),
+
+        (OWNER, contracts.activePool.setAddresses, [
+            contracts.borrowerOperations.address,
+            contracts.troveManager.address,
+            contracts.stabilityPool.address,
+            contracts.defaultPool.address,
+            contracts.collSurplusPool.address,
+            coll_address,
+        ]),
+
+        (OWNER, contracts.defaultPool.setAddresses, [
+            contracts.troveManager.address,
+            contracts.activePool.address,
+            coll_address,
+        ]),
+
+        (OWNER, contracts.collSurplusPool.setAddresses, [
+            contracts.borrowerOperations.address,
+            contracts.troveManager.address,
+            contracts.activePool.address,
+            coll_address,
+        ]),
+
+        (OWNER, contracts.hintHelpers.setAddresses, [
+            contracts.sortedTroves.address,
+            contracts.troveManager.address,
+            decimal_adjustment, # collDecimalAdjustment
+        ]),
+
+        (BASE, base_contracts.lusdToken.unlockFunction, [0]),
+
+        (BASE, base_contracts.lusdToken.addAddressesForColl, [
+            contracts.troveManager.address,
+            contracts.stabilityPool.address,
+            contracts.borrowerOperations.address,
+        ]),
+    ]
 
-    contracts.collSurplusPool.setAddresses(
-        contracts.borrowerOperations.address,
-        contracts.troveManager.address,
-        contracts.activePool.address,
-        coll_address,
-        { 'from': accounts[0] }
-    )
-
-    contracts.hintHelpers.setAddresses(
-        contracts.sortedTroves.address,
-        contracts.troveManager.address,
-        decimal_adjustment, # collDecimalAdjustment
-        { 'from': accounts[0] }
-    )
-
-    base_contracts.lusdToken.unlockFunction(0, { 'from': accounts[0] })
-
-    base_contracts.lusdToken.addAddressesForColl(
-        contracts.troveManager.address,
-        contracts.stabilityPool.address,
-        contracts.borrowerOperations.address,
-        { 'from': accounts[0] }
-    )
+def oneCollSetAddresses(base_contracts, contracts, coll_address, decimal_adjustment):
+    for _, fn, args in oneCollWiring(base_contracts, contracts, coll_address, decimal_adjustment):
+        fn(*args, { 'from': accounts[0] })
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def add_accounts():
     if network.show_active() != 'development':
         print("Importing accounts...")
@@ -262,6 +293,8 @@ def contracts():
 
     return contracts
 
+DEFAULT_COLL_BALANCE = 10000000
+
 def setupBaseContracts():
     contracts = Contracts()
     contracts.lusdToken = LUSDToken.deploy({ 'from': accounts[0] })
@@ -280,21 +313,31 @@ def setupBaseContracts():
         { 'from': accounts[0] }
     )
 
-    # Mint collateral tokens to accounts
-    default_coll_balance = 10000000
-    contracts.coll_1 = ERC20Mock.deploy("Coll1", "COLL1", 18, accounts[0],  floatToWei(default_coll_balance * len(accounts)), { 'from': accounts[0] })
-    contracts.coll_2 = ERC20Mock.deploy("Coll2", "COLL2", 8, accounts[0],  floatToWei(default_coll_balance * len(accounts)), { 'from': accounts[0] })
-    contracts.coll_3 = ERC20Mock.deploy("Coll3", "COLL3", 6, accounts[0],  floatToWei(default_coll_balance * len(accounts)), { 'from': accounts[0] })
+    contracts.multicall = Multicall.deploy({ 'from': accounts[0] })
 
-    for idx, account in enumerate(accounts):
-        if idx == 0:
-            continue
-        contracts.coll_1.transfer(account, floatToWei(default_coll_balance),  { 'from': accounts[0] })
-        contracts.coll_2.transfer(account, floatToWei(default_coll_balance),  { 'from': accounts[0] })
-        contracts.coll_3.transfer(account, floatToWei(default_coll_balance),  { 'from': accounts[0] })
+    # Mint collateral tokens to accounts; the named accounts used by the tests are always funded,
+    # and the account pool is funded from accounts[0] on first use on top of them
+    holders = len(accounts) + poolSize()
+    for i, collateral in enumerate(COLLATERALS):
+        setattr(contracts, collateral.name, ERC20Mock.deploy(f"Coll{i + 1}", f"COLL{i + 1}", collateral.decimals, accounts[0],
+            floatToWei(DEFAULT_COLL_BALANCE * holders), { 'from': accounts[0] }))
+
+    fundAccounts([getattr(contracts, collateral.name) for collateral in COLLATERALS], accounts[1:], floatToWei(DEFAULT_COLL_BALANCE))
 
     return contracts
 
+# Number of token transfers per transaction (one per token and account), bounded by the block gas limit
+FUNDING_BATCH_SIZE = 300
+
+def fundAccounts(tokens, recipients, amount):
+    batchTransfer = BatchTransfer.deploy({ 'from': accounts[0] })
+    for token in tokens:
+        token.approve(batchTransfer.address, amount * len(recipients), { 'from': accounts[0] })
+
+    batch_accounts = max(1, FUNDING_BATCH_SIZE // len(tokens))
+    for start in range(0, len(recipients), batch_accounts):
+        batchTransfer.batchTransfer(tokens, recipients[start:start + batch_accounts], amount, { 'from': accounts[0] })
+
 def setupOneCollateralContracts(coll_contract, base_contracts, decimal_adjustment):
     contracts = Contracts()
 
@@ -310,24 +353,112 @@ def setupOneCollateralContracts(coll_contract, base_contracts, decimal_adjustmen
     contracts.hintHelpers = HintHelpers.deploy({ 'from': accounts[0] })
     contracts.communityIssuance = CommunityIssuance.deploy({ 'from': accounts[0] })
     contracts.coll = coll_contract
+    contracts.decimalAdjustment = decimal_adjustment
     contracts.lusdToken = base_contracts.lusdToken
     contracts.lqtyToken = base_contracts.lqtyToken
+    contracts.multicall = base_contracts.multicall
     
     oneCollSetAddresses(base_contracts, contracts, coll_contract.address, decimal_adjustment)
 
     return contracts
 
-@pytest.fixture
-def multi_coll_contracts():
-    base_contracts = setupBaseContracts()
+# Same stack as setupOneCollateralContracts in a constant number of blocks: the CREATE2 batches of
+# the factory, one block for the base contract calls, one factory.execute() and one block for the admin calls
+def setupOneCollateralContractsWithFactory(factory, coll_name, coll_contract, base_contracts, decimal_adjustment):
+    contracts = Contracts()
+
+    stack = deployStack(factory, {
+        'priceFeedTestnet': PriceFeedTestnet,
+        'sortedTroves': SortedTroves,
+        'troveManager': TroveManager,
+        'activePool': ActivePool,
+        'stabilityPool': StabilityPool,
+        'gasPool': GasPool,
+        'defaultPool': DefaultPool,
+        'collSurplusPool': CollSurplusPool,
+        'borrowerOperations': BorrowerOperationsTester,
+        'hintHelpers': HintHelpers,
+        'communityIssuance': CommunityIssuance,
+    }, stackSalt(coll_name), { 'from': accounts[0] })
+    for name, contract in stack.items():
+        setattr(contracts, name, contract)
+    contracts.coll = coll_contract
+    contracts.decimalAdjustment = decimal_adjustment
+    contracts.lusdToken = base_contracts.lusdToken
+    contracts.lqtyToken = base_contracts.lqtyToken
+    contracts.multicall = base_contracts.multicall
+
+    wiring = oneCollWiring(base_contracts, contracts, coll_contract.address, decimal_adjustment)
+    with TxPipeline() as pipeline:
+        for sender, fn, args in wiring:
+            if sender == BASE:
+                pipeline.send(0, fn, *args, { 'from': accounts[0] })
+    for result in pipeline.reverts():
+        raise RuntimeError(f'{coll_name} wiring reverted: {result.revert_msg}')
+    executeThroughFactory(factory, [(fn, args) for sender, fn, args in wiring if sender == OWNER], { 'from': accounts[0] })
+    with TxPipeline() as pipeline:
+        for sender, fn, args in wiring:
+            if sender == ADMIN:
+                pipeline.send(0, fn, *args, { 'from': accounts[0] })
+    for result in pipeline.reverts():
+        raise RuntimeError(f'{coll_name} wiring reverted: {result.revert_msg}')
+
+    return contracts
+
+def setupMultiCollContracts():
+    # The base layer and the collateral stacks are cached separately, so a change in a
+    # collateral contract only redeploys the collateral stacks on top of the cached base.
+    cache = DeploymentCache(Contracts, BASE_CONTAINERS + COLL_CONTAINERS)
+    base_key = cache.key(BASE_CONTAINERS, [str(account) for account in accounts], poolSize(), COLL_DECIMAL_ADJUSTMENTS)
+    multi_coll_key = cache.key(COLL_CONTAINERS, base_key, COLL_DECIMAL_ADJUSTMENTS, stackFactoryEnabled())
+
+    multi_coll_contracts = cache.load(multi_coll_key)
+    if multi_coll_contracts is not None:
+        return multi_coll_contracts
+
+    base_contracts = cache.load(base_key)
+    if base_contracts is None:
+        base_contracts = setupBaseContracts()
+        cache.save(base_key, base_contracts)
 
     multi_coll_contracts = {}    
-    multi_coll_contracts["coll_1"] = setupOneCollateralContracts(base_contracts.coll_1, base_contracts, 1)
-    multi_coll_contracts["coll_2"] = setupOneCollateralContracts(base_contracts.coll_2, base_contracts, 1e10)
-    multi_coll_contracts["coll_3"] = setupOneCollateralContracts(base_contracts.coll_3, base_contracts, 1e12)
+    if stackFactoryEnabled():
+        factory = CollateralStackFactory.deploy({ 'from': accounts[0] })
+        for coll_name, decimal_adjustment in COLL_DECIMAL_ADJUSTMENTS.items():
+            multi_coll_contracts[coll_name] = setupOneCollateralContractsWithFactory(factory, coll_name, getattr(base_contracts, coll_name), base_contracts, decimal_adjustment)
+    else:
+        for coll_name, decimal_adjustment in COLL_DECIMAL_ADJUSTMENTS.items():
+            multi_coll_contracts[coll_name] = setupOneCollateralContracts(getattr(base_contracts, coll_name), base_contracts, decimal_adjustment)
+    cache.save(multi_coll_key, multi_coll_contracts)
+
+    return multi_coll_contracts
+
+def canSnapshot():
+    # Snapshots are only available on a local dev node launched by brownie
+    return rpc.is_active()
+
+# Deploys the whole multi collateral system once per session and snapshots the chain
+# right after, so each test only pays for a revert instead of ~40 deployments.
+@pytest.fixture(scope="session")
+def deployed_multi_coll_contracts(add_accounts):
+    if not canSnapshot():
+        return None
+
+    multi_coll_contracts = setupMultiCollContracts()
+    chain.snapshot()
 
     return multi_coll_contracts
 
+@pytest.fixture
+def multi_coll_contracts(deployed_multi_coll_contracts):
+    if deployed_multi_coll_contracts is None:
+        return setupMultiCollContracts()
+
+    # revert() keeps the snapshot, so every test starts from the same freshly deployed state
+    chain.revert()
+
+    return deployed_multi_coll_contracts
+
 @pytest.fixture
 def print_expectations():
     # ether_price_one_year = price_ether_initial * (1 + drift_ether)**8760
@@ -343,6 +474,22 @@ def print_expectations():
     print("SD(tau)     = ", rational_inattention_gamma_k**(0.5) * rational_inattention_gamma_theta * 100, "%")
     print("\n")
 
+# the reports are printed and the trace closed when the simulation fails too
+@pytest.fixture
+def hint_gas_report():
+    report = HintGasReport()
+    yield report
+    if report.records:
+        report.print()
+
+@pytest.fixture
+def profiler():
+    profiler = PhaseProfiler(profileTracePath())
+    yield profiler
+    if profiler.records:
+        profiler.print()
+    profiler.close()
+
 def _test_test(contracts):
     print(len(accounts))
     contracts.borrowerOperations.openTrove(Wei(1e18), floatToWei(100), Wei(2000e18), ZERO_ADDRESS, ZERO_ADDRESS,
@@ -396,12 +543,163 @@ def test_liquidation_with_no_SP_deposit(add_accounts, multi_coll_contracts, prin
 
     logGlobalState(contracts_btc, 1e10)
 
-    contracts_btc.troveManager.liquidateTroves(10, { 'from': accounts[0], 'allow_revert': True })
+    # exactly the troves below MCR at the new price, in one batch
+    planner = LiquidationPlanner(contracts_btc, TroveIndexer(contracts_btc))
+    planner.liquidate(10000, { 'from': accounts[0] })
+    planner.print()
 
     print("after liquidation")
     logGlobalState(contracts_btc, 1e10)
 
 
+def test_trove_indexer_decodes_logs(add_accounts, multi_coll_contracts):
+    contracts = multi_coll_contracts["coll_1"]
+    indexer = TroveIndexer(contracts, web3.eth.block_number + 1)
+    contracts.priceFeedTestnet.setPrice(floatToWei(2000), { 'from': accounts[0] })
+
+    # BorrowerOperations: open, adjust and close
+    for account, coll, debt in [(accounts[0], 1000, 100000), (accounts[1], 10, 12000), (accounts[2], 10, 15000), (accounts[3], 10, 5000)]:
+        contracts.coll.approve(contracts.borrowerOperations.address, floatToWei(coll), { 'from': account })
+        contracts.borrowerOperations.openTrove(MAX_FEE, floatToWei(debt), floatToWei(coll), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': account })
+    contracts.stabilityPool.provideToSP(floatToWei(50000), ZERO_ADDRESS, { 'from': accounts[0] })
+    contracts.borrowerOperations.withdrawLUSD(MAX_FEE, floatToWei(1000), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': accounts[3] })
+    contracts.lusdToken.transfer(accounts[1], floatToWei(1000), { 'from': accounts[0] })
+    contracts.borrowerOperations.closeTrove({ 'from': accounts[1] })
+
+    # TroveManager: TroveLiquidated, then the zero-debt TroveUpdated
+    contracts.priceFeedTestnet.setPrice(floatToWei(1400), { 'from': accounts[0] })
+    contracts.troveManager.liquidate(accounts[2], { 'from': accounts[0] })
+
+    assert indexer.update() > 0
+    for account in accounts[:4]:
+        debt, coll, status = indexer.get(account)
+        chain_debt, chain_coll, _, _ = contracts.troveManager.getEntireDebtAndColl(account)
+        assert status == contracts.troveManager.getTroveStatus(account)
+        assert debt == pytest.approx(chain_debt / 1e18)
+        assert coll == pytest.approx(chain_coll * contracts.decimalAdjustment / 1e18)
+    assert indexer.get(accounts[1])[2] == CLOSED_BY_OWNER
+    assert indexer.get(accounts[2])[2] == CLOSED_BY_LIQUIDATION
+    assert indexer.count() == 2
+
+def test_checkpoint_resumes_trove_indexer(add_accounts, multi_coll_contracts, tmp_path):
+    if dumpChainState() is None:
+        pytest.skip('the node cannot dump its state')
+
+    contracts = multi_coll_contracts["coll_1"]
+    contracts.priceFeedTestnet.setPrice(floatToWei(2000), { 'from': accounts[0] })
+    indexer = TroveIndexer(contracts)
+    for account, coll, debt in [(accounts[0], 1000, 100000), (accounts[1], 10, 12000), (accounts[2], 10, 5000)]:
+        contracts.coll.approve(contracts.borrowerOperations.address, floatToWei(coll), { 'from': account })
+        contracts.borrowerOperations.openTrove(MAX_FEE, floatToWei(debt), floatToWei(coll), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': account })
+    indexer.update()
+
+    checkpoints = CheckpointStore(str(tmp_path), DeploymentCache(Contracts, BASE_CONTAINERS + COLL_CONTAINERS), 1)
+    assert checkpoints.save(0, multi_coll_contracts, {'trove_indexer': indexer.state()}, 0)
+    checkpoint = checkpoints.loadLatest()
+    contracts = checkpoint.contracts["coll_1"]
+
+    # the resumed indexer knows the troves without replaying the logs, and follows what comes after
+    resumed = TroveIndexer(contracts)
+    resumed.restore(checkpoint.state['trove_indexer'])
+    assert resumed.count() == 3
+    contracts.borrowerOperations.withdrawLUSD(MAX_FEE, floatToWei(1000), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': accounts[2] })
+    contracts.lusdToken.transfer(accounts[1], floatToWei(1000), { 'from': accounts[0] })
+    contracts.borrowerOperations.closeTrove({ 'from': accounts[1] })
+    contracts.coll.approve(contracts.borrowerOperations.address, floatToWei(10), { 'from': accounts[3] })
+    contracts.borrowerOperations.openTrove(MAX_FEE, floatToWei(8000), floatToWei(10), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': accounts[3] })
+
+    assert resumed.update() > 0
+    for account in accounts[:4]:
+        debt, coll, status = resumed.get(account)
+        chain_debt, chain_coll, _, _ = contracts.troveManager.getEntireDebtAndColl(account)
+        assert status == contracts.troveManager.getTroveStatus(account)
+        assert debt == pytest.approx(chain_debt / 1e18)
+        assert coll == pytest.approx(chain_coll * contracts.decimalAdjustment / 1e18)
+    assert resumed.count() == 3
+
+
+# Actions of the agents of one collateral for this step, given the stability pool return and the LUSD
+# price as stability_update. Pool accounts opening a trove are funded here, before any pipeline
+# turns automine off, as the funding transfer waits for its receipt.
+def agentActions(run, accounts, addresses, return_stability, price_LUSD):
+    agents = run.engine.agents
+    run.trove_indexer.update()
+    agents.debt[:], agents.coll[:], status = run.trove_indexer.table(addresses)
+    action_list = actionList(run.engine.decide(agents.coll, agents.debt, status == 1, run.price, run.lusd_gas_compensation, return_stability, price_LUSD))
+    if isinstance(accounts, AccountPool):
+        for action in action_list:
+            if action.kind == OPEN:
+                accounts.fund(action.agent, run.contracts.coll)
+    return action_list
+
+# With a pipeline, returns the sent actions for applyReceipts() instead of the coll added and LUSD issued
+def runAgentActions(run, action_list, accounts, report, pipeline=None):
+    agents = run.engine.agents
+    if pipeline is not None:
+        return sendActions(action_list, pipeline, run.contracts, accounts, agents.coll.copy(), agents.debt.copy(), run.trove_index, MAX_FEE, run.collateral.unit)
+    return executeActions(action_list, run.contracts, accounts, agents.coll.copy(), agents.debt.copy(), run.trove_index, MAX_FEE, run.collateral.unit, report, agents)
+
+# Accounts passed to the helper phases that open troves (open_troves, and price_stabilizer when LUSD trades high):
+# pool accounts get the run's collateral the first time they are indexed there
+def openers(accounts, run):
+    if isinstance(accounts, AccountPool):
+        return accounts.funding(run.contracts.coll)
+    return accounts
+
+# Liquidation phase: the run's planner liquidates exactly the troves below MCR. The gains are measured on the stability pool
+# around it: the coll it received against the LUSD it lost, and the LQTY issued to its depositors meanwhile.
+# Returns the coll liquidated, the liquidation gain and the airdrop gain.
+def liquidatePlanned(run, agent_of, price_LUSD, price_LQTY_current):
+    contracts = run.contracts
+    sp_lusd, sp_coll = contracts.stabilityPool.getTotalLUSDDeposits(), contracts.stabilityPool.getETH()
+    lqty_issued = contracts.communityIssuance.totalLQTYIssued()
+    coll_liquidated = run.liquidation_planner.coll_liquidated
+
+    for owner in run.liquidation_planner.liquidate(run.price, { 'from': accounts[0] }):
+        run.trove_index.remove(owner)
+        agent = agent_of.get(owner)
+        if agent is not None and agent in run.agents.active:
+            run.agents.deactivate(agent)
+
+    coll_gain = (contracts.stabilityPool.getETH() - sp_coll) * contracts.decimalAdjustment / 1e18
+    debt_offset = (sp_lusd - contracts.stabilityPool.getTotalLUSDDeposits()) / 1e18
+    lqty_airdrop = (contracts.communityIssuance.totalLQTYIssued() - lqty_issued) / 1e18
+    return [run.liquidation_planner.coll_liquidated - coll_liquidated, coll_gain * run.price - debt_offset * price_LUSD, lqty_airdrop * price_LQTY_current]
+
+# Columns of the shadow-only CSV: (snapshot field, column template)
+SHADOW_COLUMNS = [('price', '{SYMBOL}_price'), ('num_troves', 'num_troves_{symbol}'), ('total_coll', 'total_coll_{symbol}'),
+    ('total_debt', 'total_debt_{symbol}'), ('TCR', 'TCR_{symbol}'), ('last_ICR', 'last_ICR_{symbol}'), ('SP_LUSD', 'SP_LUSD_{SYMBOL}'),
+    ('SP_coll', 'SP_{SYMBOL}')]
+
+def runShadowSimulation(collaterals, multi_coll_contracts, n_accounts):
+    reference_price = COLLATERAL_PRICES[collaterals[0].name][0]
+    shadows = {}
+    decide = {}
+    for collateral in collaterals:
+        contracts = multi_coll_contracts[collateral.name]
+        shadows[collateral.name] = contractShadow(contracts, n_accounts)
+        # same whale as the on-chain run
+        shadows[collateral.name].open([0], collateral.whale_coll, collateral.whale_debt)
+        if collateral.stability_share > 0:
+            shadows[collateral.name].provideToSP(stability_initial * collateral.stability_share)
+        decide[collateral.name] = targetCRDecisions(target_cr_a, target_cr_b, target_cr_chi_square_df, rational_inattention_gamma_k, rational_inattention_gamma_theta,
+            collateral_gamma_k, collateral_gamma_theta, agentOpenRate(), agentCloseRate(), reference_price / COLLATERAL_PRICES[collateral.name][0])
+    simulation = ShadowSimulation(shadows, decide)
+
+    total_coll_liquidated = {collateral.name: 0 for collateral in collaterals}
+    with open('tests/simulation_shadow.csv', 'w', newline='') as csvfile:
+        datawriter = csv.writer(csvfile, delimiter=',')
+        datawriter.writerow(['iteration'] + [collateralColumn(template, collateral.symbol) for _, template in SHADOW_COLUMNS for collateral in collaterals]
+            + [collateralColumn('total_coll_liquidated_{symbol}', collateral.symbol) for collateral in collaterals])
+
+        for index in simulationSteps([COLLATERAL_PRICES[collateral.name] for collateral in collaterals], n_sim):
+            results = simulation.step({collateral.name: COLLATERAL_PRICES[collateral.name][index] for collateral in collaterals}, index)
+            for name, (_, coll_liquidated, _) in results.items():
+                total_coll_liquidated[name] += coll_liquidated
+
+            datawriter.writerow([index] + [getattr(results[collateral.name][2], field) for field, _ in SHADOW_COLUMNS for collateral in collaterals]
+                + [total_coll_liquidated[collateral.name] for collateral in collaterals])
+
 """# Simulation Program
 **Sequence of events**
 
@@ -423,153 +721,243 @@ def test_liquidation_with_no_SP_deposit(add_accounts, multi_coll_contracts, prin
 * redemption & redemption fee
 * LQTY pool return determined
 """
-def test_run_simulation(add_accounts, multi_coll_contracts, print_expectations):
-    contracts_eth = multi_coll_contracts["coll_1"]
-    contracts_btc = multi_coll_contracts["coll_2"]
-    LUSD_GAS_COMPENSATION_ETH = contracts_eth.troveManager.LUSD_GAS_COMPENSATION() / 1e18
-    MIN_NET_DEBT_ETH = contracts_eth.troveManager.MIN_NET_DEBT() / 1e18
-    LUSD_GAS_COMPENSATION_BTC = contracts_btc.troveManager.LUSD_GAS_COMPENSATION() / 1e18
-    MIN_NET_DEBT_BTC = contracts_btc.troveManager.MIN_NET_DEBT() / 1e18
-
-    contracts_eth.priceFeedTestnet.setPrice(floatToWei(price_ether[0]), { 'from': accounts[0] })
-    print("set up the ETH price feed")
-    contracts_btc.priceFeedTestnet.setPrice(floatToWei(price_bitcoin[0]), { 'from': accounts[0] })
-    print("set up the BTC price feed")
-    # eth whale
-    whale_coll_eth = 30000.0
-    contracts_eth.coll.approve(contracts_eth.borrowerOperations.address, floatToWei(whale_coll_eth), { 'from': accounts[0] })
-    print("approved for the eth coll")
-    contracts_eth.borrowerOperations.openTrove(MAX_FEE, Wei(10e24), floatToWei(whale_coll_eth), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': accounts[0] })
-    contracts_eth.stabilityPool.provideToSP(floatToWei(stability_initial), ZERO_ADDRESS, { 'from': accounts[0] })
-
-    # btc whale
-    whale_coll_btc = 3000.0
-    contracts_btc.coll.approve(contracts_btc.borrowerOperations.address, floatToWei(whale_coll_btc, 1e8), { 'from': accounts[0] })
-    print("approved for the btc coll")
-    contracts_btc.borrowerOperations.openTrove(MAX_FEE, Wei(10e24), floatToWei(whale_coll_btc, 1e8), ZERO_ADDRESS, ZERO_ADDRESS, { 'from': accounts[0] })
-    contracts_btc.stabilityPool.provideToSP(floatToWei(stability_initial/10), ZERO_ADDRESS, { 'from': accounts[0] })    
-
-    active_accounts_eth = []
-    inactive_accounts_eth = [*range(1, len(accounts))]
-    active_accounts_btc = []
-    inactive_accounts_btc = [*range(1, len(accounts))]
-
-    price_LUSD = 1
-    price_LQTY_current = price_LQTY_initial
-
-    data = {"airdrop_gain_eth": [0] * n_sim, "liquidation_gain_eth": [0] * n_sim, "airdrop_gain_btc": [0] * n_sim, "liquidation_gain_btc": [0] * n_sim, "issuance_fee": [0] * n_sim, "redemption_fee": [0] * n_sim}
-    total_lusd_redempted = 0
-    total_coll_added_eth = whale_coll_eth
-    total_coll_added_btc = whale_coll_btc
-    total_coll_liquidated_eth = 0
-    total_coll_liquidated_btc = 0
-
-    print(f"Accounts: {len(accounts)}")
+def openWhaleTrove(run, hint_gas_report):
+    collateral = run.collateral
+    run.contracts.coll.approve(run.contracts.borrowerOperations.address, floatToWei(collateral.whale_coll, collateral.unit), { 'from': accounts[0] })
+    print(f"approved for the {run.label} coll")
+    openTroveWithHints(run.contracts, run.trove_index, MAX_FEE, floatToWei(collateral.whale_debt), floatToWei(collateral.whale_coll, collateral.unit), { 'from': accounts[0] }, hint_gas_report)
+    if collateral.stability_share > 0:
+        run.contracts.stabilityPool.provideToSP(floatToWei(stability_initial * collateral.stability_share), ZERO_ADDRESS, { 'from': accounts[0] })
+    run.total_coll_added = collateral.whale_coll
+
+def test_run_simulation(add_accounts, multi_coll_contracts, print_expectations, hint_gas_report, profiler):
+    collaterals = simulatedCollaterals(COLLATERALS)
+
+    seedSimulation()
+
+    mode = simulationMode()
+    if mode == MODE_SHADOW:
+        runShadowSimulation(collaterals, multi_coll_contracts, max(len(accounts), poolSize() + 1))
+        return
+
+    checkpoints = CheckpointStore(checkpointDir(), DeploymentCache(Contracts, BASE_CONTAINERS + COLL_CONTAINERS), checkpointEvery())
+    checkpoint = checkpoints.loadLatest() if resumeEnabled() else None
+    if checkpoint is not None:
+        multi_coll_contracts = checkpoint.contracts
+
+    runs = [CollateralRun(collateral, multi_coll_contracts[collateral.name], COLLATERAL_PRICES[collateral.name]) for collateral in collaterals]
+
+    # simulated borrowers: the brownie accounts, or a deterministic pool funded on first use
+    if poolSize() > 0:
+        population = AccountPool(accounts[0], poolSize(), floatToWei(DEFAULT_COLL_BALANCE))
+        if checkpoint is not None:
+            population.markFunded(checkpoint.state['funded_accounts'])
+        population_addresses = [population.address(i) for i in range(len(population))]
+    else:
+        population = accounts
+        population_addresses = [str(account) for account in accounts]
+    agent_of = {address: i for i, address in enumerate(population_addresses)}
+
+    if checkpoint is None:
+        for run in runs:
+            run.contracts.priceFeedTestnet.setPrice(floatToWei(run.price), { 'from': accounts[0] })
+            print(f"set up the {run.collateral.symbol} price feed")
+
+        for run in runs:
+            openWhaleTrove(run, hint_gas_report)
+            # account 0 is the whale
+            run.setAgents(AgentStore(len(population), 1))
+
+        price_LUSD = 1
+        price_LQTY_current = price_LQTY_initial
+
+        data = {name: np.zeros(n_sim) for name in ["issuance_fee", "redemption_fee"]}
+        for run in runs:
+            data[f'airdrop_gain_{run.label}'] = np.zeros(n_sim)
+            data[f'liquidation_gain_{run.label}'] = np.zeros(n_sim)
+        total_lusd_redempted = 0
+        last_index = 0
+    else:
+        state = checkpoint.state
+        for run in runs:
+            run.restore(state['collaterals'][run.name])
+            run.trove_index.sync()
+        price_LUSD = state['price_LUSD']
+        price_LQTY_current = state['price_LQTY_current']
+        data = state['data']
+        total_lusd_redempted = state['total_lusd_redempted']
+        last_index = checkpoint.iteration
+
+    stateReader = StateReader(runs[0].contracts.multicall, {run.name: run.contracts for run in runs})
+    shadows = {run.name: contractShadow(run.contracts, len(population)) for run in runs}
+    shadow_verifier = ShadowVerifier(verifyEvery())
+
+    engine_seed = int(os.environ.get('SIMULATION_SEED', '0'))
+    for i, run in enumerate(runs):
+        if run.engine is None:
+            # collateral amounts are drawn in units of the first collateral's value
+            run.engine = AgentEngine(len(population), target_cr_a, target_cr_b, target_cr_chi_square_df, rational_inattention_gamma_k, rational_inattention_gamma_theta,
+                collateral_gamma_k, collateral_gamma_theta, agentOpenRate(), agentCloseRate(), agentSPShare(), runs[0].prices[0] / run.prices[0],
+                seed=[engine_seed, i + 1], agents=run.agents, sp_sensitivity=agentSPSensitivity())
+
+    print(f"Accounts: {len(population)}")
+    print(f"Collaterals: {', '.join(run.collateral.symbol for run in runs)}")
     print(f"Network: {network.show_active()}")
 
-    logGlobalState(contracts_eth)
-    logGlobalState(contracts_btc)
+    for run in runs:
+        logGlobalState(run.contracts)
 
-    with open('tests/simulation.csv', 'w', newline='') as csvfile:
-        datawriter = csv.writer(csvfile, delimiter=',')
-        datawriter.writerow(['iteration','ETH_price', 'BTC_price', 'price_LUSD', 'price_LQTY_current', 'num_troves_eth', 'num_troves_btc',
-            'total_coll_eth', 'total_coll_btc', 'total_debt_eth', 'total_debt_btc', 'TCR_eth', 'TCR_btc', 'recovery_mode_eth', 'recovery_mode_btc', 
-            'last_ICR_eth', 'last_ICR_btc', 'SP_LUSD_ETH', 'SP_LUSD_BTC', 'SP_ETH', 'SP_BTC', 'total_coll_added_eth', 'total_coll_added_btc',
-            'total_coll_liquidated_eth', 'total_coll_liquidated_btc', 'total_lusd_redempted'])
+    columns = simulationColumns([run.collateral.symbol for run in runs])
+    with ResultStore(resultsDir(), runId(), columns, resume=checkpoint is not None) as store, CollateralEngine(runs, simulationWorkers(), profiler) as engine:
+        if checkpoint is not None:
+            # drop the rows written after the checkpoint
+            store.truncate(checkpoint.result_rows)
 
         #Simulation Process
-        for index in range(1, n_sim):
-            if index % 24 != 0:
-                continue
+        for index in simulationSteps([run.prices for run in runs], n_sim, last_index):
+            advanceTo(index, last_index)
+            last_index = index
             print('\n  --> Iteration', index)
             print('  -------------------\n')
-            #exogenous ether price input
-            price_ether_current = price_ether[index]
-            contracts_eth.priceFeedTestnet.setPrice(floatToWei(price_ether_current), { 'from': accounts[0] })
-            price_bitcoin_current = price_bitcoin[index]
-            contracts_btc.priceFeedTestnet.setPrice(floatToWei(price_bitcoin_current), { 'from': accounts[0] })
+            #exogenous collateral price input
+            for run in runs:
+                run.price = run.prices[index]
+            with profiler.phase('price_update', 'all', index):
+                if pipelineEnabled():
+                    # all price updates in one block
+                    with TxPipeline() as pipeline:
+                        for run in runs:
+                            pipeline.send(0, run.contracts.priceFeedTestnet.setPrice, floatToWei(run.price), { 'from': accounts[0] })
+                    for result in pipeline.reverts():
+                        print(f'price update reverted: {result.revert_msg}')
+                else:
+                    for run in runs:
+                        run.contracts.priceFeedTestnet.setPrice(floatToWei(run.price), { 'from': accounts[0] })
+
+            # the shadow starts from the chain state and predicts the liquidation phase
+            verify_step = mode == MODE_VERIFY and shadow_verifier.due()
+            if verify_step:
+                with profiler.phase('indexer', 'all', index):
+                    for run in runs:
+                        run.trove_indexer.update()
+                    pre_liquidation_state = stateReader.read()
+                for run in runs:
+                    shadows[run.name].loadFromIndexer(run.trove_indexer, population_addresses, pre_liquidation_state[run.name])
+                    shadows[run.name].liquidate(run.price, run.liquidation_planner.batch_size)
 
             #trove liquidation & return of stability pool
-            result_liquidation_eth = liquidate_troves(accounts, contracts_eth, active_accounts_eth, inactive_accounts_eth, price_ether_current, price_LUSD, price_LQTY_current, data, index)
-            result_liquidation_btc = liquidate_troves(accounts, contracts_btc, active_accounts_btc, inactive_accounts_btc, price_bitcoin_current, price_LUSD, price_LQTY_current, data, index)
-            total_coll_liquidated_eth = total_coll_liquidated_eth + result_liquidation_eth[0] 
-            total_coll_liquidated_btc = total_coll_liquidated_btc + result_liquidation_btc[0]
-            
-            # liquidation_gain = result_liquidation_eth[1] + result_liquidation_btc[1]
-            # airdrop_gain = result_liquidation_eth[2] + result_liquidation_btc[2]
-            data['liquidation_gain_eth'][index] = result_liquidation_eth[1]
-            data['airdrop_gain_eth'][index] = result_liquidation_eth[2]
-            data['liquidation_gain_btc'][index] = result_liquidation_btc[1]
-            data['airdrop_gain_btc'][index] = result_liquidation_btc[2]            
-
-            return_stability_eth = calculate_stability_return(contracts_eth, price_LUSD, data, 'liquidation_gain_eth', 'airdrop_gain_eth', index)
-            return_stability_btc = calculate_stability_return(contracts_btc, price_LUSD, data, 'liquidation_gain_btc', 'airdrop_gain_btc',index)
-
-            # return_stability_eth = result_liquidation_eth[1]
-            # return_stability_btc = result_liquidation_btc[1]
-
-            #close troves
-            result_close_eth = close_troves(accounts, contracts_eth, active_accounts_eth, inactive_accounts_eth, price_ether_current, price_LUSD, index)
-            result_close_btc = close_troves(accounts, contracts_btc, active_accounts_btc, inactive_accounts_btc, price_bitcoin_current, price_LUSD, index)
-
-            #adjust troves
-            [coll_added_adjust_eth, issuance_LUSD_adjust_eth] = adjust_troves(accounts, contracts_eth, active_accounts_eth, inactive_accounts_eth, price_ether_current, index)
-            [coll_added_adjust_btc, issuance_LUSD_adjust_btc] = adjust_troves(accounts, contracts_btc, active_accounts_btc, inactive_accounts_btc, price_bitcoin_current, index, 1e8)            
-
-            #open troves
-            [coll_added_open_eth, issuance_LUSD_open_eth] = open_troves(accounts, contracts_eth, active_accounts_eth, inactive_accounts_eth, price_ether_current, price_LUSD, index)
-            total_coll_added_eth = total_coll_added_eth + coll_added_adjust_eth + coll_added_open_eth
-            [coll_added_open_btc, issuance_LUSD_open_btc] = open_troves(accounts, contracts_btc, active_accounts_btc, inactive_accounts_btc, price_bitcoin_current, price_LUSD, index, 1e8)
-            total_coll_added_btc = total_coll_added_btc + coll_added_adjust_btc + coll_added_open_btc            
-            #active_accounts.sort(key=lambda a : a.get('CR_initial'))
-
-            #Stability Pool
-            stability_update(accounts, contracts_eth, active_accounts_eth, return_stability_eth, index)
-            stability_update(accounts, contracts_btc, active_accounts_btc, return_stability_btc, index)
+            liquidations = engine.each('liquidation', index, lambda run: liquidatePlanned(run, agent_of, price_LUSD, price_LQTY_current))
+            for run in runs:
+                result_liquidation = liquidations[run.name]
+                run.total_coll_liquidated = run.total_coll_liquidated + result_liquidation[0]
+                data[f'liquidation_gain_{run.label}'][index] = result_liquidation[1]
+                data[f'airdrop_gain_{run.label}'][index] = result_liquidation[2]
+
+            if verify_step:
+                liquidation_state = stateReader.read()
+                for run in runs:
+                    shadow_verifier.check(run.name, index, shadows[run.name].snapshot(run.price), liquidation_state[run.name])
+
+            return_stability = engine.each('stability_return', index, lambda run: calculate_stability_return(run.contracts, price_LUSD, data,
+                f'liquidation_gain_{run.label}', f'airdrop_gain_{run.label}', index))
+
+            if agentEngineEnabled():
+                # decisions of the whole population in one pass, then sent as one action list per collateral
+                actions = engine.each('agent_decisions', index, lambda run: agentActions(run, population, population_addresses,
+                    return_stability[run.name], price_LUSD))
+                if pipelineEnabled():
+                    # the actions of every collateral mined together, then applied from their receipts
+                    with TxPipeline() as pipeline:
+                        sent = engine.each('agents', index, lambda run: runAgentActions(run, actions[run.name], population, hint_gas_report, pipeline))
+                    opened = engine.each('agent_receipts', index, lambda run: applyReceipts(sent[run.name], run.trove_index, hint_gas_report, run.engine.agents))
+                else:
+                    opened = engine.each('agents', index, lambda run: runAgentActions(run, actions[run.name], population, hint_gas_report))
+                issuance_LUSD = {}
+                for run in runs:
+                    [coll_added_open, issuance_LUSD[run.name]] = opened[run.name]
+                    run.total_coll_added = run.total_coll_added + coll_added_open
+            else:
+                #close troves
+                engine.each('close', index, lambda run: close_troves(population, run.contracts, run.active_accounts, run.inactive_accounts,
+                    run.price, price_LUSD, index))
+
+                #adjust troves
+                adjusted = engine.each('adjust', index, lambda run: adjust_troves(population, run.contracts, run.active_accounts, run.inactive_accounts,
+                    run.price, index, run.collateral.unit))
+
+                #open troves
+                opened = engine.each('open', index, lambda run: open_troves(openers(population, run), run.contracts, run.active_accounts, run.inactive_accounts,
+                    run.price, price_LUSD, index, run.collateral.unit))
+                issuance_LUSD = {}
+                for run in runs:
+                    [coll_added_adjust, issuance_LUSD_adjust] = adjusted[run.name]
+                    [coll_added_open, issuance_LUSD_open] = opened[run.name]
+                    run.total_coll_added = run.total_coll_added + coll_added_adjust + coll_added_open
+                    issuance_LUSD[run.name] = issuance_LUSD_adjust + issuance_LUSD_open
+                #active_accounts.sort(key=lambda a : a.get('CR_initial'))
+
+                #Stability Pool
+                engine.each('stability_update', index, lambda run: stability_update(population, run.contracts, run.active_accounts,
+                    return_stability[run.name], index))
 
             #Calculating Price, Liquidity Pool, and Redemption
-            [price_LUSD, redemption_pool_eth, redemption_fee_eth, issuance_LUSD_stabilizer_eth] = price_stabilizer(accounts, contracts_eth, active_accounts_eth, inactive_accounts_eth, price_ether_current, price_LUSD, index)
-            issuance_fee_eth = price_LUSD * (issuance_LUSD_adjust_eth + issuance_LUSD_open_eth + issuance_LUSD_stabilizer_eth)
-            total_lusd_redempted = total_lusd_redempted + redemption_pool_eth
-            print('LUSD price', price_LUSD)
-            print('LQTY price', price_LQTY_current)
-
-            [price_LUSD, redemption_pool_btc, redemption_fee_btc, issuance_LUSD_stabilizer_btc] = price_stabilizer(accounts, contracts_btc, active_accounts_btc, inactive_accounts_btc, price_bitcoin_current, price_LUSD, index)
-            issuance_fee_btc = price_LUSD * (issuance_LUSD_adjust_btc + issuance_LUSD_open_btc + issuance_LUSD_stabilizer_btc)
-            total_lusd_redempted = total_lusd_redempted + redemption_pool_btc
-            print('LUSD price', price_LUSD)
-            print('LQTY price', price_LQTY_current)
-
-            # data['issuance_fee'][index] = issuance_fee_eth
-            # data['redemption_fee'][index] = redemption_fee_eth 
-            # data['issuance_fee'][index] = issuance_fee_btc
-            # data['redemption_fee'][index] = redemption_fee_btc            
-            data['issuance_fee'][index] = issuance_fee_eth + issuance_fee_btc
-            data['redemption_fee'][index] = redemption_fee_eth + redemption_fee_btc
+            # the LUSD price goes through the collaterals one after the other
+            issuance_fee = 0
+            redemption_fee = 0
+            for run in runs:
+                with profiler.phase('price_stabilizer', run.label, index):
+                    [price_LUSD, redemption_pool, redemption_fee_coll, issuance_LUSD_stabilizer] = price_stabilizer(openers(population, run), run.contracts,
+                        run.active_accounts, run.inactive_accounts, run.price, price_LUSD, index)
+                # redemptions and the troves opened by the stabilizer bypass the hint index
+                if redemption_pool > 0 or issuance_LUSD_stabilizer > 0:
+                    run.trove_index.sync(stateReader)
+                issuance_fee = issuance_fee + price_LUSD * (issuance_LUSD[run.name] + issuance_LUSD_stabilizer)
+                redemption_fee = redemption_fee + redemption_fee_coll
+                total_lusd_redempted = total_lusd_redempted + redemption_pool
+                print('LUSD price', price_LUSD)
+                print('LQTY price', price_LQTY_current)
+
+            data['issuance_fee'][index] = issuance_fee
+            data['redemption_fee'][index] = redemption_fee
 
             #LQTY Market
-            result_LQTY = LQTY_market(index, data)
+            with profiler.phase('LQTY_market', 'all', index):
+                result_LQTY = LQTY_market(index, data)
             price_LQTY_current = result_LQTY[0]
             #annualized_earning = result_LQTY[1]
             #MC_LQTY_current = result_LQTY[2]
 
-            [ETH_price, num_troves_eth, total_coll_eth, total_debt_eth, TCR_eth, recovery_mode_eth, last_ICR_eth, SP_LUSD_ETH, SP_ETH] = logGlobalState(contracts_eth)
-            # print('Total redempted ', total_lusd_redempted)
-            print('Total ETH added ', total_coll_added_eth)
-            print('Total ETH liquid', total_coll_liquidated_eth)
-            print(f'Ratio ETH liquid {100 * total_coll_liquidated_eth / total_coll_added_eth}%')
-            print(' ----------------------\n')            
-            [BTC_price, num_troves_btc, total_coll_btc, total_debt_btc, TCR_btc, recovery_mode_btc, last_ICR_btc, SP_LUSD_BTC, SP_BTC] = logGlobalState(contracts_btc)            
-            # print('Total redempted ', total_lusd_redempted)
-            print('Total BTC added ', total_coll_added_btc)
-            print('Total BTC liquid', total_coll_liquidated_btc)
-            print(f'Ratio BTC liquid {100 * total_coll_liquidated_btc / total_coll_added_btc}%')
+            # one eth_call for the state of all collaterals
+            with profiler.phase('global_state', 'all', index):
+                global_state = stateReader.read()
+
+            row = {'iteration': index, 'price_LUSD': price_LUSD, 'price_LQTY_current': price_LQTY_current, 'total_lusd_redempted': total_lusd_redempted}
+            for run in runs:
+                symbol = run.collateral.symbol
+                printGlobalState(symbol, global_state[run.name])
+                print(f'Total {symbol} added ', run.total_coll_added)
+                print(f'Total {symbol} liquid', run.total_coll_liquidated)
+                print(f'Ratio {symbol} liquid {100 * run.total_coll_liquidated / run.total_coll_added}%')
+                print(' ----------------------\n')
+                row.update(collateralRow(symbol, list(global_state[run.name]) + [run.total_coll_added, run.total_coll_liquidated]))
             print('Total redempted ', total_lusd_redempted)
-            print(' ----------------------\n')                        
 
-            datawriter.writerow([index, ETH_price, BTC_price, price_LUSD, price_LQTY_current, num_troves_eth, num_troves_btc,
-                total_coll_eth, total_coll_btc, total_debt_eth, total_debt_btc, TCR_eth, TCR_btc, recovery_mode_eth, recovery_mode_btc, 
-                last_ICR_eth, last_ICR_btc, SP_LUSD_ETH, SP_LUSD_BTC, SP_ETH, SP_BTC, total_coll_added_eth, total_coll_added_btc,
-                total_coll_liquidated_eth, total_coll_liquidated_btc, total_lusd_redempted])
+            store.append(**row)
 
             assert price_LUSD > 0
+
+            if checkpoints.due():
+                store.flush()
+                checkpoints.save(index, {run.name: run.contracts for run in runs}, {
+                    'collaterals': {run.name: run.state() for run in runs},
+                    'price_LUSD': price_LUSD,
+                    'price_LQTY_current': price_LQTY_current,
+                    'data': data,
+                    'total_lusd_redempted': total_lusd_redempted,
+                    'funded_accounts': population.fundedAccounts() if poolSize() > 0 else [],
+                }, store.rows)
+
+    exportCSV(resultsDir(), runId(), simulationOutput())
+
+    if mode == MODE_VERIFY:
+        shadow_verifier.print()
@@ -0,0 +1,267 @@
+"""Event-sourced tables of troves and vaults.
+
+Enumerating N troves or vaults through the per-address getters costs O(N) calls every time.
+The indexers here fetch the logs of the new blocks since their last update in a single
+eth_getLogs request and apply them to an in-memory table of debt, coll and status per
+borrower, so the per-iteration read cost only depends on what changed. Queries such as
+"all troves below ICR x" or "total debt" are answered locally with NumPy.
+
+    indexer = TroveIndexer(contracts)
+    indexer.update()                      # once per iteration
+    indexer.below(1.1, price)             # owners below MCR
+    indexer.totalDebt()
+
+Amounts are in whole tokens, coll is scaled by the decimal adjustment of the collateral,
+like state_reader.
+"""
+
+import copy
+
+import numpy as np
+from brownie import web3
+from brownie.network.event import _decode_logs
+
+# Trove status, as in TroveManager.Status
+NON_EXISTENT = 0
+ACTIVE = 1
+CLOSED_BY_OWNER = 2
+CLOSED_BY_LIQUIDATION = 3
+CLOSED_BY_REDEMPTION = 4
+
+# TroveManager.TroveManagerOperation
+LIQUIDATE_IN_NORMAL_MODE = 1
+LIQUIDATE_IN_RECOVERY_MODE = 2
+REDEEM_COLLATERAL = 3
+# AnyTokenVaultOperations.BorrowerOperation
+CLOSE_VAULT = 1
+
+INITIAL_CAPACITY = 1024
+
+
+# TroveManager names its TroveUpdated fields `_stake` and `_operation`, BorrowerOperations `stake` and `operation`
+def eventField(event, name):
+    return event[name] if name in event else event[name.lstrip('_')]
+
+
+class EventIndexer:
+    """
+    Keyed table of borrowers fed by the logs of `addresses`. Subclasses map event names to
+    handlers in `handlers`; events without a handler are skipped.
+    """
+
+    # attributes saved in checkpoints, with the last indexed block
+    STATE = ('rows', 'borrowers', 'debt', 'coll', 'status')
+
+    def __init__(self, addresses, decimal_adjustment=1, from_block=0):
+        self.addresses = [str(address) for address in addresses]
+        self.decimal_adjustment = decimal_adjustment
+        self.last_block = from_block - 1
+        self.handlers = {}
+
+        self.rows = {}
+        self.borrowers = []
+        self.debt = np.zeros(INITIAL_CAPACITY)
+        self.coll = np.zeros(INITIAL_CAPACITY)
+        self.status = np.zeros(INITIAL_CAPACITY, dtype=np.int8)
+
+    def __len__(self):
+        return len(self.borrowers)
+
+    # Applies the events of the blocks mined since the last update; returns the number of events
+    def update(self):
+        latest = web3.eth.block_number
+        if latest <= self.last_block:
+            return 0
+
+        logs = web3.eth.get_logs({'address': self.addresses, 'fromBlock': self.last_block + 1, 'toBlock': latest})
+        events = _decode_logs(logs) if logs else []
+        for event in events:
+            handler = self.handlers.get(event.name)
+            if handler is not None:
+                handler(event)
+
+        self.last_block = latest
+        return len(logs)
+
+    # Table and last indexed block, for checkpoints
+    def state(self):
+        state = {name: copy.copy(getattr(self, name)) for name in self.STATE}
+        state['last_block'] = self.last_block
+        return state
+
+    # Carries on from a state() once the node is back at the same chain state
+    def restore(self, state):
+        for name in self.STATE:
+            setattr(self, name, copy.copy(state[name]))
+        # a node loaded from a dump may number its new blocks from a lower head
+        self.last_block = min(state['last_block'], web3.eth.block_number)
+
+    def row(self, borrower):
+        borrower = str(borrower)
+        i = self.rows.get(borrower)
+        if i is None:
+            i = len(self.borrowers)
+            if i == len(self.debt):
+                self._grow()
+            self.rows[borrower] = i
+            self.borrowers.append(borrower)
+        return i
+
+    def get(self, borrower):
+        i = self.rows.get(str(borrower))
+        if i is None:
+            return 0.0, 0.0, NON_EXISTENT
+        return self.entireDebt()[i], self.entireColl()[i], int(self.status[i])
+
+    # Entire debt, entire coll and status of the given borrowers, in that order
+    def table(self, borrowers):
+        rows = np.array([self.rows.get(str(borrower), -1) for borrower in borrowers])
+        known = rows >= 0
+        debt, coll, status = np.zeros(len(rows)), np.zeros(len(rows)), np.zeros(len(rows), dtype=np.int8)
+        debt[known] = self.entireDebt()[rows[known]]
+        coll[known] = self.entireColl()[rows[known]]
+        status[known] = self.status[rows[known]]
+        return debt, coll, status
+
+    def active(self):
+        return self.status[:len(self.borrowers)] == ACTIVE
+
+    # Debt and coll including anything not written to the table by an event (pending rewards)
+    def entireDebt(self):
+        return self.debt[:len(self.borrowers)]
+
+    def entireColl(self):
+        return self.coll[:len(self.borrowers)]
+
+    def ICR(self, price):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.active(), self.entireColl() * price / self.entireDebt(), np.inf)
+
+    # Active borrowers whose ICR is below `icr`, lowest ICR first
+    def below(self, icr, price):
+        icrs = self.ICR(price)
+        rows = np.flatnonzero(icrs < icr)
+        return [self.borrowers[i] for i in rows[np.argsort(icrs[rows])]]
+
+    def totalDebt(self):
+        return self.entireDebt()[self.active()].sum()
+
+    def totalColl(self):
+        return self.entireColl()[self.active()].sum()
+
+    def count(self):
+        return int(np.count_nonzero(self.active()))
+
+    def _set(self, borrower, debt, coll, status):
+        i = self.row(borrower)
+        self.debt[i] = debt / 1e18
+        self.coll[i] = coll * self.decimal_adjustment / 1e18
+        self.status[i] = status
+        return i
+
+    def _grow(self):
+        self.debt = np.concatenate([self.debt, np.zeros(len(self.debt))])
+        self.coll = np.concatenate([self.coll, np.zeros(len(self.coll))])
+        self.status = np.concatenate([self.status, np.zeros(len(self.status), dtype=np.int8)])
+
+
+class TroveIndexer(EventIndexer):
+    """
+    Troves of one collateral stack, from the TroveUpdated, TroveLiquidated and LTermsUpdated
+    events of TroveManager and BorrowerOperations. Redistributed debt and coll do not emit a
+    per-trove event, so each trove keeps the L terms of its last update and its stake, and the
+    pending rewards are added when reading, as TroveManager.getEntireDebtAndColl does.
+    """
+
+    STATE = EventIndexer.STATE + ('L_coll', 'L_debt', 'stake', 'L_coll_snapshot', 'L_debt_snapshot')
+
+    def __init__(self, contracts, from_block=0):
+        super().__init__([contracts.troveManager.address, contracts.borrowerOperations.address],
+            contracts.decimalAdjustment, from_block)
+        self.trove_manager = str(contracts.troveManager.address)
+        self.L_coll = 0.0
+        self.L_debt = 0.0
+        self.stake = np.zeros(len(self.debt))
+        self.L_coll_snapshot = np.zeros(len(self.debt))
+        self.L_debt_snapshot = np.zeros(len(self.debt))
+        self.handlers = {
+            'TroveUpdated': self._troveUpdated,
+            'TroveLiquidated': self._troveLiquidated,
+            'LTermsUpdated': self._LTermsUpdated,
+        }
+
+    def entireDebt(self):
+        n = len(self.borrowers)
+        return self.debt[:n] + self.stake[:n] * (self.L_debt - self.L_debt_snapshot[:n])
+
+    def entireColl(self):
+        n = len(self.borrowers)
+        return self.coll[:n] + self.stake[:n] * (self.L_coll - self.L_coll_snapshot[:n]) * self.decimal_adjustment
+
+    def _troveUpdated(self, event):
+        debt, coll = event['_debt'], event['_coll']
+        operation = eventField(event, '_operation')
+        if debt > 0:
+            status = ACTIVE
+        elif event.address != self.trove_manager:
+            status = CLOSED_BY_OWNER
+        elif operation == REDEEM_COLLATERAL:
+            status = CLOSED_BY_REDEMPTION
+        elif operation in (LIQUIDATE_IN_NORMAL_MODE, LIQUIDATE_IN_RECOVERY_MODE) or self.status[self.row(event['_borrower'])] == CLOSED_BY_LIQUIDATION:
+            # the zero-debt update TroveManager emits right after TroveLiquidated
+            status = CLOSED_BY_LIQUIDATION
+        else:
+            status = CLOSED_BY_OWNER
+        i = self._set(event['_borrower'], debt, coll, status)
+        self.stake[i] = eventField(event, '_stake') / 1e18
+        self.L_coll_snapshot[i] = self.L_coll
+        self.L_debt_snapshot[i] = self.L_debt
+
+    def _troveLiquidated(self, event):
+        i = self._set(event['_borrower'], 0, 0, CLOSED_BY_LIQUIDATION)
+        self.stake[i] = 0
+
+    def _LTermsUpdated(self, event):
+        self.L_coll = event['_L_ETH'] / 1e18
+        self.L_debt = event['_L_LUSDDebt'] / 1e18
+
+    def _grow(self):
+        super()._grow()
+        self.stake = np.concatenate([self.stake, np.zeros(len(self.stake))])
+        self.L_coll_snapshot = np.concatenate([self.L_coll_snapshot, np.zeros(len(self.L_coll_snapshot))])
+        self.L_debt_snapshot = np.concatenate([self.L_debt_snapshot, np.zeros(len(self.L_debt_snapshot))])
+
+
+class VaultIndexer(EventIndexer):
+    """
+    AnyToken vaults, from the VaultCreated, VaultUpdated and LUSDBorrowingFeePaid events of
+    AnyTokenVaultOperations. `coll_decimal_diff` is AnyTokenVaultOperations.collDecimalDiff.
+    """
+
+    STATE = EventIndexer.STATE + ('fees',)
+
+    def __init__(self, vault_operations, coll_decimal_diff=1, from_block=0):
+        super().__init__([vault_operations.address], coll_decimal_diff, from_block)
+        self.fees = np.zeros(len(self.debt))
+        self.handlers = {
+            'VaultCreated': self._vaultCreated,
+            'VaultUpdated': self._vaultUpdated,
+            'LUSDBorrowingFeePaid': self._borrowingFeePaid,
+        }
+
+    def totalFees(self):
+        return self.fees[:len(self.borrowers)].sum()
+
+    def _vaultCreated(self, event):
+        self.status[self.row(event['_borrower'])] = ACTIVE
+
+    def _vaultUpdated(self, event):
+        status = CLOSED_BY_OWNER if event['operation'] == CLOSE_VAULT else ACTIVE
+        self._set(event['_borrower'], event['_debt'], event['_coll'], status)
+
+    def _borrowingFeePaid(self, event):
+        self.fees[self.row(event['_borrower'])] += event['_LUSDFee'] / 1e18
+
+    def _grow(self):
+        super()._grow()
+        self.fees = np.concatenate([self.fees, np.zeros(len(self.fees))])
@@ -0,0 +1,179 @@
+"""Exact insertion hints for SortedTroves.
+
+Passing ZERO_ADDRESS hints makes SortedTroves walk the list on chain to find the insert
+position, so openTrove/adjustTrove get more expensive as troves accumulate. TroveIndex keeps
+a local copy of the list of one collateral ordered by NICR and answers with the exact
+neighbours of a new NICR, without any RPC.
+
+The index is updated from the chain after each operation going through sendWithHints. When
+troves change behind its back (liquidations, redemptions) call remove()/sync(), or mark it
+stale and the hints fall back to HintHelpers.getApproxHint + findInsertPosition.
+"""
+
+import bisect
+
+from helpers import ZERO_ADDRESS
+
+APPROX_HINT_TRIALS = 50
+
+
+class TroveIndex:
+    def __init__(self, contracts):
+        self.contracts = contracts
+        self.stale = False
+        # Ascending NICR, i.e. the reverse of the SortedTroves order
+        self._nicrs = []
+        self._owners = []
+        self._nicr_of = {}
+
+    def __len__(self):
+        return len(self._owners)
+
+    def __contains__(self, owner):
+        return str(owner) in self._nicr_of
+
+    def nominalCR(self, coll, debt):
+        return self.contracts.hintHelpers.computeNominalCR(coll, debt)
+
+    def insert(self, owner, nicr):
+        owner = str(owner)
+        self.remove(owner)
+        i = bisect.bisect_left(self._nicrs, nicr)
+        self._nicrs.insert(i, nicr)
+        self._owners.insert(i, owner)
+        self._nicr_of[owner] = nicr
+
+    def remove(self, owner):
+        owner = str(owner)
+        nicr = self._nicr_of.pop(owner, None)
+        if nicr is None:
+            return
+        i = bisect.bisect_left(self._nicrs, nicr)
+        while self._owners[i] != owner:
+            i += 1
+        del self._nicrs[i]
+        del self._owners[i]
+
+    # Reads the current NICR of the owner from the chain, dropping it if the trove is closed
+    def refresh(self, owner):
+        if self.contracts.troveManager.getTroveStatus(owner) == 1:
+            self.insert(owner, self.contracts.troveManager.getNominalICR(owner))
+        else:
+            self.remove(owner)
+
+    # Rebuilds the index from the chain; batched through Multicall when a StateReader is given
+    def sync(self, state_reader=None):
+        troveManager = self.contracts.troveManager
+        count = troveManager.getTroveOwnersCount()
+
+        if state_reader is None:
+            owners = [troveManager.getTroveFromTroveOwnersArray(i) for i in range(count)]
+            nicrs = [troveManager.getNominalICR(owner) for owner in owners]
+        else:
+            owners = state_reader.call([(troveManager.getTroveFromTroveOwnersArray, [i]) for i in range(count)])
+            nicrs = state_reader.call([(troveManager.getNominalICR, [owner]) for owner in owners])
+
+        self._nicrs, self._owners, self._nicr_of = [], [], {}
+        for owner, nicr in sorted(zip(owners, nicrs), key=lambda item: item[1]):
+            self._nicrs.append(nicr)
+            self._owners.append(str(owner))
+            self._nicr_of[str(owner)] = nicr
+        self.stale = False
+
+    # Returns (upperHint, lowerHint) for a trove of the given NICR, ignoring `owner` itself
+    def hints(self, nicr, owner=None):
+        if self.stale:
+            return self.approxHints(nicr)
+
+        i = bisect.bisect_left(self._nicrs, nicr)
+        lower = self._neighbour(i - 1, -1, owner)
+        upper = self._neighbour(i, 1, owner)
+        return (upper, lower)
+
+    def approxHints(self, nicr):
+        approx_hint = self.contracts.hintHelpers.getApproxHint(nicr, APPROX_HINT_TRIALS, 42)[0]
+        return self.contracts.sortedTroves.findInsertPosition(nicr, approx_hint, approx_hint)
+
+    # Lowest-NICR trove first, as liquidations walk the list from the tail
+    def owners(self):
+        return list(self._owners)
+
+    def items(self):
+        return list(zip(self._owners, self._nicrs))
+
+    def _neighbour(self, i, step, owner):
+        owner = str(owner) if owner is not None else None
+        while 0 <= i < len(self._owners):
+            if self._owners[i] != owner:
+                return self._owners[i]
+            i += step
+        return ZERO_ADDRESS
+
+
+class HintGasReport:
+    def __init__(self):
+        self.records = []
+
+    def record(self, operation, gas_used, gas_without_hints=None):
+        self.records.append((operation, gas_used, gas_without_hints))
+
+    def summary(self):
+        summary = {}
+        for operation, gas_used, gas_without_hints in self.records:
+            entry = summary.setdefault(operation, {'count': 0, 'gas_used': 0, 'gas_saved': 0, 'measured': 0})
+            entry['count'] += 1
+            entry['gas_used'] += gas_used
+            if gas_without_hints is not None:
+                entry['gas_saved'] += gas_without_hints - gas_used
+                entry['measured'] += 1
+        return summary
+
+    def print(self):
+        print('\n Hint gas report')
+        for operation, entry in self.summary().items():
+            avg_used = entry['gas_used'] / entry['count']
+            avg_saved = entry['gas_saved'] / entry['measured'] if entry['measured'] else float('nan')
+            print(f' {operation:<12} count {entry["count"]:>6}  avg gas {avg_used:>10.0f}  avg saved {avg_saved:>10.0f}')
+
+
+"""
+Sends `fn(*args, upperHint, lowerHint)` with exact hints for a trove ending up with the given
+coll and debt, then updates the index with the resulting NICR.
+
+When a report is given the call is also estimated with ZERO_ADDRESS hints so the gas saved
+by the hints is recorded; this costs one extra eth_call per operation.
+"""
+def sendWithHints(index, fn, args, new_coll, new_debt, tx_params, report=None):
+    hinted_args, gas_without_hints = withHints(index, fn, args, new_coll, new_debt, tx_params, report)
+    tx = fn(*hinted_args, tx_params)
+    recordHints(index, fn, tx, gas_without_hints, tx_params['from'], report)
+    return tx
+
+
+# The two halves of sendWithHints, for transactions whose receipt comes later (pipeline.TxPipeline)
+def withHints(index, fn, args, new_coll, new_debt, tx_params, report=None):
+    nicr = index.nominalCR(new_coll, new_debt)
+    upper, lower = index.hints(nicr, tx_params['from'])
+
+    gas_without_hints = None
+    if report is not None:
+        gas_without_hints = fn.estimate_gas(*args, ZERO_ADDRESS, ZERO_ADDRESS, tx_params)
+
+    return [*args, upper, lower], gas_without_hints
+
+
+def recordHints(index, fn, tx, gas_without_hints, owner, report=None):
+    if report is not None:
+        report.record(fn._name.split('.')[-1], tx.gas_used, gas_without_hints)
+    index.refresh(owner)
+
+
+# openTrove with exact hints; the resulting debt includes the gas compensation and the borrowing fee
+def openTroveWithHints(contracts, index, max_fee, lusd_amount, coll_amount, tx_params, report=None):
+    return sendWithHints(index, *openTroveCall(contracts, max_fee, lusd_amount, coll_amount), tx_params, report)
+
+
+# (fn, args, new_coll, new_debt) of an openTrove, as sendWithHints/withHints take them
+def openTroveCall(contracts, max_fee, lusd_amount, coll_amount):
+    debt = contracts.borrowerOperations.getCompositeDebt(lusd_amount + contracts.troveManager.getBorrowingFee(lusd_amount))
+    return contracts.borrowerOperations.openTrove, [max_fee, lusd_amount, coll_amount], coll_amount, debt
@@ -0,0 +1,75 @@
+from hints import *
+
+
+class TroveManager:
+    def __init__(self, troves):
+        self.troves = troves
+
+    def getTroveStatus(self, owner):
+        return 1 if owner in self.troves else 2
+
+    def getNominalICR(self, owner):
+        return self.troves[owner]
+
+    def getTroveOwnersCount(self):
+        return len(self.troves)
+
+    def getTroveFromTroveOwnersArray(self, i):
+        return list(self.troves)[i]
+
+
+class Contracts:
+    def __init__(self, troves):
+        self.troveManager = TroveManager(troves)
+
+
+def assertSorted(index):
+    nicrs = [nicr for _, nicr in index.items()]
+    assert nicrs == sorted(nicrs)
+    assert all(owner in index for owner in index.owners()) and len(set(index.owners())) == len(index)
+
+
+def test_hints_follow_sorted_troves_order():
+    troves = {'a': 300, 'b': 100, 'c': 200}
+    index = TroveIndex(Contracts(troves))
+    index.sync()
+    assert index.owners() == ['b', 'c', 'a']
+
+    # SortedTroves is in descending NICR: upper is the next higher trove, lower the next lower one
+    assert index.hints(150) == ('c', 'b')
+    assert index.hints(250) == ('a', 'c')
+    assert index.hints(350) == (ZERO_ADDRESS, 'a')
+    assert index.hints(50) == ('b', ZERO_ADDRESS)
+    # a tie goes after the existing trove in the SortedTroves order
+    assert index.hints(200) == ('c', 'b')
+    # the trove being adjusted is not its own neighbour
+    assert index.hints(210, 'c') == ('a', 'b')
+
+
+def test_remove_and_refresh_keep_the_index_sorted():
+    troves = {'a': 300, 'b': 100, 'c': 200, 'd': 200}
+    index = TroveIndex(Contracts(troves))
+    index.sync()
+
+    index.remove('c')
+    assert 'c' not in index
+    assert index.owners() == ['b', 'd', 'a']
+    assertSorted(index)
+    # removing an owner not in the index
+    index.remove('c')
+    assert len(index) == 3
+
+    troves['b'] = 400
+    index.refresh('b')
+    assert index.owners() == ['d', 'a', 'b']
+    assertSorted(index)
+
+    del troves['a']
+    index.refresh('a')
+    assert index.owners() == ['d', 'b']
+    assertSorted(index)
+
+    troves['e'] = 250
+    index.refresh('e')
+    assert index.owners() == ['d', 'e', 'b']
+    assertSorted(index)
@@ -0,0 +1,135 @@
+"""Liquidations planned from the local trove table.
+
+After a price update, liquidateTroves(n) with a fixed n reverts when no trove is below MCR, and
+needs more transactions than necessary when many are. LiquidationPlanner reads the entire debt
+and coll of every trove from an event_indexer.TroveIndexer (one eth_getLogs per update). It then
+sends exactly the troves below MCR at the new price, lowest ICR first, to batchLiquidateTroves,
+at most LIQUIDATION_BATCH_SIZE troves per transaction. Nothing is sent when no trove is below MCR.
+
+    planner = LiquidationPlanner(contracts, TroveIndexer(contracts))
+    planner.liquidate(price, { 'from': accounts[0] })
+
+TroveManager liquidates a batch against the L terms from before the batch and redistributes
+what the stability pool does not cover at the end, so a batch never cascades within itself.
+The redistribution can push more troves below MCR. So after each round the indexer is updated
+and the plan is made again, until no trove is below MCR (at most MAX_LIQUIDATION_ROUNDS rounds).
+
+The table is floating point. A trove whose ICR is within BOUNDARY_RTOL of MCR is decided with
+TroveManager.getCurrentICR. The last trove of the system is never liquidated. In Recovery Mode
+troves between MCR and the TCR can also be liquidated while the stability pool covers their
+debt, and the TCR moves as they go. There the planner sends liquidateTroves with the number of
+troves it expects to go, and TroveManager decides; when that reverts (the TCR moved, or the
+batch does not fit in a block) the count is halved until one liquidation goes through or
+liquidateTroves(1) reverts too.
+
+test_run_simulation runs its liquidation phase through the planner of each CollateralRun.
+"""
+
+import os
+
+import numpy as np
+from brownie.exceptions import VirtualMachineError
+
+from helpers import floatToWei
+
+MAX_LIQUIDATION_ROUNDS = 10
+BOUNDARY_RTOL = 1e-9
+
+
+def liquidationBatchSize():
+    return int(os.environ.get('LIQUIDATION_BATCH_SIZE', '50'))
+
+
+class LiquidationPlanner:
+    def __init__(self, contracts, indexer, batch_size=None):
+        self.contracts = contracts
+        self.indexer = indexer
+        self.batch_size = batch_size or liquidationBatchSize()
+        self.mcr_wei = contracts.troveManager.MCR()
+        self.mcr = self.mcr_wei / 1e18
+
+        self.rounds = 0
+        self.txs = 0
+        self.liquidated = 0
+        self.coll_liquidated = 0.0
+        self.gas_used = 0
+        self.skipped = 0
+
+    # Troves below MCR at `price` in Normal Mode, lowest ICR first; expects an up to date indexer
+    def plan(self, price):
+        icr = self.indexer.ICR(price)
+        rows = np.flatnonzero(icr < self.mcr * (1 + BOUNDARY_RTOL))
+        rows = rows[np.argsort(icr[rows], kind='stable')]
+
+        owners = []
+        for i in rows:
+            owner = self.indexer.borrowers[i]
+            if icr[i] > self.mcr * (1 - BOUNDARY_RTOL) and self.contracts.troveManager.getCurrentICR(owner, floatToWei(price)) >= self.mcr_wei:
+                continue
+            owners.append(owner)
+        # the last trove is never liquidated
+        return owners[:max(self.indexer.count() - 1, 0)]
+
+    # Number of troves liquidateTroves is expected to take in Recovery Mode: below MCR, then below the TCR while the pool covers their debt
+    def recoveryModeCount(self, price):
+        if self.indexer.count() <= 1:
+            return 0
+        icr = self.indexer.ICR(price)
+        debt = self.indexer.entireDebt()
+        tcr = self.indexer.totalColl() * price / self.indexer.totalDebt()
+        sp_lusd = self.contracts.stabilityPool.getTotalLUSDDeposits() / 1e18
+
+        count = 0
+        for i in np.argsort(icr, kind='stable'):
+            if icr[i] >= tcr:
+                break
+            if icr[i] >= self.mcr and debt[i] > sp_lusd:
+                break
+            if icr[i] > 1:
+                sp_lusd -= min(debt[i], sp_lusd)
+            count += 1
+        return min(count, max(self.indexer.count() - 1, 0))
+
+    # Liquidates every trove below MCR at `price`; returns the owners of the liquidated troves
+    def liquidate(self, price, tx_params):
+        troveManager = self.contracts.troveManager
+        liquidated = []
+        txs = self.txs
+        for _ in range(MAX_LIQUIDATION_ROUNDS):
+            self.indexer.update()
+            self.rounds += 1
+            if troveManager.checkRecoveryMode(floatToWei(price)):
+                owners = self._liquidateRecoveryMode(self.recoveryModeCount(price), tx_params)
+                if not owners:
+                    break
+                liquidated += owners
+            else:
+                owners = self.plan(price)
+                if not owners:
+                    break
+                for start in range(0, len(owners), self.batch_size):
+                    liquidated += self._record(troveManager.batchLiquidateTroves(owners[start:start + self.batch_size], tx_params))
+
+        if self.txs == txs:
+            self.skipped += 1
+        self.liquidated += len(liquidated)
+        return liquidated
+
+    def _liquidateRecoveryMode(self, count, tx_params):
+        while count > 0:
+            try:
+                return self._record(self.contracts.troveManager.liquidateTroves(count, tx_params))
+            except VirtualMachineError:
+                count //= 2
+        return []
+
+    def _record(self, tx):
+        self.txs += 1
+        self.gas_used += tx.gas_used
+        events = tx.events['TroveLiquidated'] if 'TroveLiquidated' in tx.events else []
+        self.coll_liquidated += sum(event['_coll'] for event in events) * self.contracts.decimalAdjustment / 1e18
+        return [str(event['_borrower']) for event in events]
+
+    def print(self):
+        print(f'\n Liquidation planner: {self.liquidated} troves in {self.txs} transactions over {self.rounds} rounds, '
+            f'{self.gas_used} gas, {self.skipped} price updates without liquidation')
@@ -0,0 +1,209 @@
+"""Monte Carlo runner: many independent simulation runs across a process pool.
+
+Every run gets its own seed, its own price paths, its own local dev node on its own port and
+its own run in the result store. Runs go through `brownie test` so they execute exactly like a normal
+simulation run. Once all runs finish, the per-iteration metrics are merged into distributions
+across runs (liquidation ratio, TCR and LUSD price quantiles).
+
+    python tests/monte_carlo.py --runs 200 --workers 16
+
+The simulation picks up its scenario from the environment:
+
+- SIMULATION_SEED seeds the `random` and NumPy global generators used by the agents
+- SIMULATION_PRICES points to a price_paths file (.npy) and SIMULATION_PATH_ID selects the path
+  of the run, or to a .npz file with `price_ether` and `price_bitcoin` arrays; collaterals pick
+  their series by name (see collaterals.py)
+- SIMULATION_RESULTS and SIMULATION_RUN_ID select the result store run written by test_run_simulation
+- SIMULATION_OUTPUT is the CSV export of that run
+- CHECKPOINT_DIR and PROFILE_TRACE are kept under the run's directory, so concurrent runs never
+  share checkpoints or traces
+"""
+
+import argparse
+import csv
+import os
+import random
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from price_paths import PathModel, writePaths, readPath
+from results import openRun
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def seedSimulation():
+    seed = os.environ.get('SIMULATION_SEED')
+    if seed is not None:
+        random.seed(int(seed))
+        np.random.seed(int(seed))
+
+
+# Price series of the scenario keyed by name if one is set, the given defaults otherwise
+def scenarioPrices(default_prices):
+    path = os.environ.get('SIMULATION_PRICES')
+    if path is None:
+        return default_prices
+    if path.endswith('.npy'):
+        return readPath(path, int(os.environ.get('SIMULATION_PATH_ID', '0')))
+    prices = np.load(path)
+    return {'ETH': list(prices['price_ether']), 'BTC': list(prices['price_bitcoin'])}
+
+
+def simulationOutput():
+    return os.environ.get('SIMULATION_OUTPUT', 'tests/simulation.csv')
+
+
+# Brownie dev network of one worker slot, also used by vault_fuzzer.py
+def addNetwork(network_id, port, node_cmd):
+    subprocess.run(['brownie', 'networks', 'add', 'Development', network_id, 'host=http://127.0.0.1',
+        f'cmd={node_cmd}', f'port={port}'], check=True, capture_output=True)
+
+
+def deleteNetwork(network_id):
+    subprocess.run(['brownie', 'networks', 'delete', network_id], capture_output=True)
+
+
+def runOne(run_id, seed, port, prices_path, output_dir, test_path):
+    run_dir = os.path.join(output_dir, f'run_{run_id}')
+    env = dict(os.environ,
+        SIMULATION_SEED=str(seed),
+        SIMULATION_PRICES=prices_path,
+        SIMULATION_PATH_ID=str(run_id),
+        SIMULATION_RESULTS=output_dir,
+        SIMULATION_RUN_ID=f'run_{run_id}',
+        SIMULATION_OUTPUT=os.path.join(output_dir, f'run_{run_id}.csv'),
+        CHECKPOINT_DIR=os.path.join(run_dir, 'checkpoints'),
+        PROFILE_TRACE=os.path.join(run_dir, 'profile.jsonl'))
+
+    with open(os.path.join(output_dir, f'run_{run_id}.log'), 'w') as log:
+        result = subprocess.run(['brownie', 'test', f'{test_path}::test_run_simulation', '--network', f'mc-{port}'],
+            env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    return run_id, result.returncode
+
+
+def readRun(output_dir, run_id):
+    columns = openRun(output_dir, f'run_{run_id}')
+
+    def column(name):
+        return np.asarray(columns[name], dtype=float)
+
+    # one TCR column per collateral of the run
+    symbols = [name[len('TCR_'):] for name in columns if name.startswith('TCR_')]
+    metrics = {'iteration': column('iteration')}
+    for symbol in symbols:
+        metrics[f'liquidation_ratio_{symbol}'] = column(f'total_coll_liquidated_{symbol}') / column(f'total_coll_added_{symbol}')
+    for symbol in symbols:
+        metrics[f'TCR_{symbol}'] = column(f'TCR_{symbol}')
+    metrics['price_LUSD'] = column('price_LUSD')
+    return metrics
+
+
+def metricNames(run):
+    return [name for name in run if name != 'iteration']
+
+
+# Quantiles across runs of every metric at every iteration; runs that died early are cut to the shortest run
+def aggregate(runs):
+    n_iterations = min(len(run['iteration']) for run in runs)
+    summary = {'iteration': runs[0]['iteration'][:n_iterations]}
+    for metric in metricNames(runs[0]):
+        values = np.vstack([run[metric][:n_iterations] for run in runs])
+        for q, row in zip(QUANTILES, np.quantile(values, QUANTILES, axis=0)):
+            summary[f'{metric}_q{int(q * 100)}'] = row
+    return summary
+
+
+def writeSummary(summary, path):
+    columns = list(summary)
+    with open(path, 'w', newline='') as csvfile:
+        datawriter = csv.writer(csvfile, delimiter=',')
+        datawriter.writerow(columns)
+        for row in zip(*(summary[column] for column in columns)):
+            datawriter.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run many simulation seeds in parallel')
+    parser.add_argument('--runs', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--base-port', type=int, default=8600)
+    parser.add_argument('--node-cmd', default='ganache-cli')
+    parser.add_argument('--output-dir', default='tests/monte_carlo')
+    parser.add_argument('--test-path', default='tests/e2e_simulation_test.py')
+    parser.add_argument('--steps', type=int, default=8760)
+    parser.add_argument('--initial-ether', type=float, default=2000)
+    parser.add_argument('--initial-bitcoin', type=float, default=50000)
+    parser.add_argument('--sd-ether', type=float, default=0.02)
+    parser.add_argument('--sd-bitcoin', type=float, default=0.015)
+    parser.add_argument('--correlation', type=float, default=0.8)
+    parser.add_argument('--jump-intensity', type=float, default=0.0)
+    parser.add_argument('--jump-mean', type=float, default=-0.05)
+    parser.add_argument('--jump-sd', type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # all price paths in one memory-mapped file; run i reads path i
+    model = PathModel([args.initial_ether, args.initial_bitcoin], sd=[args.sd_ether, args.sd_bitcoin],
+        correlation=[[1, args.correlation], [args.correlation, 1]], jump_intensity=args.jump_intensity,
+        jump_mean=[args.jump_mean] * 2, jump_sd=[args.jump_sd] * 2)
+    prices_path = os.path.join(args.output_dir, 'paths.npy')
+    writePaths(prices_path, model, args.runs, args.steps, args.first_seed, ['ETH', 'BTC'])
+
+    # One dev network per worker slot; a port is only reused once the previous run on it is done
+    ports = [args.base_port + i for i in range(args.workers)]
+    for port in ports:
+        addNetwork(f'mc-{port}', port, args.node_cmd)
+
+    try:
+        results = []
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            free_ports = list(ports)
+            pending = {}
+            runs = iter(range(args.runs))
+
+            def submit(run_id, port):
+                seed = args.first_seed + run_id
+                future = executor.submit(runOne, run_id, seed, port, prices_path, args.output_dir, args.test_path)
+                pending[future] = port
+
+            for run_id, port in zip(runs, free_ports):
+                submit(run_id, port)
+
+            while pending:
+                future = next(as_completed(pending))
+                port = pending.pop(future)
+                run_id, returncode = future.result()
+                print(f'run {run_id} finished with code {returncode}')
+                results.append((run_id, returncode))
+
+                next_run = next(runs, None)
+                if next_run is not None:
+                    submit(next_run, port)
+    finally:
+        for port in ports:
+            deleteNetwork(f'mc-{port}')
+
+    completed = [readRun(args.output_dir, run_id) for run_id, returncode in sorted(results)
+        if returncode == 0 and os.path.exists(os.path.join(args.output_dir, f'run_{run_id}', 'schema.json'))]
+    print(f'{len(completed)} of {args.runs} runs completed')
+    if not completed:
+        return
+
+    summary = aggregate(completed)
+    summary_path = os.path.join(args.output_dir, 'summary.csv')
+    writeSummary(summary, summary_path)
+
+    for metric in metricNames(completed[0]):
+        final = [summary[f'{metric}_q{int(q * 100)}'][-1] for q in QUANTILES]
+        print(f'{metric:<24} final quantiles {QUANTILES}: {np.round(final, 4).tolist()}')
+    print(f'Summary written to {summary_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Pipelined transaction submission with manual block mining.
+
+With automine on, a dev node mines one block per transaction and brownie waits for each
+receipt before sending the next one. Inside a TxPipeline automine is off: transactions are
+sent without waiting, blocks are mined until the whole batch is in and the receipts are
+collected afterwards. Reverts are reported against the agent that sent the transaction.
+
+A block takes transactions while their gas limits fit in the block gas limit, so each
+transaction's limit is its gas estimate times PIPELINE_GAS_HEADROOM. The estimate runs against
+the last mined block, without the transactions sent before it in the batch. When it reverts
+there (e.g. an openTrove whose approve is still pending), PIPELINE_GAS_LIMIT is used, and the
+batch may take a few more blocks.
+
+    with TxPipeline() as pipeline:
+        for i in agents:
+            pipeline.send(i, contracts.borrowerOperations.closeTrove, { 'from': accounts[i] })
+    for result in pipeline.results: ...
+
+TX_PIPELINE=1 turns pipelining on in test_run_simulation, for the price updates and for the
+actions of the vectorized agent engine (agent_engine.sendActions).
+"""
+
+import os
+from collections import namedtuple
+
+from brownie import chain, web3
+from web3.exceptions import TransactionNotFound
+
+# gas limit of pipelined transactions whose estimate reverts
+PIPELINE_GAS_LIMIT = 3000000
+# margin over the estimate, for the state the transactions before it in the batch leave
+PIPELINE_GAS_HEADROOM = 1.5
+
+TxResult = namedtuple('TxResult', ['agent', 'function', 'tx', 'reverted', 'revert_msg'])
+
+
+def pipelineEnabled():
+    return os.environ.get('TX_PIPELINE', '0') == '1'
+
+
+def _setAutomine(enabled):
+    response = web3.provider.make_request('evm_setAutomine', [enabled])
+    if 'error' in response:
+        # ganache
+        web3.provider.make_request('miner_start' if enabled else 'miner_stop', [])
+
+
+def _isMined(txid):
+    try:
+        return web3.eth.get_transaction_receipt(txid) is not None
+    except TransactionNotFound:
+        return False
+
+
+class TxPipeline:
+    def __init__(self, gas_limit=PIPELINE_GAS_LIMIT):
+        self.gas_limit = gas_limit
+        self.pending = []
+        self.results = []
+
+    def __enter__(self):
+        _setAutomine(False)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.pending:
+                self.mine()
+        finally:
+            _setAutomine(True)
+
+    # Sends fn(*args) without waiting for it to be mined
+    def send(self, agent, fn, *args):
+        *args, tx_params = args
+        tx_params = dict(tx_params, required_confs=0, allow_revert=True)
+        if 'gas_limit' not in tx_params:
+            tx_params['gas_limit'] = self.gasLimit(fn, args, tx_params)
+        tx = fn(*args, tx_params)
+        self.pending.append((agent, fn._name, tx))
+        return tx
+
+    def gasLimit(self, fn, args, tx_params):
+        try:
+            return int(fn.estimate_gas(*args, { 'from': tx_params['from'] }) * PIPELINE_GAS_HEADROOM)
+        except ValueError:
+            return self.gas_limit
+
+    # Mines blocks until every pending transaction is in (usually one block), and collects the receipts
+    def mine(self):
+        for _ in range(len(self.pending)):
+            chain.mine()
+            if all(_isMined(tx.txid) for _, _, tx in self.pending):
+                break
+
+        results = []
+        for agent, function, tx in self.pending:
+            tx.wait(1)
+            reverted = tx.status == 0
+            results.append(TxResult(agent, function, tx, reverted, tx.revert_msg if reverted else None))
+        self.pending = []
+        self.results.extend(results)
+        return results
+
+    def reverts(self):
+        return [result for result in self.results if result.reverted]
@@ -0,0 +1,117 @@
+"""Batch generation of correlated collateral price paths, stored in a memory-mapped file.
+
+PathModel describes hourly log-returns for any number of collaterals: a geometric brownian
+motion with correlated shocks, market-wide jumps (Poisson arrivals shared by all
+collaterals, normal log jump size per collateral), and Markov regime shifts that scale the
+drift and volatility of every collateral. generatePaths draws many paths at once with NumPy;
+writePaths writes them in batches to a .npy file, with the collateral names in a .json file
+next to it. Workers open the file with mmap, so thousands of paths are shared without a copy
+per worker:
+
+    model = PathModel([2000, 50000], sd=[0.02, 0.015], correlation=[[1, 0.8], [0.8, 1]])
+    writePaths('tests/paths.npy', model, 1000, 8760, seed=1, names=['ETH', 'BTC'])
+
+    paths, names = openPaths('tests/paths.npy')    # paths[path_id, step, collateral]
+
+With SIMULATION_PRICES pointing to such a file, test_run_simulation runs path
+SIMULATION_PATH_ID of it, each collateral reading the series of its name (see
+monte_carlo.scenarioPrices and collaterals.py).
+"""
+
+import json
+import os
+
+import numpy as np
+
+PATH_BATCH = 256
+
+
+class PathModel:
+    """
+    Per-step parameters; `drift` and `sd` are per collateral. `regimes` is a list of (drift
+    multiplier, sd multiplier) with `transition[i][j]` the probability of moving from regime
+    i to regime j at each step; every path starts in regime 0.
+    """
+
+    def __init__(self, initial, drift=None, sd=None, correlation=None, jump_intensity=0.0, jump_mean=None,
+            jump_sd=None, regimes=((1.0, 1.0),), transition=((1.0,),)):
+        n = len(initial)
+        self.initial = np.asarray(initial, dtype=float)
+        self.drift = np.zeros(n) if drift is None else np.asarray(drift, dtype=float)
+        self.sd = np.full(n, 0.01) if sd is None else np.asarray(sd, dtype=float)
+        self.correlation = np.eye(n) if correlation is None else np.asarray(correlation, dtype=float)
+        self.jump_intensity = jump_intensity
+        self.jump_mean = np.zeros(n) if jump_mean is None else np.asarray(jump_mean, dtype=float)
+        self.jump_sd = np.zeros(n) if jump_sd is None else np.asarray(jump_sd, dtype=float)
+        self.regimes = np.asarray(regimes, dtype=float)
+        self.transition = np.asarray(transition, dtype=float)
+        self.cholesky = np.linalg.cholesky(self.correlation)
+
+    def __len__(self):
+        return len(self.initial)
+
+    def regimePaths(self, rng, n_paths, n_steps):
+        regimes = np.zeros((n_paths, n_steps), dtype=np.int64)
+        if len(self.regimes) == 1:
+            return regimes
+        cumulative = np.cumsum(self.transition, axis=1)
+        draws = rng.random((n_paths, n_steps))
+        for step in range(1, n_steps):
+            previous = regimes[:, step - 1]
+            regimes[:, step] = (draws[:, step, None] > cumulative[previous]).sum(axis=1)
+        return np.minimum(regimes, len(self.regimes) - 1)
+
+    # Log-returns of shape (n_paths, n_steps - 1, collaterals)
+    def logReturns(self, rng, n_paths, n_steps):
+        n = len(self)
+        regimes = self.regimePaths(rng, n_paths, n_steps)[:, 1:]
+        drift_scale = self.regimes[regimes, 0][..., None]
+        sd_scale = self.regimes[regimes, 1][..., None]
+
+        sd = self.sd * sd_scale
+        shocks = rng.standard_normal((n_paths, n_steps - 1, n)) @ self.cholesky.T
+        returns = self.drift * drift_scale - 0.5 * np.square(sd) + sd * shocks
+
+        if self.jump_intensity > 0:
+            jumps = rng.poisson(self.jump_intensity, (n_paths, n_steps - 1, 1))
+            sizes = self.jump_mean * jumps + self.jump_sd * np.sqrt(jumps) * rng.standard_normal((n_paths, n_steps - 1, n))
+            returns += sizes
+        return returns
+
+
+def generatePaths(model, n_paths, n_steps, rng):
+    returns = model.logReturns(rng, n_paths, n_steps)
+    log_paths = np.concatenate([np.zeros((n_paths, 1, len(model))), np.cumsum(returns, axis=1)], axis=1)
+    return np.exp(log_paths) * model.initial
+
+
+# Writes n_paths paths to `path` PATH_BATCH at a time; batch b is drawn from the generator seeded with [seed, b]
+def writePaths(path, model, n_paths, n_steps, seed, names):
+    if len(names) != len(model):
+        raise ValueError('one name per collateral is needed')
+
+    paths = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n_paths, n_steps, len(model)))
+    for batch, first in enumerate(range(0, n_paths, PATH_BATCH)):
+        count = min(PATH_BATCH, n_paths - first)
+        paths[first:first + count] = generatePaths(model, count, n_steps, np.random.default_rng([seed, batch]))
+    paths.flush()
+    del paths
+
+    with open(_metadataPath(path), 'w') as f:
+        json.dump({'names': list(names), 'seed': seed, 'n_paths': n_paths, 'n_steps': n_steps}, f)
+
+
+def openPaths(path):
+    with open(_metadataPath(path)) as f:
+        names = json.load(f)['names']
+    return np.load(path, mmap_mode='r'), names
+
+
+# Price path of every collateral of path `path_id`, keyed by name, as read-only views into the file
+def readPath(path, path_id):
+    paths, names = openPaths(path)
+    return {name: paths[path_id, :, i] for i, name in enumerate(names)}
+
+
+def _metadataPath(path):
+    return os.path.splitext(path)[0] + '.json'
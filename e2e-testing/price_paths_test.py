@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from price_paths import *
+
+MODEL = PathModel([2000, 50000], sd=[0.02, 0.015], correlation=[[1, 0.8], [0.8, 1]], jump_intensity=0.01,
+    jump_mean=[-0.05, -0.04], jump_sd=[0.02, 0.02], regimes=((1.0, 1.0), (-1.0, 2.0)), transition=((0.99, 0.01), (0.05, 0.95)))
+
+
+def test_write_read_round_trip(tmp_path):
+    path = str(tmp_path / 'paths.npy')
+    writePaths(path, MODEL, 300, 50, seed=1, names=['ETH', 'BTC'])
+
+    paths, names = openPaths(path)
+    assert names == ['ETH', 'BTC']
+    assert paths.shape == (300, 50, 2)
+    assert np.all(paths[:, 0] == MODEL.initial)
+    assert np.all(paths > 0)
+
+    prices = readPath(path, 270)
+    assert list(prices) == ['ETH', 'BTC']
+    assert np.array_equal(prices['ETH'], paths[270, :, 0])
+    assert np.array_equal(prices['BTC'], paths[270, :, 1])
+
+
+def test_paths_are_reproducible(tmp_path):
+    first = str(tmp_path / 'first.npy')
+    second = str(tmp_path / 'second.npy')
+    other = str(tmp_path / 'other.npy')
+    writePaths(first, MODEL, 300, 50, seed=1, names=['ETH', 'BTC'])
+    writePaths(second, MODEL, 300, 50, seed=1, names=['ETH', 'BTC'])
+    writePaths(other, MODEL, 300, 50, seed=2, names=['ETH', 'BTC'])
+
+    assert np.array_equal(openPaths(first)[0], openPaths(second)[0])
+    assert not np.array_equal(openPaths(first)[0], openPaths(other)[0])
+    # batch b is drawn from the seed [seed, b] whatever the number of paths
+    assert np.array_equal(readPath(first, 10)['ETH'], generatePaths(MODEL, PATH_BATCH, 50, np.random.default_rng([1, 0]))[10, :, 0])
+
+
+def test_one_name_per_collateral(tmp_path):
+    with pytest.raises(ValueError):
+        writePaths(str(tmp_path / 'paths.npy'), MODEL, 10, 50, seed=1, names=['ETH'])
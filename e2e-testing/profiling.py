@@ -0,0 +1,142 @@
+"""Per-phase wall-clock, RPC and gas instrumentation of the simulation loop.
+
+    profiler = PhaseProfiler('tests/simulation_profile.jsonl')
+    with profiler.phase('liquidation', 'eth', index):
+        liquidate_troves(...)
+    profiler.print()
+
+Every phase run appends one JSON line to the trace file with its wall-clock time, number of
+JSON-RPC requests, number of transactions and gas used. print() summarizes each phase and
+collateral with percentiles across iterations.
+
+Phases may run at the same time on the worker threads of collateral_engine.CollateralEngine.
+Requests are counted per thread, so a phase only counts its own. Transactions are only known
+from the process-wide brownie history, so a phase that overlapped another one records no tx and
+gas counts (null in the trace, left out of the summary).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from brownie import history, web3
+
+PERCENTILES = [50, 90, 99]
+
+
+def profileTracePath():
+    return os.environ.get('PROFILE_TRACE', 'tests/simulation_profile.jsonl')
+
+
+class RPCCounter:
+    def __init__(self):
+        self._thread = threading.local()
+        self._make_request = None
+
+    # Requests sent by the calling thread so far
+    @property
+    def count(self):
+        return getattr(self._thread, 'count', 0)
+
+    # Counts the requests going through the web3 provider brownie is connected to
+    def install(self):
+        provider = web3.provider
+        self._make_request = provider.make_request
+
+        def make_request(method, params):
+            self._thread.count = self.count + 1
+            return self._make_request(method, params)
+
+        provider.make_request = make_request
+
+    def uninstall(self):
+        if self._make_request is not None:
+            del web3.provider.make_request
+            self._make_request = None
+
+
+class PhaseProfiler:
+    def __init__(self, trace_path=None):
+        self.records = []
+        self.rpc = RPCCounter()
+        self.rpc.install()
+        if trace_path:
+            os.makedirs(os.path.dirname(trace_path) or '.', exist_ok=True)
+        self.trace = open(trace_path, 'w') if trace_path else None
+        # phases running now, and those of them that overlapped another one
+        self._lock = threading.Lock()
+        self._running = set()
+        self._overlapped = set()
+
+    @contextmanager
+    def phase(self, name, collateral, iteration):
+        token = object()
+        with self._lock:
+            if self._running:
+                self._overlapped.update(self._running)
+                self._overlapped.add(token)
+            self._running.add(token)
+
+        rpc_start = self.rpc.count
+        tx_start = len(history)
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - time_start
+            with self._lock:
+                self._running.discard(token)
+                overlapped = token in self._overlapped
+                self._overlapped.discard(token)
+            txs = None if overlapped else history[tx_start:]
+            record = {
+                'iteration': iteration,
+                'phase': name,
+                'collateral': collateral,
+                'time': elapsed,
+                'rpc': self.rpc.count - rpc_start,
+                'txs': None if overlapped else len(txs),
+                'gas': None if overlapped else sum(tx.gas_used or 0 for tx in txs),
+            }
+            with self._lock:
+                self.records.append(record)
+                if self.trace is not None:
+                    self.trace.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        groups = {}
+        for record in self.records:
+            groups.setdefault((record['phase'], record['collateral']), []).append(record)
+
+        summary = {}
+        for key, records in groups.items():
+            entry = {'count': len(records)}
+            for metric in ('time', 'rpc', 'gas'):
+                values = np.array([record[metric] for record in records if record[metric] is not None], dtype=float)
+                if len(values) == 0:
+                    entry[metric] = None
+                    continue
+                entry[metric] = {'total': values.sum(), **{f'p{p}': np.percentile(values, p) for p in PERCENTILES}}
+            summary[key] = entry
+        return summary
+
+    def print(self):
+        summary = self.summary()
+        total_time = sum(entry['time']['total'] for entry in summary.values()) or 1
+
+        print('\n Phase profile')
+        print(f' {"phase":<18} {"coll":<5} {"time %":>7} {"time p50":>9} {"time p99":>9} {"rpc p50":>8} {"rpc p99":>8} {"gas p50":>10} {"gas p99":>10}')
+        for (phase, collateral), entry in sorted(summary.items(), key=lambda item: -item[1]['time']['total']):
+            time_share = 100 * entry['time']['total'] / total_time
+            gas = f'{entry["gas"]["p50"]:>10.0f} {entry["gas"]["p99"]:>10.0f}' if entry['gas'] is not None else f'{"-":>10} {"-":>10}'
+            print(f' {phase:<18} {collateral:<5} {time_share:>6.1f}% {entry["time"]["p50"]:>9.3f} {entry["time"]["p99"]:>9.3f}'
+                f' {entry["rpc"]["p50"]:>8.0f} {entry["rpc"]["p99"]:>8.0f} {gas}')
+
+    def close(self):
+        self.rpc.uninstall()
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
@@ -0,0 +1,174 @@
+"""Columnar store of the per-iteration simulation results.
+
+Each run writes to its own directory `<path>/<run_id>/`, one raw little-endian binary file per
+column plus a `schema.json` with the column dtypes. Rows are buffered in typed NumPy arrays and
+appended to the column files CHUNK_SIZE rows at a time, so several runs (e.g. the Monte Carlo
+workers) append to the same store concurrently without sharing any file.
+
+    store = ResultStore('tests/results', 'seed_42', SIMULATION_COLUMNS)
+    store.append(iteration=24, ETH_price=2000.0, ...)
+    store.close()
+
+    columns = openRun('tests/results', 'seed_42')   # dict of read-only np.memmap
+    columns['TCR_eth'][-100:]
+
+exportCSV writes a run in the same layout as the former tests/simulation.csv.
+"""
+
+import csv
+import json
+import os
+
+import numpy as np
+
+CHUNK_SIZE = 256
+
+# Per-collateral columns: the global state of the collateral followed by its running totals. The
+# symbol goes in lower or upper case as in the former CSV header (TCR_eth, SP_LUSD_ETH)
+COLLATERAL_COLUMNS = [
+    ('{SYMBOL}_price', '<f8'),
+    ('num_troves_{symbol}', '<i8'),
+    ('total_coll_{symbol}', '<f8'),
+    ('total_debt_{symbol}', '<f8'),
+    ('TCR_{symbol}', '<f8'),
+    ('recovery_mode_{symbol}', '?'),
+    ('last_ICR_{symbol}', '<f8'),
+    ('SP_LUSD_{SYMBOL}', '<f8'),
+    ('SP_{SYMBOL}', '<f8'),
+    ('total_coll_added_{symbol}', '<f8'),
+    ('total_coll_liquidated_{symbol}', '<f8'),
+]
+
+
+def collateralColumn(template, symbol):
+    return template.format(symbol=symbol.lower(), SYMBOL=symbol.upper())
+
+
+# Columns of a run over the collaterals with the given symbols, each metric grouped across collaterals
+def simulationColumns(symbols):
+    (price_template, price_dtype), *templates = COLLATERAL_COLUMNS
+    columns = [('iteration', '<i8')]
+    columns += [(collateralColumn(price_template, symbol), price_dtype) for symbol in symbols]
+    columns += [('price_LUSD', '<f8'), ('price_LQTY_current', '<f8')]
+    for template, dtype in templates:
+        columns += [(collateralColumn(template, symbol), dtype) for symbol in symbols]
+    columns.append(('total_lusd_redempted', '<f8'))
+    return columns
+
+
+# Row values of one collateral, given in the order of COLLATERAL_COLUMNS
+def collateralRow(symbol, values):
+    return {collateralColumn(template, symbol): value for (template, _), value in zip(COLLATERAL_COLUMNS, values)}
+
+
+SIMULATION_COLUMNS = simulationColumns(['ETH', 'BTC'])
+
+
+def resultsDir():
+    return os.environ.get('SIMULATION_RESULTS', 'tests/results')
+
+
+def runId():
+    return os.environ.get('SIMULATION_RUN_ID', 'default')
+
+
+def _columnPath(run_path, name):
+    return os.path.join(run_path, f'{name}.bin')
+
+
+def _readSchema(run_path):
+    with open(os.path.join(run_path, 'schema.json')) as f:
+        return [(name, dtype) for name, dtype in json.load(f)['columns']]
+
+
+class ResultStore:
+    def __init__(self, path, run_id, columns, chunk_size=CHUNK_SIZE, resume=False):
+        self.run_path = os.path.join(path, run_id)
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.chunk_size = chunk_size
+        self.buffer = {name: np.zeros(chunk_size, dtype=dtype) for name, dtype in self.columns}
+        self.buffered = 0
+
+        os.makedirs(self.run_path, exist_ok=True)
+        if resume:
+            if [name for name, _ in _readSchema(self.run_path)] != [name for name, _ in self.columns]:
+                raise ValueError(f'{self.run_path} was written with other columns')
+        else:
+            with open(os.path.join(self.run_path, 'schema.json'), 'w') as f:
+                json.dump({'columns': [[name, dtype.str] for name, dtype in self.columns]}, f)
+            for name, _ in self.columns:
+                open(_columnPath(self.run_path, name), 'wb').close()
+
+        self.flushed = self._storedRows()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def rows(self):
+        return self.flushed + self.buffered
+
+    def append(self, **row):
+        if self.buffered == self.chunk_size:
+            self.flush()
+        for name, _ in self.columns:
+            self.buffer[name][self.buffered] = row[name]
+        self.buffered += 1
+
+    def flush(self):
+        if self.buffered == 0:
+            return
+        for name, _ in self.columns:
+            with open(_columnPath(self.run_path, name), 'ab') as f:
+                f.write(self.buffer[name][:self.buffered].tobytes())
+        self.flushed += self.buffered
+        self.buffered = 0
+
+    # Drops every row after the first n_rows, e.g. the rows written after a checkpoint
+    def truncate(self, n_rows):
+        self.flush()
+        for name, dtype in self.columns:
+            with open(_columnPath(self.run_path, name), 'r+b') as f:
+                f.truncate(n_rows * dtype.itemsize)
+        self.flushed = self._storedRows()
+
+    def close(self):
+        self.flush()
+
+    def _storedRows(self):
+        # a column file can be ahead of the others if a flush was interrupted
+        return min(os.path.getsize(_columnPath(self.run_path, name)) // dtype.itemsize for name, dtype in self.columns)
+
+
+# Columns of one run as read-only memory maps, without loading them
+def openRun(path, run_id):
+    run_path = os.path.join(path, run_id)
+    schema = [(name, np.dtype(dtype)) for name, dtype in _readSchema(run_path)]
+    n_rows = min(os.path.getsize(_columnPath(run_path, name)) // dtype.itemsize for name, dtype in schema)
+
+    columns = {}
+    for name, dtype in schema:
+        if n_rows == 0:
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(_columnPath(run_path, name), dtype=dtype, mode='r', shape=(n_rows,))
+    return columns
+
+
+def listRuns(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(run_id for run_id in os.listdir(path) if os.path.exists(os.path.join(path, run_id, 'schema.json')))
+
+
+def exportCSV(path, run_id, csv_path):
+    columns = openRun(path, run_id)
+    names = list(columns)
+    with open(csv_path, 'w', newline='') as csvfile:
+        datawriter = csv.writer(csvfile, delimiter=',')
+        datawriter.writerow(names)
+        for row in zip(*(columns[name].tolist() for name in names)):
+            datawriter.writerow(row)
@@ -0,0 +1,56 @@
+import csv
+
+import numpy as np
+import pytest
+
+from results import *
+
+COLUMNS = [('iteration', '<i8'), ('TCR_eth', '<f8'), ('recovery_mode_eth', '?')]
+
+
+def appendRows(store, iterations):
+    for i in iterations:
+        store.append(iteration=i, TCR_eth=1.5 + i / 100, recovery_mode_eth=i % 2 == 0)
+
+
+def test_store_resume_and_truncate(tmp_path):
+    with ResultStore(str(tmp_path), 'run', COLUMNS, chunk_size=4) as store:
+        appendRows(store, range(10))
+        assert store.rows == 10
+
+    # rows written after a checkpoint at row 6 are dropped on resume
+    with ResultStore(str(tmp_path), 'run', COLUMNS, chunk_size=4, resume=True) as store:
+        assert store.rows == 10
+        store.truncate(6)
+        assert store.rows == 6
+        appendRows(store, range(6, 9))
+
+    columns = openRun(str(tmp_path), 'run')
+    assert columns['iteration'].tolist() == list(range(9))
+    assert np.allclose(columns['TCR_eth'], [1.5 + i / 100 for i in range(9)])
+    assert columns['recovery_mode_eth'].tolist() == [i % 2 == 0 for i in range(9)]
+
+
+def test_resume_with_other_columns(tmp_path):
+    ResultStore(str(tmp_path), 'run', COLUMNS).close()
+    with pytest.raises(ValueError):
+        ResultStore(str(tmp_path), 'run', COLUMNS[:2], resume=True)
+
+
+def test_export_csv_column_order(tmp_path):
+    columns = simulationColumns(['ETH', 'BTC'])
+    with ResultStore(str(tmp_path), 'run', columns) as store:
+        row = {name: 0 for name, _ in columns}
+        row.update(collateralRow('ETH', [2000.0, 3, 10.0, 6000.0, 3.33, False, 1.2, 100.0, 0.5, 1.0, 0.0]))
+        store.append(**row)
+
+    csv_path = tmp_path / 'simulation.csv'
+    exportCSV(str(tmp_path), 'run', str(csv_path))
+    with open(csv_path, newline='') as csvfile:
+        header, values = list(csv.reader(csvfile))
+
+    assert header == [name for name, _ in columns]
+    assert header[:5] == ['iteration', 'ETH_price', 'BTC_price', 'price_LUSD', 'price_LQTY_current']
+    assert header[-1] == 'total_lusd_redempted'
+    assert float(values[header.index('TCR_eth')]) == 3.33
+    assert values[header.index('recovery_mode_eth')] == 'False'
@@ -0,0 +1,64 @@
+"""Which hourly price ticks get a full on-chain simulation step.
+
+The price paths are hourly. SIMULATION_SCHEDULER selects the steps run by test_run_simulation:
+
+- fixed (default): every STEP_INTERVAL hours (24, one step a day), without visiting the hours
+  in between
+- adaptive: a step as soon as the price of any collateral has moved by more than
+  PRICE_THRESHOLD (relative, default 0.02) since the last step, and at least every
+  MAX_STEP_INTERVAL hours (default 24); quiet hours are fast-forwarded
+
+Either way, on a local dev node the chain clock is moved forward by the hours elapsed since the
+previous step, so time-dependent parts of the protocol (fee decay, LQTY issuance) follow the
+price path. Other networks keep their own clock.
+"""
+
+import os
+
+import numpy as np
+from brownie import chain, rpc
+
+SCHEDULER_FIXED = 'fixed'
+SCHEDULER_ADAPTIVE = 'adaptive'
+
+SECONDS_PER_TICK = 3600
+
+
+def schedulerMode():
+    mode = os.environ.get('SIMULATION_SCHEDULER', SCHEDULER_FIXED)
+    if mode not in (SCHEDULER_FIXED, SCHEDULER_ADAPTIVE):
+        raise ValueError(f"Unknown SIMULATION_SCHEDULER {mode}")
+    return mode
+
+
+def fixedSteps(n_ticks, interval, start=0):
+    first = (start // interval + 1) * interval
+    return list(range(first, n_ticks, interval))
+
+
+# Ticks where any price moved by more than `threshold` since the previous step, or `max_interval` ticks passed
+def adaptiveSteps(prices, threshold, max_interval, start=0):
+    prices = np.column_stack([np.asarray(price, dtype=float) for price in prices])
+    steps = []
+    last = start
+    for index in range(start + 1, len(prices)):
+        move = np.max(np.abs(prices[index] / prices[last] - 1))
+        if move > threshold or index - last >= max_interval:
+            steps.append(index)
+            last = index
+    return steps
+
+
+# Steps after `start` (the last step already run, 0 for a new run) for the configured scheduler
+def simulationSteps(prices, n_ticks, start=0):
+    if schedulerMode() == SCHEDULER_ADAPTIVE:
+        return adaptiveSteps([price[:n_ticks] for price in prices],
+            float(os.environ.get('PRICE_THRESHOLD', '0.02')),
+            int(os.environ.get('MAX_STEP_INTERVAL', '24')), start)
+    return fixedSteps(n_ticks, int(os.environ.get('STEP_INTERVAL', '24')), start)
+
+
+# Moves the chain clock to the tick of the next step, on a dev node brownie launched
+def advanceTo(index, last_index):
+    if index > last_index and rpc.is_active():
+        chain.sleep((index - last_index) * SECONDS_PER_TICK)
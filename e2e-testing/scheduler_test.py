@@ -0,0 +1,27 @@
+from scheduler import *
+
+# ETH moves 3% by tick 3, BTC 2.5% at tick 5
+PRICES = [
+    [100, 100.5, 101, 103, 103, 103, 103, 103, 103],
+    [200, 200, 200, 200, 200, 195, 195, 195, 195],
+]
+
+
+def test_fixed_steps():
+    assert fixedSteps(100, 24) == [24, 48, 72, 96]
+    # resumed after the step at tick 48, or between two steps
+    assert fixedSteps(100, 24, start=48) == [72, 96]
+    assert fixedSteps(100, 24, start=50) == [72, 96]
+    assert fixedSteps(100, 24, start=96) == []
+
+
+def test_adaptive_steps():
+    # a move above 2% since the last step, or 3 ticks without a step
+    assert adaptiveSteps(PRICES, 0.02, 3) == [3, 5, 8]
+
+
+def test_adaptive_steps_resume():
+    # moves are measured from the price of the step resumed from
+    assert adaptiveSteps(PRICES, 0.02, 3, start=3) == [5, 8]
+    assert adaptiveSteps(PRICES, 0.02, 3, start=4) == [5, 8]
+    assert adaptiveSteps(PRICES, 0.02, 10, start=1) == [3, 5]
@@ -0,0 +1,274 @@
+"""Vectorized off-chain shadow of the trove and stability pool accounting.
+
+TroveShadow keeps the coll/debt of every agent of one collateral in NumPy arrays and applies
+the same flows as the contracts driven by test_run_simulation: open/adjust/close, stability
+pool deposits and liquidations offset against the stability pool with the remainder
+redistributed to the active troves, in the rounds and batches the
+liquidation_planner.LiquidationPlanner of the chain run sends. Recovery Mode is not modelled:
+troves are liquidated by the Normal Mode rules even when the TCR is below CCR, which only sets
+the recovery mode flag of the reported state. contractShadow() reads MCR and CCR from the
+TroveManager; the MCR/CCR defaults are for chain-free use. It reports a GlobalState with the same
+fields and units as state_reader, so shadow and chain states compare field by field.
+
+SIMULATION_MODE selects how test_run_simulation runs:
+
+- onchain: every step on chain, as before
+- shadow: the shadow only, driven by ShadowSimulation, orders of magnitude faster
+- verify: on chain, and every VERIFY_EVERY steps the shadow is synced from the chain, predicts
+  the liquidation phase, and any divergence from the chain is reported
+
+The AnyToken vaults have their own mirror, vault_model.VaultModel, checked against the chain by
+vault_fuzzer.py and by bridge_simulator.py --verify-every.
+"""
+
+import os
+
+import numpy as np
+
+from agent_engine import AgentEngine
+from liquidation_planner import MAX_LIQUIDATION_ROUNDS, liquidationBatchSize
+from state_reader import GlobalState
+
+MODE_ONCHAIN = 'onchain'
+MODE_SHADOW = 'shadow'
+MODE_VERIFY = 'verify'
+
+# Liquity defaults, the contracts' values are read by contractShadow()
+MCR = 1.1
+CCR = 1.5
+# Share of the liquidated coll paid to the liquidator (1 / PERCENT_DIVISOR)
+COLL_GAS_COMPENSATION = 1 / 200
+
+VERIFY_FIELDS = ['num_troves', 'total_coll', 'total_debt', 'SP_LUSD', 'SP_coll']
+
+
+def simulationMode():
+    mode = os.environ.get('SIMULATION_MODE', MODE_ONCHAIN)
+    if mode not in (MODE_ONCHAIN, MODE_SHADOW, MODE_VERIFY):
+        raise ValueError(f"Unknown SIMULATION_MODE {mode}")
+    return mode
+
+
+def verifyEvery():
+    return int(os.environ.get('VERIFY_EVERY', '10'))
+
+
+class TroveShadow:
+    def __init__(self, n_accounts, lusd_gas_compensation, mcr=MCR, ccr=CCR):
+        self.lusd_gas_compensation = lusd_gas_compensation
+        self.mcr = mcr
+        self.ccr = ccr
+        self.coll = np.zeros(n_accounts)
+        self.debt = np.zeros(n_accounts)
+        self.active = np.zeros(n_accounts, dtype=bool)
+        self.sp_lusd = 0.0
+        self.sp_coll = 0.0
+        self.price = 0.0
+
+    # `debt` is the LUSD drawn; the gas compensation is added as in BorrowerOperations
+    def open(self, idx, coll, debt):
+        self.coll[idx] = coll
+        self.debt[idx] = debt + self.lusd_gas_compensation
+        self.active[idx] = True
+
+    def adjust(self, idx, coll_change, debt_change):
+        self.coll[idx] += coll_change
+        self.debt[idx] += debt_change
+
+    def close(self, idx):
+        self.coll[idx] = 0
+        self.debt[idx] = 0
+        self.active[idx] = False
+
+    def provideToSP(self, amount):
+        self.sp_lusd += amount
+
+    def withdrawFromSP(self, amount):
+        self.sp_lusd -= min(amount, self.sp_lusd)
+
+    def ICR(self, price):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.active, self.coll * price / self.debt, np.inf)
+
+    # Liquidates the troves below MCR like LiquidationPlanner on chain: every round plans the troves
+    # below MCR, lowest ICR first, and sends them in batches of batch_size. As in batchLiquidateTroves,
+    # a batch takes the troves still below MCR at its start, offsets them against the stability pool
+    # one after the other and redistributes the rest once at its end. Returns the number of troves
+    # and the coll liquidated.
+    def liquidate(self, price, batch_size=None):
+        batch_size = batch_size or liquidationBatchSize()
+        n_liquidated = 0
+        coll_liquidated = 0.0
+
+        for _ in range(MAX_LIQUIDATION_ROUNDS):
+            icr = self.ICR(price)
+            rows = np.flatnonzero(icr < self.mcr)
+            # Liquity never liquidates the last trove
+            rows = rows[np.argsort(icr[rows], kind='stable')][:max(np.count_nonzero(self.active) - 1, 0)]
+            if len(rows) == 0:
+                break
+
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                batch = batch[self.ICR(price)[batch] < self.mcr]
+                coll, debt = self.coll[batch].copy(), self.debt[batch].copy()
+                coll_to_liquidate = coll * (1 - COLL_GAS_COMPENSATION)
+
+                sp_before = np.maximum(self.sp_lusd - np.concatenate([[0], np.cumsum(debt)[:-1]]), 0)
+                debt_to_offset = np.minimum(debt, sp_before)
+                coll_to_sp = coll_to_liquidate * debt_to_offset / debt
+                self.sp_lusd -= debt_to_offset.sum()
+                self.sp_coll += coll_to_sp.sum()
+
+                self.close(batch)
+                self._redistribute((coll_to_liquidate - coll_to_sp).sum(), (debt - debt_to_offset).sum())
+
+                n_liquidated += len(batch)
+                coll_liquidated += coll.sum()
+
+        return n_liquidated, coll_liquidated
+
+    def _redistribute(self, coll, debt):
+        if coll == 0 and debt == 0:
+            return
+        stakes = np.where(self.active, self.coll, 0)
+        total_stakes = stakes.sum()
+        if total_stakes == 0:
+            return
+        self.coll += coll * stakes / total_stakes
+        self.debt += debt * stakes / total_stakes
+
+    def snapshot(self, price):
+        total_coll = self.coll[self.active].sum()
+        total_debt = self.debt[self.active].sum()
+        icr = self.ICR(price)
+        num_troves = int(np.count_nonzero(self.active))
+        TCR = total_coll * price / total_debt if total_debt > 0 else float('inf')
+
+        return GlobalState(
+            price,
+            num_troves,
+            total_coll,
+            total_debt,
+            TCR,
+            TCR < self.ccr,
+            icr.min() if num_troves > 0 else 0,
+            self.sp_lusd,
+            self.sp_coll,
+        )
+
+    # Copies the state of the given accounts (same order as the shadow arrays) from the chain
+    def loadFromChain(self, contracts, accounts, state_reader):
+        troveManager = contracts.troveManager
+        statuses = state_reader.call([(troveManager.getTroveStatus, [account]) for account in accounts])
+        debts_and_colls = state_reader.call([(troveManager.getEntireDebtAndColl, [account]) for account in accounts])
+        sp_lusd, sp_coll = state_reader.call([
+            (contracts.stabilityPool.getTotalLUSDDeposits, []),
+            (contracts.stabilityPool.getETH, []),
+        ])
+
+        decimal_adjustment = contracts.decimalAdjustment
+        self.active = np.array([status == 1 for status in statuses])
+        self.debt = np.array([values[0] / 1e18 for values in debts_and_colls])
+        self.coll = np.array([values[1] * decimal_adjustment / 1e18 for values in debts_and_colls])
+        self.sp_lusd = sp_lusd / 1e18
+        self.sp_coll = sp_coll * decimal_adjustment / 1e18
+
+    # Same as loadFromChain, with the troves taken from an up to date event_indexer.TroveIndexer
+    # and the stability pool from the GlobalState of the collateral
+    def loadFromIndexer(self, indexer, accounts, state):
+        self.debt, self.coll, status = indexer.table(accounts)
+        self.active = status == 1
+        self.sp_lusd = state.SP_LUSD
+        self.sp_coll = state.SP_coll
+
+
+# Shadow of the given collateral's contracts, with their MCR, CCR and gas compensation
+def contractShadow(contracts, n_accounts):
+    troveManager = contracts.troveManager
+    return TroveShadow(n_accounts, troveManager.LUSD_GAS_COMPENSATION() / 1e18, troveManager.MCR() / 1e18, troveManager.CCR() / 1e18)
+
+
+class ShadowVerifier:
+    def __init__(self, every, rtol=1e-6):
+        self.every = every
+        self.rtol = rtol
+        self.steps = 0
+        self.checks = 0
+        self.divergences = []
+
+    # True once every `every` calls, i.e. every K simulation steps; never when `every` is 0
+    def due(self):
+        self.steps += 1
+        return self.every > 0 and self.steps % self.every == 0
+
+    def check(self, name, index, expected, actual):
+        self.checks += 1
+        for field in VERIFY_FIELDS:
+            expected_value = getattr(expected, field)
+            actual_value = getattr(actual, field)
+            if not np.isclose(expected_value, actual_value, rtol=self.rtol, atol=1e-9):
+                self.divergences.append((index, name, field, expected_value, actual_value))
+                print(f' !! shadow divergence at iteration {index} on {name}.{field}: shadow {expected_value} chain {actual_value}')
+
+    def print(self):
+        print(f'\n Shadow verification: {self.checks} checks, {len(self.divergences)} divergences')
+
+
+class ShadowSimulation:
+    """
+    Runs the simulation loop against TroveShadow only.
+
+    `decide[name](shadow, price, index, rng)` returns the actions of one step for one collateral as a
+    dict with optional 'close' (indices), 'adjust' (indices, coll changes, debt changes),
+    'open' (indices, colls, debts) and 'sp' (indices, LUSD deposited, negative to withdraw) entries,
+    as returned by AgentEngine.decide.
+    """
+
+    def __init__(self, shadows, decide, seed=0):
+        self.shadows = shadows
+        self.decide = decide
+        self.rng = np.random.default_rng(seed)
+
+    def step(self, prices, index):
+        results = {}
+        for name, shadow in self.shadows.items():
+            price = prices[name]
+            shadow.price = price
+            n_liquidated, coll_liquidated = shadow.liquidate(price)
+
+            actions = self.decide[name](shadow, price, index, self.rng)
+            if 'close' in actions:
+                shadow.close(actions['close'])
+            if 'adjust' in actions:
+                shadow.adjust(*actions['adjust'])
+            if 'open' in actions:
+                shadow.open(*actions['open'])
+            if 'sp' in actions:
+                _, amounts = actions['sp']
+                shadow.withdrawFromSP(-amounts[amounts < 0].sum())
+                shadow.provideToSP(amounts[amounts > 0].sum())
+
+            results[name] = (n_liquidated, coll_liquidated, shadow.snapshot(price))
+        return results
+
+
+def targetCRDecisions(target_cr_a, target_cr_b, target_cr_df, tau_k, tau_theta, coll_k, coll_theta,
+        open_rate, close_rate, coll_scale=1.0, sp_share=0.0):
+    """
+    Default agent behaviour for shadow runs: the decisions of agent_engine.AgentEngine, drawn
+    from the generator of the ShadowSimulation.
+    """
+    engines = {}
+
+    def decide(shadow, price, index, rng):
+        engine = engines.get(id(shadow))
+        if engine is None:
+            engine = engines[id(shadow)] = AgentEngine(len(shadow.active), target_cr_a, target_cr_b, target_cr_df,
+                tau_k, tau_theta, coll_k, coll_theta, open_rate, close_rate, sp_share, coll_scale)
+        actions = engine.decide(shadow.coll, shadow.debt, shadow.active, price, shadow.lusd_gas_compensation, rng=rng)
+        # the shadow carries out every decision
+        engine.apply(actions)
+        return actions
+
+    return decide
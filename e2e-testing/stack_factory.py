@@ -0,0 +1,61 @@
+"""Deployment of a whole collateral stack through the CollateralStackFactory helper contract.
+
+Deploying the 11 contracts of a stack one by one and wiring them takes about 25 transactions,
+each mined in its own block. Through the factory the contracts are created with CREATE2 in a
+few batched transactions (bounded by STACK_DEPLOY_BATCH_BYTES of creation code), and all the
+owner-only wiring calls go in one factory.execute() transaction. Addresses are deterministic:
+they only depend on the factory, the salt and the creation code.
+
+STACK_FACTORY=1 makes setupMultiCollContracts deploy the collateral stacks this way.
+"""
+
+import os
+
+from eth_utils import keccak, to_checksum_address
+from hexbytes import HexBytes
+
+# Creation code sent per deploy transaction, to stay below the block gas limit (code deposit is 200 gas per byte)
+STACK_DEPLOY_BATCH_BYTES = 48000
+
+
+def stackFactoryEnabled():
+    return os.environ.get('STACK_FACTORY', '0') == '1'
+
+
+def stackSalt(name):
+    return keccak(text=name)
+
+
+def create2Address(factory, salt, index, init_code):
+    contract_salt = keccak(salt + index.to_bytes(32, 'big'))
+    return to_checksum_address(keccak(b'\xff' + bytes.fromhex(factory.address[2:]) + contract_salt + keccak(init_code))[12:])
+
+
+def deployStack(factory, containers, salt, tx_params):
+    """
+    Deploys one contract per (name, container) of `containers` (constructors without arguments)
+    and returns the brownie contracts keyed by name.
+    """
+    names = list(containers)
+    init_codes = [bytes(HexBytes(containers[name].bytecode)) for name in names]
+
+    batch, batch_bytes, first = [], 0, 0
+    for index, init_code in enumerate(init_codes):
+        if batch and batch_bytes + len(init_code) > STACK_DEPLOY_BATCH_BYTES:
+            factory.deploy(batch, salt, first, tx_params)
+            batch, batch_bytes, first = [], 0, index
+        batch.append(init_code)
+        batch_bytes += len(init_code)
+    factory.deploy(batch, salt, first, tx_params)
+
+    return {
+        name: containers[name].at(create2Address(factory, salt, index, init_code))
+        for index, (name, init_code) in enumerate(zip(names, init_codes))
+    }
+
+
+# Sends calls given as (fn, args) through the factory, as the owner of the contracts it created, in one transaction
+def executeThroughFactory(factory, calls, tx_params):
+    targets = [fn._address for fn, _ in calls]
+    data = [fn.encode_input(*args) for fn, args in calls]
+    return factory.execute(targets, data, tx_params)
@@ -0,0 +1,67 @@
+"""Batched reads of the simulation state through the Multicall helper contract.
+
+Each read is a single eth_call whatever the number of collaterals, which matters when the
+simulation runs against a remote node where every round trip is expensive.
+"""
+
+from collections import namedtuple
+
+from hexbytes import HexBytes
+
+# Same fields, order and units as the list returned by logGlobalState
+GlobalState = namedtuple('GlobalState', ['price', 'num_troves', 'total_coll', 'total_debt', 'TCR',
+    'recovery_mode', 'last_ICR', 'SP_LUSD', 'SP_coll'])
+
+
+class StateReader:
+    def __init__(self, multicall, multi_coll_contracts):
+        self.multicall = multicall
+        self.names = list(multi_coll_contracts)
+        self.decimal_adjustments = [multi_coll_contracts[name].decimalAdjustment for name in self.names]
+        self.stacks = [
+            (
+                contracts.priceFeedTestnet.address,
+                contracts.troveManager.address,
+                contracts.sortedTroves.address,
+                contracts.stabilityPool.address,
+            )
+            for contracts in multi_coll_contracts.values()
+        ]
+
+    # Global state of every collateral, keyed like multi_coll_contracts
+    def read(self):
+        _, states = self.multicall.getGlobalStates(self.stacks)
+
+        result = {}
+        for name, decimal_adjustment, state in zip(self.names, self.decimal_adjustments, states):
+            price, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_LUSD, SP_coll = state
+            result[name] = GlobalState(
+                price / 1e18,
+                num_troves,
+                total_coll * decimal_adjustment / 1e18,
+                total_debt / 1e18,
+                TCR / 1e18,
+                recovery_mode,
+                last_ICR / 1e18,
+                SP_LUSD / 1e18,
+                SP_coll * decimal_adjustment / 1e18,
+            )
+        return result
+
+    # Runs several view calls in one eth_call, e.g. [(contracts.troveManager.getTCR, [price])]
+    def call(self, calls):
+        encoded = [(fn._address, fn.encode_input(*args)) for fn, args in calls]
+        _, return_data = self.multicall.aggregate(encoded)
+        return [fn.decode_output(HexBytes(data).hex()) for (fn, _), data in zip(calls, return_data)]
+
+
+def printGlobalState(name, state):
+    print(f' {name} price            ', state.price)
+    print(f' {name} troves           ', state.num_troves)
+    print(f' {name} total coll       ', state.total_coll)
+    print(f' {name} total debt       ', state.total_debt)
+    print(f' {name} TCR              ', state.TCR)
+    print(f' {name} recovery mode    ', state.recovery_mode)
+    print(f' {name} last ICR         ', state.last_ICR)
+    print(f' {name} SP LUSD          ', state.SP_LUSD)
+    print(f' {name} SP coll          ', state.SP_coll)
@@ -0,0 +1,176 @@
+"""Gas and wall-clock benchmark of the AnyToken vault operations.
+
+vault_benchmark_test.py opens growing populations of vaults (VAULT_BENCHMARK_SIZES, default
+1,100,10000). At each size it runs VAULT_BENCHMARK_REPEATS cycles on fresh vaults:
+openVault, addColl, withdrawLUSD, repayLUSD, withdrawColl and closeVault. For every operation
+it records the gas used and the wall-clock time from sending the transaction to its receipt.
+closeVault is measured twice. `closeVault` closes a vault in the middle of VaultOwners, so the
+swap-and-pop of _removeVaultOwner moves the last owner into the freed slot. `closeVault_last`
+closes the last one (pop only).
+
+Every operation goes through vault_model.VaultModel first. An operation the model rejects with
+the deployed constants (e.g. an ICR != MSCR) is reported as skipped instead of being sent, and an
+operation the model accepts but the chain reverts fails the benchmark.
+
+The medians are compared with a stored baseline (VAULT_BENCHMARK_BASELINE, default
+tests/vault_benchmark_baseline.json). Gas above the baseline by more than
+VAULT_BENCHMARK_GAS_THRESHOLD (relative, default 0.01) is a regression, and so is wall-clock
+above it by more than VAULT_BENCHMARK_TIME_THRESHOLD (default 1.0, as wall-clock depends on the
+machine and the node). Without a baseline, or with VAULT_BENCHMARK_UPDATE=1, the run writes it;
+under CI (CI=true) a missing baseline fails the run instead.
+
+The benchmark only runs with VAULT_BENCHMARK=1, on anvil or hardhat: the vault owners are
+AccountPool accounts, which the node impersonates.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from pipeline import TxPipeline
+from vault_model import ModelRevert
+
+MAX_UINT = 2**256 - 1
+
+# Transactions per pipelined block when opening the vault population
+POPULATE_BATCH = 200
+POPULATE_GAS_LIMIT = 500000
+
+
+def benchmarkEnabled():
+    return os.environ.get('VAULT_BENCHMARK', '0') == '1'
+
+
+# GitHub Actions and most CI services set CI=true
+def ciRun():
+    return os.environ.get('CI', '').lower() in ('1', 'true')
+
+
+def benchmarkSizes():
+    return [int(size) for size in os.environ.get('VAULT_BENCHMARK_SIZES', '1,100,10000').split(',')]
+
+
+def benchmarkRepeats():
+    return int(os.environ.get('VAULT_BENCHMARK_REPEATS', '5'))
+
+
+def gasThreshold():
+    return float(os.environ.get('VAULT_BENCHMARK_GAS_THRESHOLD', '0.01'))
+
+
+def timeThreshold():
+    return float(os.environ.get('VAULT_BENCHMARK_TIME_THRESHOLD', '1.0'))
+
+
+def baselinePath():
+    return os.environ.get('VAULT_BENCHMARK_BASELINE', 'tests/vault_benchmark_baseline.json')
+
+
+def updateBaseline():
+    return os.environ.get('VAULT_BENCHMARK_UPDATE', '0') == '1'
+
+
+# Approves and opens one vault of `lusd_amount` per owner, POPULATE_BATCH transactions per block
+def openVaults(contracts, model, owners, lusd_amount):
+    for start in range(0, len(owners), POPULATE_BATCH):
+        batch = owners[start:start + POPULATE_BATCH]
+        with TxPipeline(POPULATE_GAS_LIMIT) as approvals:
+            for owner in batch:
+                approvals.send(owner, contracts.anyToken.approve, contracts.vaultOperations.address, MAX_UINT, { 'from': owner })
+        with TxPipeline(POPULATE_GAS_LIMIT) as opens:
+            for owner in batch:
+                opens.send(owner, contracts.vaultOperations.openVault, lusd_amount, { 'from': owner })
+        for result in approvals.reverts() + opens.reverts():
+            raise RuntimeError(f'{result.function} of {result.agent} reverted: {result.revert_msg}')
+        for owner in batch:
+            model.openVault(str(owner), lusd_amount)
+
+
+class VaultBenchmark:
+    def __init__(self):
+        # (size, operation) -> [(gas, seconds)]
+        self.samples = {}
+        self.skipped = {}
+
+    def measure(self, size, operation, fn, *args):
+        start = time.perf_counter()
+        tx = fn(*args)
+        elapsed = time.perf_counter() - start
+        self.samples.setdefault((size, operation), []).append((tx.gas_used, elapsed))
+        return tx
+
+    # One cycle on the fresh vault of `owner`; `neighbour` opens a vault right after it so that
+    # closing the first one goes through the swap of _removeVaultOwner
+    def cycle(self, size, contracts, model, owner, neighbour, lusd_amount):
+        operations = contracts.vaultOperations
+        coll_amount = model.getAnyTokenAmount(lusd_amount)
+        steps = [
+            ('openVault', 'openVault', owner, [2 * lusd_amount]),
+            (None, 'openVault', neighbour, [2 * lusd_amount]),
+            ('addColl', 'addColl', owner, [coll_amount]),
+            ('withdrawLUSD', 'withdrawLUSD', owner, [lusd_amount]),
+            ('repayLUSD', 'repayLUSD', owner, [lusd_amount]),
+            ('withdrawColl', 'withdrawColl', owner, [lusd_amount]),
+            ('closeVault', 'closeVault', owner, []),
+            ('closeVault_last', 'closeVault', neighbour, []),
+        ]
+        for operation, function, account, args in steps:
+            try:
+                getattr(model, function)(str(account), *args)
+            except ModelRevert as error:
+                if operation is None:
+                    raise
+                self.skipped[operation] = str(error)
+                continue
+            fn = getattr(operations, function)
+            if operation is None:
+                fn(*args, { 'from': account })
+            else:
+                self.measure(size, operation, fn, *args, { 'from': account })
+
+    # Median gas and wall-clock per population size and operation
+    def results(self):
+        results = {}
+        for (size, operation), samples in self.samples.items():
+            gas, seconds = np.array(samples, dtype=float).T
+            results.setdefault(str(size), {})[operation] = {'gas': float(np.median(gas)), 'time': float(np.median(seconds))}
+        return results
+
+    def print(self, results):
+        print('\n Vault benchmark (medians)')
+        print(f' {"vaults":>7} {"operation":<16} {"gas":>10} {"time ms":>9}')
+        for size, operations in results.items():
+            for operation, entry in operations.items():
+                print(f' {size:>7} {operation:<16} {entry["gas"]:>10.0f} {1000 * entry["time"]:>9.1f}')
+        for operation, reason in self.skipped.items():
+            print(f' skipped {operation}: {reason}')
+
+
+def loadBaseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def saveBaseline(path, results):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+# Operations slower or more expensive than the baseline beyond the thresholds, one line each
+def regressions(results, baseline, gas_threshold, time_threshold):
+    lines = []
+    for size, operations in results.items():
+        for operation, entry in operations.items():
+            reference = baseline.get(size, {}).get(operation)
+            if reference is None:
+                continue
+            if entry['gas'] > reference['gas'] * (1 + gas_threshold):
+                lines.append(f'{operation} with {size} vaults: gas {entry["gas"]:.0f}, baseline {reference["gas"]:.0f}')
+            if entry['time'] > reference['time'] * (1 + time_threshold):
+                lines.append(f'{operation} with {size} vaults: {1000 * entry["time"]:.1f} ms, baseline {1000 * reference["time"]:.1f} ms')
+    return lines
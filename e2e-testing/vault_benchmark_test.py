@@ -0,0 +1,61 @@
+import pytest
+
+from brownie import *
+from accounts import *
+from helpers import *
+from account_pool import AccountPool
+from vault_model import VaultModel
+from vault_benchmark import *
+from vault_setup import setupVaultContracts, fundVaultOwners
+
+VAULT_POOL_SEED = 'vault-benchmark'
+# anyToken given to each vault owner, in units of the collateral backing MIN_SWAP_NET_DEBT (a cycle uses 4)
+OWNER_COLL_VAULTS = 5
+
+@pytest.mark.skipif(not benchmarkEnabled(), reason='set VAULT_BENCHMARK=1 to run the vault benchmark (anvil or hardhat)')
+def test_vault_operations_benchmark():
+    contracts = setupVaultContracts()
+    model = VaultModel.fromContract(contracts.vaultManager, 1)
+
+    sizes = sorted(benchmarkSizes())
+    repeats = benchmarkRepeats()
+    # population owners first, then two fresh owners per benchmark cycle
+    pool = AccountPool(accounts[0], sizes[-1] + 2 * repeats * len(sizes), 0, VAULT_POOL_SEED)
+    next_owner = sizes[-1] + 1
+
+    lusd_amount = contracts.vaultManager.MIN_SWAP_NET_DEBT()
+    owner_coll = model.getAnyTokenAmount(lusd_amount) * OWNER_COLL_VAULTS
+
+    benchmark = VaultBenchmark()
+    opened = 0
+    for size in sizes:
+        owners = pool[opened + 1:size + 1]
+        fundVaultOwners(contracts, model, owners, owner_coll)
+        openVaults(contracts, model, owners, 2 * lusd_amount)
+        opened = size
+        print(f'{size} vaults open')
+
+        for _ in range(repeats):
+            owner, neighbour = pool[next_owner], pool[next_owner + 1]
+            next_owner += 2
+            fundVaultOwners(contracts, model, [owner, neighbour], owner_coll)
+            for account in (owner, neighbour):
+                contracts.anyToken.approve(contracts.vaultOperations.address, MAX_UINT, { 'from': account })
+            benchmark.cycle(size, contracts, model, owner, neighbour, lusd_amount)
+
+        assert contracts.vaultManager.getVaultOwnersCount() == model.getVaultOwnersCount()
+
+    results = benchmark.results()
+    benchmark.print(results)
+
+    path = baselinePath()
+    baseline = loadBaseline(path)
+    if baseline is None and ciRun() and not updateBaseline():
+        pytest.fail(f'No vault benchmark baseline at {path}; write it with VAULT_BENCHMARK_UPDATE=1 and commit it')
+    if baseline is None or updateBaseline():
+        saveBaseline(path, results)
+        print(f'Baseline written to {path}')
+        return
+
+    failures = regressions(results, baseline, gasThreshold(), timeThreshold())
+    assert not failures, 'Vault benchmark regressions:\n' + '\n'.join(failures)
@@ -0,0 +1,32 @@
+import pytest
+
+from brownie import *
+from accounts import *
+from helpers import *
+from vault_model import VaultModel
+from vault_fuzzer import VaultFuzzer, fuzzEnabled, fuzzOwners, fuzzFullCheck, fuzzSeed, fuzzLength, fuzzOutput, sequenceIds, generateSequence, saveReport
+from vault_setup import setupVaultContracts, fundVaultOwners
+
+MAX_UINT = 2**256 - 1
+
+@pytest.mark.skipif(not fuzzEnabled(), reason='set VAULT_FUZZ_SEQUENCES or VAULT_FUZZ_SEQUENCE_IDS to run the vault fuzzer')
+def test_vault_invariants():
+    contracts = setupVaultContracts()
+    model = VaultModel.fromContract(contracts.vaultManager, 1)
+    lusd_unit = contracts.vaultManager.MIN_SWAP_NET_DEBT()
+
+    # enough anyToken for each owner to open a vault up to twice the debt ceiling
+    owners = accounts[1:fuzzOwners() + 1]
+    fundVaultOwners(contracts, model, owners, 2 * model.getAnyTokenAmount(model.getDebtCeiling()))
+    for owner in owners:
+        contracts.anyToken.approve(contracts.vaultOperations.address, MAX_UINT, { 'from': owner })
+
+    fuzzer = VaultFuzzer(contracts, model, owners, lusd_unit, fuzzFullCheck())
+    chain.snapshot()
+    for sequence_id in sequenceIds():
+        fuzzer.run(sequence_id, generateSequence(fuzzSeed(), sequence_id, fuzzLength()))
+        chain.revert()
+
+    fuzzer.print()
+    saveReport(fuzzOutput(), fuzzer.report())
+    assert not fuzzer.failures, f'{len(fuzzer.failures)} vault fuzz sequences failed'
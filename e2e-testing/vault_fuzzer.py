@@ -0,0 +1,353 @@
+"""Stateful property fuzzer of the AnyToken vault contracts.
+
+vault_fuzz_test.py (run when VAULT_FUZZ_SEQUENCES or VAULT_FUZZ_SEQUENCE_IDS is set) deploys
+the vault stack of vault_setup.setupVaultContracts once, funds a few vault owners and snapshots
+the chain. Each case is a random sequence of openVault, addColl, withdrawColl, withdrawLUSD,
+repayLUSD and closeVault by those owners, with amounts around MIN_SWAP_NET_DEBT and right at the
+remaining debt ceiling. The chain is reverted to the snapshot after the case. Sequence i is drawn
+from the generator seeded with [VAULT_FUZZ_SEED, i], so a failing case replays on its own with
+VAULT_FUZZ_SEQUENCE_IDS=i.
+
+Every step goes through vault_model.VaultModel first. A step the model accepts is sent as a
+transaction. A step the model rejects only goes through eth_call, so it costs no block, and it
+must revert on chain with the same reason. After every step the totals of AnyTokenActivePool
+and the VaultOwners count must match the model. After the last step (after every step with
+VAULT_FUZZ_FULL_CHECK=1) the chain state is read in full, compared with the model and checked
+for the invariants:
+
+- getAnyToken() and getLUSDDebt() equal the sums of coll and debt over Vaults, and the
+  anyToken balance of the pool equals getAnyToken()
+- VaultOwners holds every active vault exactly once, and each vault's arrayIndex is its position
+- closed vaults hold no coll and no debt
+
+A case stops at its first failure. Failures are kept with the sequence up to the failing step.
+
+    python tests/vault_fuzzer.py --sequences 20000 --workers 16
+
+shards the sequences across worker processes, each running the test on its own dev node (the
+i-th worker takes sequences i, i + workers, ...), and merges their reports.
+"""
+
+import argparse
+import copy
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from brownie.exceptions import VirtualMachineError
+
+from monte_carlo import addNetwork, deleteNetwork
+from vault_model import ModelRevert, ACTIVE
+
+OPERATIONS = ['openVault', 'addColl', 'withdrawColl', 'withdrawLUSD', 'repayLUSD', 'closeVault']
+OPERATION_WEIGHTS = [0.25, 0.15, 0.1, 0.2, 0.15, 0.15]
+# Amounts in MIN_SWAP_NET_DEBT; CEILING is the debt left below the debt ceiling
+AMOUNT_SCALES = [0, 0.5, 1, 1.5, 2, 3, 10]
+CEILING = -1
+CEILING_PROBABILITY = 0.05
+# Share of the steps on an owner whose vault is in the state the operation needs (open for the
+# adjustments and closeVault, not open for openVault); the others pick any owner
+TARGET_PROBABILITY = 0.9
+# Share of the amounts moved by a few wei, to hit the rounding and boundary checks
+OFFSET_PROBABILITY = 0.2
+MAX_OFFSET = 2
+
+
+# The fuzz test only runs when sequences are asked for, e.g. by the shards of main()
+def fuzzEnabled():
+    return 'VAULT_FUZZ_SEQUENCES' in os.environ or 'VAULT_FUZZ_SEQUENCE_IDS' in os.environ
+
+
+def fuzzSequences():
+    return int(os.environ.get('VAULT_FUZZ_SEQUENCES', '200'))
+
+
+def fuzzLength():
+    return int(os.environ.get('VAULT_FUZZ_LENGTH', '20'))
+
+
+def fuzzSeed():
+    return int(os.environ.get('VAULT_FUZZ_SEED', '0'))
+
+
+def fuzzOwners():
+    return int(os.environ.get('VAULT_FUZZ_OWNERS', '4'))
+
+
+def fuzzFullCheck():
+    return os.environ.get('VAULT_FUZZ_FULL_CHECK', '0') == '1'
+
+
+def fuzzOutput():
+    return os.environ.get('VAULT_FUZZ_OUTPUT', 'tests/vault_fuzz.json')
+
+
+# Sequence ids of this worker: VAULT_FUZZ_SEQUENCE_IDS if set, else every VAULT_FUZZ_SHARDS-th id from VAULT_FUZZ_SHARD
+def sequenceIds():
+    ids = os.environ.get('VAULT_FUZZ_SEQUENCE_IDS')
+    if ids is not None:
+        return [int(sequence_id) for sequence_id in ids.split(',')]
+    shard = int(os.environ.get('VAULT_FUZZ_SHARD', '0'))
+    shards = int(os.environ.get('VAULT_FUZZ_SHARDS', '1'))
+    return list(range(shard, fuzzSequences(), shards))
+
+
+# Steps as (operation, owner pick, targeted, amount scale, offset in wei)
+def generateSequence(seed, sequence_id, length):
+    rng = np.random.default_rng([seed, sequence_id])
+    steps = []
+    for _ in range(length):
+        operation = OPERATIONS[rng.choice(len(OPERATIONS), p=OPERATION_WEIGHTS)]
+        pick = int(rng.integers(2**16))
+        targeted = bool(rng.random() < TARGET_PROBABILITY)
+        scale = CEILING if rng.random() < CEILING_PROBABILITY else float(rng.choice(AMOUNT_SCALES))
+        offset = int(rng.integers(-MAX_OFFSET, MAX_OFFSET + 1)) if rng.random() < OFFSET_PROBABILITY else 0
+        steps.append((operation, pick, targeted, scale, offset))
+    return steps
+
+
+# Index of the owner of a step in the current model state
+def stepOwner(model, owners, step):
+    operation, pick, targeted, _, _ = step
+    if targeted:
+        needs_vault = operation != 'openVault'
+        candidates = [index for index, owner in enumerate(owners)
+            if (str(owner) in model.Vaults and model.Vaults[str(owner)].status == ACTIVE) == needs_vault]
+        if candidates:
+            return candidates[pick % len(candidates)]
+    return pick % len(owners)
+
+
+# Argument of a step in the current model state; addColl takes anyToken, the others LUSD
+def stepAmount(model, step, lusd_unit):
+    operation, _, _, scale, offset = step
+    if scale == CEILING:
+        amount = model.getDebtCeiling() - model.LUSDDebt
+    else:
+        amount = int(lusd_unit * scale)
+    if operation == 'addColl':
+        amount = model.getAnyTokenAmount(amount)
+    return max(amount + offset, 0)
+
+
+# Vaults of `owners` as (debt, coll, status, arrayIndex), VaultOwners and the pool totals and anyToken balance
+def chainState(contracts, owners):
+    manager = contracts.vaultManager
+    vaults = {}
+    for owner in owners:
+        debt, coll, _, status, array_index = manager.Vaults(owner)
+        vaults[str(owner)] = (debt, coll, status, array_index)
+    return {
+        'vaults': vaults,
+        'owners': [str(manager.VaultOwners(i)) for i in range(manager.getVaultOwnersCount())],
+        'coll': contracts.activePool.getAnyToken(),
+        'debt': contracts.activePool.getLUSDDebt(),
+        'balance': contracts.anyToken.balanceOf(contracts.activePool),
+    }
+
+
+def modelState(model, owners):
+    vaults = {}
+    for owner in owners:
+        vault = model.Vaults.get(str(owner))
+        vaults[str(owner)] = (0, 0, 0, 0) if vault is None else (vault.debt, vault.coll, vault.status, vault.arrayIndex)
+    return {
+        'vaults': vaults,
+        'owners': list(model.VaultOwners),
+        'coll': model.AnyToken,
+        'debt': model.LUSDDebt,
+        'balance': model.collBalances.get('activePool', 0),
+    }
+
+
+def invariantViolations(state):
+    vaults, owners = state['vaults'], state['owners']
+    violations = []
+    active = [owner for owner, (_, _, status, _) in vaults.items() if status == ACTIVE]
+    total_coll = sum(vaults[owner][1] for owner in active)
+    total_debt = sum(vaults[owner][0] for owner in active)
+    if state['coll'] != total_coll:
+        violations.append(f'getAnyToken() {state["coll"]} != sum of vault coll {total_coll}')
+    if state['debt'] != total_debt:
+        violations.append(f'getLUSDDebt() {state["debt"]} != sum of vault debt {total_debt}')
+    if state['balance'] != state['coll']:
+        violations.append(f'anyToken balance of the pool {state["balance"]} != getAnyToken() {state["coll"]}')
+    if len(set(owners)) != len(owners):
+        violations.append(f'VaultOwners has duplicates: {owners}')
+    if sorted(owners) != sorted(active):
+        violations.append(f'VaultOwners {owners} != active vaults {active}')
+    for index, owner in enumerate(owners):
+        if owner in vaults and vaults[owner][3] != index:
+            violations.append(f'arrayIndex of {owner} is {vaults[owner][3]}, position in VaultOwners {index}')
+    for owner, (debt, coll, status, _) in vaults.items():
+        if status != ACTIVE and (debt or coll):
+            violations.append(f'inactive vault of {owner} holds debt {debt} and coll {coll}')
+    return violations
+
+
+class VaultFuzzer:
+    def __init__(self, contracts, model, owners, lusd_unit, full_check=False):
+        self.contracts = contracts
+        self.base_model = copy.deepcopy(model)
+        self.owners = owners
+        self.lusd_unit = lusd_unit
+        self.full_check = full_check
+        self.failures = []
+        self.sequences = 0
+        self.steps = 0
+        self.reverts = 0
+        self.start = time.perf_counter()
+
+    # Runs one sequence from the snapshot state; the caller reverts the chain afterwards
+    def run(self, sequence_id, sequence):
+        model = copy.deepcopy(self.base_model)
+        for index, step in enumerate(sequence):
+            failure = self.step(model, step)
+            if failure is None and (self.full_check or index == len(sequence) - 1):
+                failure = self.check(model)
+            if failure is not None:
+                self.failures.append({'sequence_id': sequence_id, 'step': index, 'failure': failure, 'sequence': sequence[:index + 1]})
+                break
+        self.sequences += 1
+
+    def step(self, model, step):
+        operation = step[0]
+        owner_index = stepOwner(model, self.owners, step)
+        owner = self.owners[owner_index]
+        args = [] if operation == 'closeVault' else [stepAmount(model, step, self.lusd_unit)]
+
+        try:
+            getattr(model, operation)(str(owner), *args)
+            expected = None
+        except ModelRevert as error:
+            expected = str(error)
+
+        fn = getattr(self.contracts.vaultOperations, operation)
+        try:
+            if expected is None:
+                fn(*args, { 'from': owner })
+            else:
+                fn.call(*args, { 'from': owner })
+            actual = None
+        except VirtualMachineError as error:
+            actual = error.revert_msg
+
+        self.steps += 1
+        if expected is not None:
+            self.reverts += 1
+        if actual != expected:
+            return f'{operation}{tuple(args)} by owner {owner_index}: model {expected or "succeeds"}, chain {actual or "succeeds"}'
+
+        pool = self.contracts.activePool
+        totals = (pool.getAnyToken(), pool.getLUSDDebt(), self.contracts.vaultManager.getVaultOwnersCount())
+        expected_totals = (model.AnyToken, model.LUSDDebt, model.getVaultOwnersCount())
+        if totals != expected_totals:
+            return f'after {operation}: pool coll, debt and owners {totals}, model {expected_totals}'
+        return None
+
+    def check(self, model):
+        state = chainState(self.contracts, self.owners)
+        violations = invariantViolations(state)
+        expected = modelState(model, self.owners)
+        for key in ('vaults', 'owners', 'coll', 'debt', 'balance'):
+            if state[key] != expected[key]:
+                violations.append(f'{key} {state[key]}, model {expected[key]}')
+        return '; '.join(violations) if violations else None
+
+    def report(self):
+        return {
+            'sequences': self.sequences,
+            'steps': self.steps,
+            'reverts': self.reverts,
+            'seconds': time.perf_counter() - self.start,
+            'failures': self.failures,
+        }
+
+    def print(self):
+        report = self.report()
+        print(f'\n Vault fuzzer: {report["sequences"]} sequences, {report["steps"]} steps ({report["reverts"]} expected reverts) '
+            f'in {report["seconds"]:.1f}s, {60 * report["sequences"] / report["seconds"]:.0f} sequences/min')
+        printFailures(report['failures'])
+
+
+def printFailures(failures):
+    for failure in failures:
+        print(f' sequence {failure["sequence_id"]} step {failure["step"]}: {failure["failure"]}')
+
+
+def saveReport(path, report):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def runShard(shard, shards, port, args):
+    output = os.path.join(args.output_dir, f'shard_{shard}.json')
+    env = dict(os.environ,
+        VAULT_FUZZ_SEQUENCES=str(args.sequences),
+        VAULT_FUZZ_LENGTH=str(args.length),
+        VAULT_FUZZ_SEED=str(args.seed),
+        VAULT_FUZZ_OWNERS=str(args.owners),
+        VAULT_FUZZ_SHARD=str(shard),
+        VAULT_FUZZ_SHARDS=str(shards),
+        VAULT_FUZZ_OUTPUT=output)
+
+    with open(os.path.join(args.output_dir, f'shard_{shard}.log'), 'w') as log:
+        subprocess.run(['brownie', 'test', f'{args.test_path}::test_vault_invariants', '--network', f'fuzz-{port}'],
+            env=env, stdout=log, stderr=subprocess.STDOUT)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzz the AnyToken vault invariants across worker processes')
+    parser.add_argument('--sequences', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--owners', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--base-port', type=int, default=8800)
+    parser.add_argument('--node-cmd', default='ganache-cli')
+    parser.add_argument('--output-dir', default='tests/vault_fuzz')
+    parser.add_argument('--test-path', default='tests/vault_fuzz_test.py')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    ports = [args.base_port + i for i in range(args.workers)]
+    for port in ports:
+        addNetwork(f'fuzz-{port}', port, args.node_cmd)
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            outputs = list(executor.map(runShard, range(args.workers), [args.workers] * args.workers, ports, [args] * args.workers))
+    finally:
+        for port in ports:
+            deleteNetwork(f'fuzz-{port}')
+    elapsed = time.perf_counter() - start
+
+    reports = []
+    for shard, output in enumerate(outputs):
+        if os.path.exists(output):
+            with open(output) as f:
+                reports.append(json.load(f))
+        else:
+            print(f'shard {shard} wrote no report, see shard_{shard}.log')
+
+    sequences = sum(report['sequences'] for report in reports)
+    failures = [failure for report in reports for failure in report['failures']]
+    print(f'{sequences} of {args.sequences} sequences in {elapsed:.0f}s ({60 * sequences / elapsed:.0f} sequences/min), {len(failures)} failures')
+    printFailures(failures)
+    if failures:
+        ids = ','.join(str(failure['sequence_id']) for failure in failures)
+        print(f'Replay with VAULT_FUZZ_SEED={args.seed} VAULT_FUZZ_OWNERS={args.owners} VAULT_FUZZ_LENGTH={args.length} '
+            f'VAULT_FUZZ_SEQUENCE_IDS={ids} brownie test {args.test_path}')
+    if failures or len(reports) < len(outputs):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""Python mirror of the AnyToken vault accounting.
+
+VaultModel follows AnyTokenVaultOperations, AnyTokenVaultManager and AnyTokenActivePool
+step by step with the same integer arithmetic, the same order of checks and the same revert
+reasons, so it can stand in for the contracts in fast sweeps and act as the reference model
+when checking them. Every check of an operation runs before any state is written, so an
+operation raising ModelRevert leaves the model untouched, like a reverted transaction.
+
+vault_fuzzer.py checks the model and the contracts against each other step by step, and
+bridge_simulator.py --verify-every K mirrors the vault deposits of a bridge run in it.
+"""
+
+import numpy as np
+
+DECIMAL_PRECISION = 10**18
+MAX_UINT = 2**256 - 1
+
+# Vault status, as in AnyTokenVaultManager.Status
+NON_EXISTENT = 0
+ACTIVE = 1
+CLOSED_BY_OWNER = 2
+
+
+class ModelRevert(Exception):
+    pass
+
+
+class Vault:
+    __slots__ = ('debt', 'coll', 'status', 'arrayIndex')
+
+    def __init__(self):
+        self.debt = 0
+        self.coll = 0
+        self.status = NON_EXISTENT
+        self.arrayIndex = 0
+
+
+def computeCR(coll, debt, price, coll_decimal_diff):
+    if debt > 0:
+        return coll * coll_decimal_diff * price // debt
+    return MAX_UINT
+
+
+def _require(condition, reason):
+    if not condition:
+        raise ModelRevert(reason)
+
+
+class VaultModel:
+    def __init__(self, coll_decimal_diff, collateral_ratio, debt_ceiling, min_net_debt, mscr=None, borrowing_rate=0):
+        self.collDecimalDiff = coll_decimal_diff
+        self.collateralRatio = collateral_ratio
+        self.debtCeiling = debt_ceiling
+        self.debtCeilingPlus = 0
+        self.minNetDebt = min_net_debt
+        self.mscr = collateral_ratio if mscr is None else mscr
+        self.borrowingRate = borrowing_rate
+
+        # AnyTokenVaultManager
+        self.Vaults = {}
+        self.VaultOwners = []
+        # AnyTokenActivePool
+        self.AnyToken = 0
+        self.LUSDDebt = 0
+        # Token balances of the accounts, the VaultOperations contract and the fee treasury
+        self.collBalances = {}
+        self.lusdBalances = {}
+
+    # Reads the constants of a deployed AnyTokenVaultManager (LiquityBase constants are public)
+    @classmethod
+    def fromContract(cls, vault_manager, coll_decimal_diff):
+        model = cls(
+            coll_decimal_diff,
+            vault_manager.ANYTOKEN_COLLATERAL_RARIO(),
+            vault_manager.ANYTOKEN_DEBT_CEILING(),
+            vault_manager.MIN_SWAP_NET_DEBT(),
+            vault_manager.MSCR(),
+        )
+        model.debtCeilingPlus = vault_manager.debtCeilingPlus()
+        return model
+
+    # --- AnyTokenVaultManager getters ---
+
+    def vault(self, borrower):
+        return self.Vaults.setdefault(borrower, Vault())
+
+    def getVaultOwnersCount(self):
+        return len(self.VaultOwners)
+
+    def getEntireDebtAndColl(self, borrower):
+        vault = self.vault(borrower)
+        return vault.debt, vault.coll
+
+    def getTCR(self, price):
+        return computeCR(self.AnyToken, self.LUSDDebt, price, self.collDecimalDiff)
+
+    def getBorrowingFee(self, lusd_debt):
+        return self.borrowingRate * lusd_debt // DECIMAL_PRECISION
+
+    def getDebtCeiling(self):
+        return self.debtCeiling + self.debtCeilingPlus
+
+    def getAnyTokenAmount(self, lusd_debt):
+        return lusd_debt * self.collateralRatio // DECIMAL_PRECISION // self.collDecimalDiff
+
+    # Debt and coll of every active vault in VaultOwners order, for vectorized queries
+    def debts(self):
+        return np.array([float(self.Vaults[owner].debt) for owner in self.VaultOwners])
+
+    def colls(self):
+        return np.array([float(self.Vaults[owner].coll) for owner in self.VaultOwners])
+
+    # --- Token helpers ---
+
+    def mintColl(self, account, amount):
+        self.collBalances[account] = self.collBalances.get(account, 0) + amount
+
+    def _requireCollBalance(self, account, amount, reason):
+        _require(self.collBalances.get(account, 0) >= amount, reason)
+
+    def _transferColl(self, sender, recipient, amount):
+        self.collBalances[sender] -= amount
+        self.collBalances[recipient] = self.collBalances.get(recipient, 0) + amount
+
+    def _mintLUSD(self, account, amount):
+        self.lusdBalances[account] = self.lusdBalances.get(account, 0) + amount
+
+    def _burnLUSD(self, account, amount):
+        _require(self.lusdBalances.get(account, 0) >= amount, "ERC20: burn amount exceeds balance")
+        self.lusdBalances[account] -= amount
+
+    def _sub(self, a, b):
+        _require(b <= a, "SafeMath: subtraction overflow")
+        return a - b
+
+    # --- AnyTokenVaultOperations ---
+
+    def openVault(self, sender, lusd_amount):
+        lusd_amount = lusd_amount // self.collDecimalDiff * self.collDecimalDiff
+        coll_amount = self.getAnyTokenAmount(lusd_amount)
+        self._requireCollBalance(sender, coll_amount, "AnyTokenVaultOperations: Collateral transfer failed on openVault")
+
+        vault = self.vault(sender)
+        _require(vault.status != ACTIVE, "AnyTokenVaultOperations: Vault is active")
+
+        fee = self.getBorrowingFee(lusd_amount)
+        net_debt = lusd_amount + fee
+        _require(net_debt >= self.minNetDebt, "AnyTokenVaultOperations: Vault's net debt must be greater than minimum")
+        self._requireDebtBelowCeiling(net_debt)
+
+        self._transferColl(sender, 'vaultOperations', coll_amount)
+        self._mintLUSD('borrowingFeeTreasury', fee)
+        vault.status = ACTIVE
+        vault.coll += coll_amount
+        vault.debt += net_debt
+        self.VaultOwners.append(sender)
+        vault.arrayIndex = len(self.VaultOwners) - 1
+
+        self._activePoolAddColl(coll_amount)
+        self.LUSDDebt += net_debt
+        self._mintLUSD(sender, lusd_amount)
+
+    def addColl(self, sender, coll_amount):
+        self._requireCollBalance(sender, coll_amount, "AnyTokenVaultOperations: Collateral transfer failed on adjustVault")
+        self._adjustVault(sender, coll_amount * self.collDecimalDiff // self.collateralRatio, True, coll_amount)
+
+    def withdrawColl(self, sender, coll_amount):
+        self._adjustVault(sender, coll_amount, False)
+
+    def withdrawLUSD(self, sender, lusd_amount):
+        coll_in = self.getAnyTokenAmount(lusd_amount)
+        self._requireCollBalance(sender, coll_in, "AnyTokenVaultOperations: Collateral transfer failed on adjustVault")
+        self._adjustVault(sender, lusd_amount, True, coll_in)
+
+    def repayLUSD(self, sender, lusd_amount):
+        self._adjustVault(sender, lusd_amount, False)
+
+    def adjustVault(self, sender, lusd_change, is_debt_increase):
+        coll_in = 0
+        if is_debt_increase:
+            coll_in = self.getAnyTokenAmount(lusd_change)
+            self._requireCollBalance(sender, coll_in, "AnyTokenVaultOperations: Collateral transfer failed on adjustVault")
+        self._adjustVault(sender, lusd_change, is_debt_increase, coll_in)
+
+    # coll_in is what the caller already pulled from the borrower before calling _adjustVault
+    def _adjustVault(self, borrower, lusd_change, is_debt_increase, coll_in=0):
+        _require(lusd_change > 0, "AnyTokenVaultOperations: Debt increase requires non-zero debtChange")
+
+        if is_debt_increase:
+            coll_change = self.getAnyTokenAmount(lusd_change)
+        else:
+            coll_change = lusd_change // self.collDecimalDiff
+
+        vault = self.vault(borrower)
+        _require(vault.status == ACTIVE, "AnyTokenVaultOperations: Vault does not exist or is closed")
+
+        fee = 0
+        net_debt_change = lusd_change
+        if is_debt_increase:
+            fee = self.getBorrowingFee(lusd_change)
+            net_debt_change += fee
+            self._requireDebtBelowCeiling(net_debt_change)
+
+        debt, coll = vault.debt, vault.coll
+        if not is_debt_increase:
+            # assert() in the contract
+            _require(coll_change <= coll, "invalid opcode")
+
+        if is_debt_increase:
+            new_coll, new_debt = coll + coll_change, debt + net_debt_change
+        else:
+            new_coll, new_debt = self._sub(coll, coll_change), self._sub(debt, net_debt_change)
+
+        new_ICR = computeCR(new_coll, new_debt, DECIMAL_PRECISION, self.collDecimalDiff)
+        _require((new_coll == 0 and new_debt == 0) or new_ICR == self.mscr,
+            "AnyTokenVaultOperations: An operation that would result in ICR != MSCR is not permitted")
+
+        if is_debt_increase:
+            total_coll, total_debt = self.AnyToken + coll_change, self.LUSDDebt + net_debt_change
+        else:
+            total_coll, total_debt = self._sub(self.AnyToken, coll_change), self._sub(self.LUSDDebt, net_debt_change)
+        new_TCR = computeCR(total_coll, total_debt, DECIMAL_PRECISION, self.collDecimalDiff)
+        _require((total_coll == 0 and total_debt == 0) or new_TCR == self.mscr,
+            "AnyTokenVaultOperations: An operation that would result in TCR != MSCR is not permitted")
+
+        if not is_debt_increase:
+            _require(net_debt_change <= debt, "AnyTokenVaultOperations: Amount repaid must not be larger than the Vault's debt")
+            _require(debt - net_debt_change >= self.minNetDebt, "AnyTokenVaultOperations: Vault's net debt must be greater than minimum")
+            _require(self.lusdBalances.get(borrower, 0) >= net_debt_change, "AnyTokenVaultOperations: Caller doesnt have enough LUSD to make repayment")
+        else:
+            # AnyTokenActivePool.depositColl pulls coll_change from what VaultOperations holds
+            _require(self.collBalances.get('vaultOperations', 0) + coll_in >= coll_change, "ERC20: transfer amount exceeds balance")
+
+        self._transferColl(borrower, 'vaultOperations', coll_in)
+        self._mintLUSD('borrowingFeeTreasury', fee)
+        vault.coll, vault.debt = new_coll, new_debt
+
+        if is_debt_increase:
+            self.LUSDDebt += net_debt_change
+            self._mintLUSD(borrower, lusd_change)
+            self._activePoolAddColl(coll_change)
+        else:
+            self.LUSDDebt = self._sub(self.LUSDDebt, lusd_change)
+            self._burnLUSD(borrower, lusd_change)
+            self._activePoolSendColl(borrower, coll_change)
+
+    def closeVault(self, sender):
+        vault = self.vault(sender)
+        _require(vault.status == ACTIVE, "AnyTokenVaultOperations: Vault does not exist or is closed")
+
+        coll, debt = vault.coll, vault.debt
+        _require(self.lusdBalances.get(sender, 0) >= debt, "AnyTokenVaultOperations: Caller doesnt have enough LUSD to make repayment")
+
+        total_coll, total_debt = self._sub(self.AnyToken, coll), self._sub(self.LUSDDebt, debt)
+        new_TCR = computeCR(total_coll, total_debt, DECIMAL_PRECISION, self.collDecimalDiff)
+        _require((total_coll == 0 and total_debt == 0) or new_TCR == self.mscr,
+            "AnyTokenVaultOperations: An operation that would result in TCR != MSCR is not permitted")
+
+        # AnyTokenVaultManager.closeVault
+        _require(len(self.VaultOwners) > 1, "AnyTokenVaultManager: Only one vault in the system")
+        vault.status = CLOSED_BY_OWNER
+        vault.coll = 0
+        vault.debt = 0
+        self._removeVaultOwner(sender)
+
+        self.LUSDDebt = self._sub(self.LUSDDebt, debt)
+        self._burnLUSD(sender, debt)
+        self._activePoolSendColl(sender, coll)
+
+    # --- Internal helpers ---
+
+    def _requireDebtBelowCeiling(self, net_debt):
+        _require(net_debt + self.LUSDDebt <= self.getDebtCeiling(),
+            "AnyTokenVaultOperations: Vault's net debt must be less than debt ceiling")
+
+    def _activePoolAddColl(self, amount):
+        self._transferColl('vaultOperations', 'activePool', amount)
+        self.AnyToken += amount
+
+    def _activePoolSendColl(self, account, amount):
+        self.AnyToken -= amount
+        self._transferColl('activePool', account, amount)
+
+    # Swap-and-pop, as in AnyTokenVaultManager._removeVaultOwner
+    def _removeVaultOwner(self, borrower):
+        index = self.Vaults[borrower].arrayIndex
+        idx_last = len(self.VaultOwners) - 1
+        assert index <= idx_last
+
+        address_to_move = self.VaultOwners[idx_last]
+        self.VaultOwners[index] = address_to_move
+        self.Vaults[address_to_move].arrayIndex = index
+        self.VaultOwners.pop()
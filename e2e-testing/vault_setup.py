@@ -0,0 +1,68 @@
+"""Deployment and funding of the AnyToken vault stack.
+
+Shared by the vault benchmark and the vault fuzzer: setupVaultContracts() deploys and wires
+AnyTokenVaultManager, AnyTokenVaultOperations and AnyTokenActivePool around a fresh LUSDToken
+and an ERC20Mock anyToken, and fundVaultOwners() hands out anyToken in BatchTransfer batches,
+minting the same amounts in the vault_model.VaultModel.
+"""
+
+from brownie import accounts, LUSDToken, ERC20Mock, AnyTokenVaultManager, AnyTokenVaultOperations, AnyTokenActivePool, BatchTransfer
+
+FUNDING_BATCH_SIZE = 300
+ANYTOKEN_SUPPLY = 10**40
+
+
+class Contracts: pass
+
+
+def setupVaultContracts():
+    contracts = Contracts()
+    contracts.lusdToken = LUSDToken.deploy({ 'from': accounts[0] })
+    contracts.anyToken = ERC20Mock.deploy("AnyToken", "ANY", 18, accounts[0], ANYTOKEN_SUPPLY, { 'from': accounts[0] })
+    contracts.vaultManager = AnyTokenVaultManager.deploy({ 'from': accounts[0] })
+    contracts.vaultOperations = AnyTokenVaultOperations.deploy({ 'from': accounts[0] })
+    contracts.activePool = AnyTokenActivePool.deploy({ 'from': accounts[0] })
+    contracts.batchTransfer = BatchTransfer.deploy({ 'from': accounts[0] })
+
+    contracts.vaultManager.setAddresses(
+        contracts.vaultOperations.address,
+        contracts.activePool.address,
+        contracts.lusdToken.address,
+        contracts.anyToken.address,
+        1, # _collDecimalDiff
+        { 'from': accounts[0] }
+    )
+    contracts.vaultOperations.setAddresses(
+        contracts.vaultManager.address,
+        contracts.activePool.address,
+        contracts.lusdToken.address,
+        contracts.anyToken.address,
+        1, # _collDecimalDiff
+        { 'from': accounts[0] }
+    )
+    contracts.activePool.setAddresses(
+        contracts.vaultOperations.address,
+        contracts.vaultManager.address,
+        contracts.anyToken.address,
+        { 'from': accounts[0] }
+    )
+    contracts.vaultOperations.setBorrowingFeeTreasury(accounts[0], { 'from': accounts[0] })
+
+    # the vault contracts mint and burn LUSD like a collateral stack
+    contracts.lusdToken.unlockFunction(0, { 'from': accounts[0] })
+    contracts.lusdToken.addAddressesForColl(
+        contracts.vaultManager.address,
+        contracts.activePool.address,
+        contracts.vaultOperations.address,
+        { 'from': accounts[0] }
+    )
+
+    return contracts
+
+
+def fundVaultOwners(contracts, model, owners, amount):
+    contracts.anyToken.approve(contracts.batchTransfer.address, amount * len(owners), { 'from': accounts[0] })
+    for start in range(0, len(owners), FUNDING_BATCH_SIZE):
+        contracts.batchTransfer.batchTransfer([contracts.anyToken], owners[start:start + FUNDING_BATCH_SIZE], amount, { 'from': accounts[0] })
+    for owner in owners:
+        model.mintColl(str(owner), amount)